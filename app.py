@@ -1,14 +1,30 @@
 import os
 import logging
-from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from datetime import timezone
+from flask import (Flask, render_template, request, redirect, url_for, flash, session, jsonify, abort,
+                   has_request_context)
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from werkzeug.security import generate_password_hash, check_password_hash
+from itsdangerous import URLSafeSerializer, BadSignature
 from flask_wtf.csrf import CSRFProtect
+from http_cache import conditional
+from app_queries import get_upcoming_sessions, statements
+from ical import CalendarFeed, FeedCache, assignment_event, schedule_event
+from dbpool import ConnectionPool, pooled
+from due_dates import clock_bucket, to_utc, utcnow
+from instrumentation import init_flask, instrumented_connection_factory
+from logconfig import configure_logging
+import replicas
+import student_search
+import tenants
+from prepared import PreparedExecutor
+from repository import APP_SCHEMA, Repository
+from sessions import init_sessions
+from timetable import Timetable, describe, make_session
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
@@ -19,27 +35,88 @@ app.config['WTF_CSRF_ENABLED'] = True
 csrf = CSRFProtect()
 csrf.init_app(app)
 
+# With REDIS_URL only a signed session id goes in the cookie and data is
+# kept in Redis; without it, signed cookie sessions (see sessions.py)
+init_sessions(app, os.environ.get('REDIS_URL'))
+init_flask(app)
+replicas.init_flask(app)
+InstrumentedConnection = pooled(instrumented_connection_factory())
+
+feed_cache = FeedCache()
+feed_signer = URLSafeSerializer(app.secret_key, salt='calendar-feed')
+
+def _connect(host=None, port=None):
+    conn = psycopg2.connect(
+        dbname=os.environ.get('PGDATABASE'),
+        user=os.environ.get('PGUSER'),
+        password=os.environ.get('PGPASSWORD'),
+        host=host or os.environ.get('PGHOST'),
+        port=port or os.environ.get('PGPORT'),
+        connection_factory=InstrumentedConnection
+    )
+    conn.autocommit = True
+    return conn
+
+# conn.close() returns connections here instead of disconnecting
+db_pool = ConnectionPool(_connect, max_idle=int(os.environ.get('DB_POOL_MAX_IDLE', 10)))
+replica_pool = None
+if replicas.replica_configured():
+    replica_pool = ConnectionPool(lambda: _connect(*replicas.replica_settings()),
+                                  max_idle=int(os.environ.get('DB_POOL_MAX_IDLE', 10)))
+
 # Database connection function
-def get_db_connection():
+def get_db_connection(read_only=False):
+    """Connection from the primary pool, or from the replica pool for
+    ``read_only`` callers when the request allows it (see replicas.py)."""
+    pool = db_pool
+    if read_only and replica_pool is not None and replicas.reads_from_replica():
+        pool = replica_pool
     try:
-        conn = psycopg2.connect(
-            dbname=os.environ.get('PGDATABASE'),
-            user=os.environ.get('PGUSER'),
-            password=os.environ.get('PGPASSWORD'),
-            host=os.environ.get('PGHOST'),
-            port=os.environ.get('PGPORT')
-        )
-        conn.autocommit = True
-        return conn
+        return pool.get()
     except Exception as e:
-        logger.error(f"Database connection error: {str(e)}")
+        logger.error("Database connection error: %s", e)
         raise
 
+def repository(conn, school_id=None):
+    """Shared queries, scoped to the signed-in user's school in a request."""
+    if school_id is None and has_request_context():
+        school_id = session.get('school_id')
+    return Repository(PreparedExecutor(conn, statements), APP_SCHEMA, school_id=school_id)
+
+# Bump whenever the DDL in init_db changes
+SCHEMA_VERSION = 8
+
+def schema_is_current(cur):
+    try:
+        cur.execute("SELECT version FROM schema_version")
+    except psycopg2.errors.UndefinedTable:
+        return False
+    row = cur.fetchone()
+    return row is not None and row[0] == SCHEMA_VERSION
+
 # Initialize database tables
 def init_db():
     conn = get_db_connection()
     cur = conn.cursor()
     try:
+        if schema_is_current(cur):
+            logger.debug("Schema version %s is current, skipping DDL", SCHEMA_VERSION)
+            return
+
+        # Create schools table; everything else belongs to a school (see tenants.py)
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS schools (
+                id SERIAL PRIMARY KEY,
+                slug VARCHAR(50) UNIQUE NOT NULL,
+                name VARCHAR(100) NOT NULL
+            )
+        ''')
+        cur.execute("INSERT INTO schools (id, slug, name) VALUES (%s, 'default', 'Default school')"
+                    " ON CONFLICT (id) DO NOTHING", (tenants.DEFAULT_SCHOOL,))
+        cur.execute("SELECT setval('schools_id_seq', (SELECT MAX(id) FROM schools))")
+        # Weekly schedules are wall-clock times in the school's zone
+        cur.execute("ALTER TABLE schools ADD COLUMN IF NOT EXISTS timezone VARCHAR(64) NOT NULL DEFAULT 'UTC'")
+
         # Create users table
         cur.execute('''
             CREATE TABLE IF NOT EXISTS users (
@@ -58,20 +135,28 @@ def init_db():
                 name VARCHAR(100) NOT NULL,
                 description TEXT,
                 teacher_id INTEGER REFERENCES users(id),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc')
             )
         ''')
         
-        # Create class_students table
-        cur.execute('''
+        for table in ('users', 'classes'):
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS school_id INTEGER NOT NULL "
+                        f"DEFAULT {tenants.DEFAULT_SCHOOL} REFERENCES schools(id)")
+
+        # Create class_students table, partitioned by school
+        tenants.partition_table(cur, 'class_students', '''
             CREATE TABLE IF NOT EXISTS class_students (
-                id SERIAL PRIMARY KEY,
+                id INTEGER NOT NULL DEFAULT nextval('class_students_id_seq'),
+                school_id INTEGER NOT NULL REFERENCES schools(id),
                 class_id INTEGER REFERENCES classes(id),
                 student_id INTEGER REFERENCES users(id),
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(class_id, student_id)
-            )
-        ''')
+                PRIMARY KEY (school_id, id),
+                UNIQUE (school_id, class_id, student_id)
+            ) PARTITION BY LIST (school_id)
+        ''', ('id', 'class_id', 'student_id', 'created_at'),
+            f"COALESCE((SELECT c.school_id FROM classes c WHERE c.id = l.class_id), {tenants.DEFAULT_SCHOOL})")
 
         # Create schedules table
         cur.execute('''
@@ -81,134 +166,235 @@ def init_db():
                 day_of_week VARCHAR(10) NOT NULL,
                 start_time TIME NOT NULL,
                 end_time TIME NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                room VARCHAR(50),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc')
             )
         ''')
+        cur.execute("ALTER TABLE schedules ADD COLUMN IF NOT EXISTS room VARCHAR(50)")
 
-        # Create assignments table
-        cur.execute('''
+        # Columns used as calendar feed validators. Like due dates they are
+        # naive UTC, not CURRENT_TIMESTAMP's session-local time
+        for table in ('classes', 'schedules'):
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS "
+                        f"updated_at TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc')")
+            cur.execute(f"ALTER TABLE {table} ALTER COLUMN updated_at SET DEFAULT (now() AT TIME ZONE 'utc')")
+
+        # Older plain tables predate updated_at; it is copied across below
+        cur.execute("ALTER TABLE IF EXISTS assignments ADD COLUMN IF NOT EXISTS "
+                    "updated_at TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc')")
+
+        # Create assignments table, partitioned by school
+        tenants.partition_table(cur, 'assignments', '''
             CREATE TABLE IF NOT EXISTS assignments (
-                id SERIAL PRIMARY KEY,
+                id INTEGER NOT NULL DEFAULT nextval('assignments_id_seq'),
+                school_id INTEGER NOT NULL REFERENCES schools(id),
                 class_id INTEGER REFERENCES classes(id),
                 title VARCHAR(200) NOT NULL,
                 description TEXT,
                 due_date TIMESTAMP NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc'),
+                PRIMARY KEY (school_id, id)
+            ) PARTITION BY LIST (school_id)
+        ''', ('id', 'class_id', 'title', 'description', 'due_date', 'created_at', 'updated_at'),
+            f"COALESCE((SELECT c.school_id FROM classes c WHERE c.id = l.class_id), {tenants.DEFAULT_SCHOOL})")
 
-        # Create student_assignments table
-        cur.execute('''
+        cur.execute("ALTER TABLE assignments ALTER COLUMN updated_at SET DEFAULT (now() AT TIME ZONE 'utc')")
+
+        # Create student_assignments table, partitioned by school
+        tenants.partition_table(cur, 'student_assignments', '''
             CREATE TABLE IF NOT EXISTS student_assignments (
-                id SERIAL PRIMARY KEY,
-                assignment_id INTEGER REFERENCES assignments(id),
+                id INTEGER NOT NULL DEFAULT nextval('student_assignments_id_seq'),
+                school_id INTEGER NOT NULL REFERENCES schools(id),
+                assignment_id INTEGER,
                 student_id INTEGER REFERENCES users(id),
                 submission_text TEXT,
                 submitted_at TIMESTAMP,
                 grade NUMERIC,
                 feedback TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(assignment_id, student_id)
-            )
-        ''')
+                PRIMARY KEY (school_id, id),
+                UNIQUE (school_id, assignment_id, student_id),
+                FOREIGN KEY (school_id, assignment_id) REFERENCES assignments (school_id, id)
+            ) PARTITION BY LIST (school_id)
+        ''', ('id', 'assignment_id', 'student_id', 'submission_text', 'submitted_at', 'grade',
+              'feedback', 'created_at'),
+            f"COALESCE((SELECT a.school_id FROM assignments a WHERE a.id = l.assignment_id), {tenants.DEFAULT_SCHOOL})")
+
+        # Indexes for the shared repository queries; these supersede the
+        # single-column ones created by earlier versions
+        for statement in Repository(None, APP_SCHEMA).index_statements():
+            cur.execute(statement)
+        # Results of the nightly at_risk job
+        for statement in Repository(None, APP_SCHEMA).risk_table_statements():
+            cur.execute(statement)
+        cur.execute("DROP INDEX IF EXISTS idx_schedules_class")
+        cur.execute("DROP INDEX IF EXISTS idx_assignments_class")
+
+        cur.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+        cur.execute("DELETE FROM schema_version")
+        cur.execute("INSERT INTO schema_version (version) VALUES (%s)", (SCHEMA_VERSION,))
         
         logger.info("Database tables created successfully")
     except Exception as e:
-        logger.error(f"Database initialization failed: {e}")
+        logger.error("Database initialization failed: %s", e)
         raise
     finally:
         cur.close()
         conn.close()
 
+def load_timetable(cur, school_id):
+    """Load the whole school's weekly timetable for conflict checks."""
+    cur.execute("""
+        SELECT s.id, s.class_id, s.day_of_week, s.start_time, s.end_time, s.room,
+               c.name as class_name, c.teacher_id
+        FROM schedules s
+        JOIN classes c ON s.class_id = c.id
+        WHERE c.school_id = %s
+    """, (school_id,))
+    schedule_rows = cur.fetchall()
+    cur.execute("SELECT class_id, student_id FROM class_students WHERE school_id = %s", (school_id,))
+    return Timetable.from_rows(schedule_rows, cur.fetchall())
+
+def build_calendar_feed(cur, user_id, host, previous=None):
+    """Build a user's calendar feed, re-rendering only rows changed since ``previous``."""
+    cur.execute("SELECT school_id FROM users WHERE id = %s", (user_id,))
+    user = cur.fetchone()
+    school_id = user['school_id'] if user else tenants.DEFAULT_SCHOOL
+    cur.execute("""
+        SELECT id FROM classes WHERE teacher_id = %s
+        UNION
+        SELECT class_id FROM class_students WHERE school_id = %s AND student_id = %s
+    """, (user_id, school_id, user_id))
+    class_ids = [row['id'] for row in cur.fetchall()]
+    versions = feed_cache.versions_for(user_id, class_ids)
+    if not class_ids:
+        return CalendarFeed(user_id, class_ids, versions, {}, None)
+
+    # Validators first: (id, effective updated_at) per row, no payload
+    cur.execute("""
+        SELECT 'schedule' as kind, s.id, GREATEST(s.updated_at, c.updated_at) as updated_at
+        FROM schedules s JOIN classes c ON s.class_id = c.id
+        WHERE s.class_id = ANY(%s)
+        UNION ALL
+        SELECT 'assignment', a.id, GREATEST(a.updated_at, c.updated_at)
+        FROM assignments a JOIN classes c ON a.class_id = c.id
+        WHERE a.school_id = %s AND a.class_id = ANY(%s)
+    """, (class_ids, school_id, class_ids))
+    stamps = {(row['kind'], row['id']): row['updated_at'] for row in cur.fetchall()}
+
+    previous_events = previous.events if previous is not None else {}
+    events = {}
+    stale = {'schedule': [], 'assignment': []}
+    for key, updated_at in stamps.items():
+        cached = previous_events.get(key)
+        if cached is not None and cached[0] == updated_at:
+            events[key] = cached
+        else:
+            stale[key[0]].append(key[1])
+
+    if stale['schedule']:
+        cur.execute("""
+            SELECT s.*, c.name as class_name,
+                   GREATEST(s.updated_at, c.updated_at) as updated_at
+            FROM schedules s JOIN classes c ON s.class_id = c.id
+            WHERE s.id = ANY(%s)
+        """, (stale['schedule'],))
+        for row in cur.fetchall():
+            events[('schedule', row['id'])] = (row['updated_at'], schedule_event(row, host))
+    if stale['assignment']:
+        cur.execute("""
+            SELECT a.*, c.name as class_name,
+                   GREATEST(a.updated_at, c.updated_at) as updated_at
+            FROM assignments a JOIN classes c ON a.class_id = c.id
+            WHERE a.school_id = %s AND a.id = ANY(%s)
+        """, (school_id, stale['assignment']))
+        for row in cur.fetchall():
+            events[('assignment', row['id'])] = (row['updated_at'], assignment_event(row, host))
+
+    logger.debug("Calendar feed for user %s: %d events, %d re-rendered",
+                 user_id, len(events), len(stale['schedule']) + len(stale['assignment']))
+    last_modified = max((stamp for stamp, _ in events.values() if stamp), default=None)
+    return CalendarFeed(user_id, class_ids, versions, events, last_modified)
+
+@app.before_request
+def load_school():
+    """Fill in ``school_id`` and the school's ``timezone`` for sessions
+    started before they were stored."""
+    if 'user_id' not in session or ('school_id' in session and 'timezone' in session):
+        return
+    conn = get_db_connection(read_only=True)
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        statements.execute(cur, 'school_of_user', {'user_id': session['user_id']})
+        row = cur.fetchone()
+    finally:
+        cur.close()
+        conn.close()
+    session['school_id'] = row['school_id'] if row else tenants.DEFAULT_SCHOOL
+    session['timezone'] = row['timezone'] if row else 'UTC'
+
+def user_data_version():
+    """Cheap validator for pages built from the current user's classes."""
+    if 'user_id' not in session:
+        return None
+    conn = get_db_connection(read_only=True)
+    try:
+        return repository(conn).data_version(session['user_id'])
+    finally:
+        conn.close()
+
+def dashboard_version():
+    """``user_data_version`` plus a 15-minute clock bucket for the sessions widget."""
+    version = user_data_version()
+    if version is None:
+        return None
+    parts, last_modified = version
+    return (parts, *clock_bucket(utcnow())), last_modified
+
 @app.route('/')
+@conditional(dashboard_version)
 def index():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    conn = get_db_connection(read_only=True)
     
     try:
-        # Initialize empty lists
-        classes = []
-        assignments = []
-        schedules = []
-        completed_assignments = 0
-        
-        # Get classes based on role
-        if session['role'] == 'teacher':
-            cur.execute("""
-                SELECT * FROM classes WHERE teacher_id = %s
-                ORDER BY created_at DESC
-            """, (session['user_id'],))
-            classes = cur.fetchall() or []
-            
-            if classes:
-                # Get assignments for teacher's classes
-                cur.execute("""
-                    SELECT a.*, c.name as class_name
-                    FROM assignments a
-                    JOIN classes c ON a.class_id = c.id
-                    WHERE c.teacher_id = %s
-                    ORDER BY a.due_date ASC
-                    LIMIT 5
-                """, (session['user_id'],))
-                assignments = cur.fetchall() or []
-        else:
-            # Get student's classes
-            cur.execute("""
-                SELECT c.* FROM classes c
-                JOIN class_students cs ON c.id = cs.class_id
-                WHERE cs.student_id = %s
-                ORDER BY c.created_at DESC
-            """, (session['user_id'],))
-            classes = cur.fetchall() or []
-            
-            if classes:
-                # Get assignments for student's classes
-                cur.execute("""
-                    SELECT a.*, c.name as class_name
-                    FROM assignments a
-                    JOIN classes c ON a.class_id = c.id
-                    JOIN class_students cs ON c.id = cs.class_id
-                    WHERE cs.student_id = %s
-                    ORDER BY a.due_date ASC
-                    LIMIT 5
-                """, (session['user_id'],))
-                assignments = cur.fetchall() or []
-        
-        # Get schedules if there are classes
+        repo = repository(conn)
+        classes = repo.classes_for_user(session['user_id'], session['role'])
+        assignments = schedules = at_risk_students = []
         if classes:
-            class_ids = [c['id'] for c in classes]
-            placeholders = ','.join(['%s'] * len(class_ids))
-            cur.execute(f"""
-                SELECT s.*, c.name as class_name
-                FROM schedules s
-                JOIN classes c ON s.class_id = c.id
-                WHERE s.class_id IN ({placeholders})
-                ORDER BY s.day_of_week, s.start_time
-            """, tuple(class_ids))
-            schedules = cur.fetchall() or []
+            assignments = repo.assignments_for_user(session['user_id'], session['role'], limit=5)
+            schedules = repo.schedules_for_user(session['user_id'])
+            if session['role'] == 'teacher':
+                at_risk_students = repo.at_risk_students(session['user_id'])
+
+        now = utcnow()
+        # Schedules are wall-clock times in the school's zone, not UTC
+        upcoming_sessions = get_upcoming_sessions(schedules, now, session.get('timezone'))
             
-        logger.info(f"Retrieved data for user {session['user_id']}: "
-                   f"{len(classes)} classes, {len(assignments)} assignments, "
-                   f"{len(schedules)} schedules")
+        logger.debug("Retrieved data for user %s: %d classes, %d assignments, %d schedules",
+                     session['user_id'], len(classes), len(assignments), len(schedules))
             
         return render_template('dashboard/index.html', 
                              classes=classes,
                              assignments=assignments,
                              schedules=schedules,
-                             now=datetime.now())
+                             upcoming_sessions=upcoming_sessions,
+                             at_risk_students=at_risk_students,
+                             now=now)
     except Exception as e:
-        logger.error(f"Error in index route: {str(e)}")
+        logger.exception("Error in index route: %s", e)
         flash('An error occurred while loading the dashboard', 'error')
         return render_template('dashboard/index.html', 
                              classes=[],
                              assignments=[],
                              schedules=[],
-                             now=datetime.now())
+                             upcoming_sessions=[],
+                             now=utcnow())
     finally:
-        cur.close()
         conn.close()
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -224,19 +410,21 @@ def login():
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
         try:
-            cur.execute("SELECT * FROM users WHERE email = %s", (email,))
+            statements.execute(cur, 'user_by_email', {'email': email})
             user = cur.fetchone()
             
             if user and check_password_hash(user['password_hash'], password):
                 session['user_id'] = user['id']
                 session['username'] = user['username']
                 session['role'] = user['role']
+                session['school_id'] = user['school_id']
+                session['timezone'] = user['timezone']
                 flash('Welcome back!', 'success')
                 return redirect(url_for('index'))
                 
             flash('Invalid email or password', 'error')
         except Exception as e:
-            logger.error(f"Login error: {str(e)}")
+            logger.exception("Login error: %s", e)
             flash('An error occurred during login', 'error')
         finally:
             cur.close()
@@ -256,10 +444,12 @@ def register():
         cur = conn.cursor()
         
         try:
+            # Users join the school whose slug they give, or the default one
             cur.execute("""
-                INSERT INTO users (username, email, password_hash, role)
-                VALUES (%s, %s, %s, %s)
-            """, (username, email, generate_password_hash(password), role))
+                INSERT INTO users (username, email, password_hash, role, school_id)
+                VALUES (%s, %s, %s, %s, COALESCE((SELECT id FROM schools WHERE slug = %s), %s))
+            """, (username, email, generate_password_hash(password), role,
+                  request.form.get('school'), tenants.DEFAULT_SCHOOL))
             flash('Registration successful! Please login.', 'success')
             return redirect(url_for('login'))
         except psycopg2.errors.UniqueViolation:
@@ -277,39 +467,20 @@ def logout():
 
 # Class management routes
 @app.route('/classes')
+@conditional(user_data_version)
 def list_classes():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    conn = get_db_connection(read_only=True)
     
     try:
-        if session['role'] == 'teacher':
-            cur.execute("""
-                SELECT c.*, COUNT(cs.student_id) as student_count 
-                FROM classes c 
-                LEFT JOIN class_students cs ON c.id = cs.class_id 
-                WHERE c.teacher_id = %s 
-                GROUP BY c.id 
-                ORDER BY c.created_at DESC
-            """, (session['user_id'],))
-        else:
-            cur.execute("""
-                SELECT c.*, u.username as teacher_name 
-                FROM classes c
-                JOIN users u ON c.teacher_id = u.id
-                JOIN class_students cs ON c.id = cs.class_id
-                WHERE cs.student_id = %s
-                ORDER BY c.created_at DESC
-            """, (session['user_id'],))
-            
-        classes = cur.fetchall()
+        classes = repository(conn).classes_for_user(
+            session['user_id'], session['role'])
         return render_template('classes/list.html', 
                              classes=classes, 
                              is_teacher=(session['role'] == 'teacher'))
     finally:
-        cur.close()
         conn.close()
 
 @app.route('/classes/create', methods=['GET', 'POST'])
@@ -319,11 +490,11 @@ def create_class():
         return redirect(url_for('list_classes'))
     
     if request.method == 'POST':
-        logger.info("Received POST request to create class")
+        logger.debug("Received POST request to create class")
         name = request.form.get('name')
         description = request.form.get('description')
         
-        logger.debug(f"Form data received - Name: {name}, Description: {description}")
+        logger.debug("Form data received - Name: %s, Description: %s", name, description)
         
         if not name:
             logger.warning("Class name not provided")
@@ -336,29 +507,31 @@ def create_class():
             cur = conn.cursor()
             
             # Create the class
-            logger.info(f"Attempting to create class '{name}' for teacher {session['user_id']}")
+            logger.debug("Attempting to create class '%s' for teacher %s", name, session['user_id'])
             cur.execute("""
-                INSERT INTO classes (name, description, teacher_id)
-                VALUES (%s, %s, %s)
+                INSERT INTO classes (name, description, teacher_id, school_id)
+                VALUES (%s, %s, %s, %s)
                 RETURNING id
-            """, (name, description, session['user_id']))
+            """, (name, description, session['user_id'], session['school_id']))
             
             class_id = cur.fetchone()[0]
             conn.commit()
+            # The teacher's calendar feed now covers one more class
+            feed_cache.touch_user(session['user_id'])
             
-            logger.info(f"Successfully created class with ID {class_id} for teacher {session['user_id']}")
+            logger.info("Created class %s for teacher %s", class_id, session['user_id'])
             flash('Class created successfully', 'success')
             return redirect(url_for('list_classes'))
         except psycopg2.Error as e:
             if conn:
                 conn.rollback()
-            logger.error(f"Database error creating class: {str(e)}")
+            logger.error("Database error creating class: %s", e)
             flash('Error creating class. Please try again.', 'error')
             return render_template('classes/create.html')
         except Exception as e:
             if conn:
                 conn.rollback()
-            logger.error(f"Unexpected error creating class: {str(e)}")
+            logger.exception("Unexpected error creating class: %s", e)
             flash('An unexpected error occurred. Please try again.', 'error')
             return render_template('classes/create.html')
         finally:
@@ -377,10 +550,8 @@ def edit_class(class_id):
     cur = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
-        cur.execute("""
-            SELECT * FROM classes 
-            WHERE id = %s AND teacher_id = %s
-        """, (class_id, session['user_id']))
+        statements.execute(cur, 'class_for_teacher',
+                           {'class_id': class_id, 'teacher_id': session['user_id']})
         
         class_obj = cur.fetchone()
         if not class_obj:
@@ -397,11 +568,12 @@ def edit_class(class_id):
             
             cur.execute("""
                 UPDATE classes 
-                SET name = %s, description = %s
+                SET name = %s, description = %s, updated_at = (now() AT TIME ZONE 'utc')
                 WHERE id = %s AND teacher_id = %s
             """, (name, description, class_id, session['user_id']))
             
             conn.commit()
+            feed_cache.touch_class(class_id)
             flash('Class updated successfully', 'success')
             return redirect(url_for('list_classes'))
         
@@ -421,10 +593,8 @@ def manage_students(class_id):
     
     try:
         # Get class details
-        cur.execute("""
-            SELECT * FROM classes 
-            WHERE id = %s AND teacher_id = %s
-        """, (class_id, session['user_id']))
+        statements.execute(cur, 'class_for_teacher',
+                           {'class_id': class_id, 'teacher_id': session['user_id']})
         
         class_obj = cur.fetchone()
         if not class_obj:
@@ -432,11 +602,14 @@ def manage_students(class_id):
             return redirect(url_for('list_classes'))
         
         if request.method == 'POST':
-            student_email = request.form.get('student_email')
-            
-            # Find student by email
-            cur.execute("SELECT id FROM users WHERE email = %s AND role = 'student'", 
-                       (student_email,))
+            # The picker sends an id; an exact email still works without it
+            student_id = request.form.get('student_id', type=int)
+            if student_id:
+                cur.execute("SELECT id FROM users WHERE id = %s AND role = 'student' AND school_id = %s",
+                           (student_id, class_obj['school_id']))
+            else:
+                cur.execute("SELECT id FROM users WHERE email = %s AND role = 'student' AND school_id = %s",
+                           (request.form.get('student_email'), class_obj['school_id']))
             student = cur.fetchone()
             
             if not student:
@@ -444,10 +617,11 @@ def manage_students(class_id):
             else:
                 try:
                     cur.execute("""
-                        INSERT INTO class_students (class_id, student_id)
-                        VALUES (%s, %s)
-                    """, (class_id, student['id']))
+                        INSERT INTO class_students (school_id, class_id, student_id)
+                        VALUES (%s, %s, %s)
+                    """, (class_obj['school_id'], class_id, student['id']))
                     conn.commit()
+                    feed_cache.touch_user(student['id'])
                     flash('Student added to class', 'success')
                 except psycopg2.errors.UniqueViolation:
                     conn.rollback()
@@ -458,9 +632,9 @@ def manage_students(class_id):
             SELECT u.username, u.email, cs.created_at as enrolled_at
             FROM users u
             JOIN class_students cs ON u.id = cs.student_id
-            WHERE cs.class_id = %s
+            WHERE cs.school_id = %s AND cs.class_id = %s
             ORDER BY u.username
-        """, (class_id,))
+        """, (class_obj['school_id'], class_id))
         students = cur.fetchall()
         
         return render_template('classes/students.html', 
@@ -470,6 +644,25 @@ def manage_students(class_id):
         cur.close()
         conn.close()
 
+@app.route('/classes/<int:class_id>/students/search')
+def search_students(class_id):
+    if 'user_id' not in session or session['role'] != 'teacher':
+        return jsonify({'success': False, 'error': 'Not authorized'}), 403
+    conn = get_db_connection(read_only=True)
+    cur = conn.cursor()
+    try:
+        statements.execute(cur, 'class_for_teacher',
+                           {'class_id': class_id, 'teacher_id': session['user_id']})
+        if cur.fetchone() is None:
+            return jsonify({'success': False, 'error': 'Class not found'}), 404
+        results = student_search.search_students(
+            repository(conn), request.args.get('q', ''), class_id=class_id,
+            limit=request.args.get('limit', student_search.LIMIT, type=int))
+        return jsonify({'success': True, 'results': results})
+    finally:
+        cur.close()
+        conn.close()
+
 # Schedule management routes
 @app.route('/classes/<int:class_id>/schedule', methods=['GET', 'POST'])
 def manage_schedule(class_id):
@@ -485,10 +678,8 @@ def manage_schedule(class_id):
     
     try:
         # Get class details
-        cur.execute("""
-            SELECT * FROM classes 
-            WHERE id = %s AND teacher_id = %s
-        """, (class_id, session['user_id']))
+        statements.execute(cur, 'class_for_teacher',
+                           {'class_id': class_id, 'teacher_id': session['user_id']})
         class_obj = cur.fetchone()
         
         if not class_obj:
@@ -497,41 +688,40 @@ def manage_schedule(class_id):
         
         if form.validate_on_submit():
             try:
-                # Validate time format
-                cur.execute("""
-                    INSERT INTO schedules (class_id, day_of_week, start_time, end_time)
-                    VALUES (%s, %s, %s::time, %s::time)
-                """, (class_id, form.day.data, form.start_time.data, form.end_time.data))
-                conn.commit()
-                flash('Schedule added successfully', 'success')
-                return redirect(url_for('manage_schedule', class_id=class_id))
+                candidate = make_session(None, class_id, form.day.data,
+                                         form.start_time.data, form.end_time.data,
+                                         class_name=class_obj['name'],
+                                         teacher_id=class_obj['teacher_id'],
+                                         room=form.room.data)
+                conflicts = load_timetable(cur, class_obj['school_id']).conflicts(candidate)
+                if conflicts:
+                    for conflict in conflicts[:5]:
+                        flash(f"Conflicts with {conflict.second.class_name} "
+                              f"({describe(conflict.second)}) for {conflict.kind} "
+                              f"{conflict.resource}", 'error')
+                else:
+                    cur.execute("""
+                        INSERT INTO schedules (class_id, day_of_week, start_time, end_time, room)
+                        VALUES (%s, %s, %s::time, %s::time, %s)
+                    """, (class_id, form.day.data, form.start_time.data, form.end_time.data,
+                          form.room.data or None))
+                    conn.commit()
+                    feed_cache.touch_class(class_id)
+                    flash('Schedule added successfully', 'success')
+                    return redirect(url_for('manage_schedule', class_id=class_id))
+            except ValueError as e:
+                flash(f'Invalid schedule: {e}', 'error')
             except psycopg2.Error as e:
-                logger.error(f"Database error adding schedule: {str(e)}")
+                logger.error("Database error adding schedule: %s", e)
                 flash('Error adding schedule. Please check the time format.', 'error')
                 conn.rollback()
             except Exception as e:
-                logger.error(f"Unexpected error adding schedule: {str(e)}")
+                logger.exception("Unexpected error adding schedule: %s", e)
                 flash('An unexpected error occurred. Please try again.', 'error')
                 conn.rollback()
             
         # Get existing schedules
-        cur.execute("""
-            SELECT 
-                id,
-                day_of_week,
-                TO_CHAR(start_time, 'HH24:MI') as start_time,
-                TO_CHAR(end_time, 'HH24:MI') as end_time
-            FROM schedules 
-            WHERE class_id = %s 
-            ORDER BY CASE 
-                WHEN day_of_week = 'Monday' THEN 1
-                WHEN day_of_week = 'Tuesday' THEN 2
-                WHEN day_of_week = 'Wednesday' THEN 3
-                WHEN day_of_week = 'Thursday' THEN 4
-                WHEN day_of_week = 'Friday' THEN 5
-                ELSE 6
-            END, start_time
-        """, (class_id,))
+        statements.execute(cur, 'schedules_for_class', {'class_id': class_id})
         schedules = cur.fetchall()
         
         return render_template('classes/schedule.html', 
@@ -552,8 +742,9 @@ def manage_assignments(class_id):
     cur = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
-        # Get class details
-        cur.execute("SELECT * FROM classes WHERE id = %s", (class_id,))
+        # Get class details; classes of other schools are not found
+        cur.execute("SELECT * FROM classes WHERE id = %s AND school_id = %s",
+                    (class_id, session['school_id']))
         class_obj = cur.fetchone()
         
         if not class_obj:
@@ -564,42 +755,45 @@ def manage_assignments(class_id):
         if session['role'] != 'teacher' and class_obj['teacher_id'] != session['user_id']:
             cur.execute("""
                 SELECT 1 FROM class_students 
-                WHERE class_id = %s AND student_id = %s
-            """, (class_id, session['user_id']))
+                WHERE school_id = %s AND class_id = %s AND student_id = %s
+            """, (class_obj['school_id'], class_id, session['user_id']))
             if not cur.fetchone():
                 flash('Access denied', 'error')
                 return redirect(url_for('index'))
         
         if request.method == 'POST' and session['role'] == 'teacher':
+            # Only the class's own teacher adds assignments to it
+            if class_obj['teacher_id'] != session['user_id']:
+                flash('Access denied', 'error')
+                return redirect(url_for('index'))
             title = request.form['title']
             description = request.form['description']
-            due_date = request.form['due_date']
+            # Entered in the browser's zone (a hidden field); stored as UTC
+            try:
+                due_date = to_utc(request.form['due_date'], request.form.get('timezone'))
+            except ValueError:
+                flash('Invalid due date', 'error')
+                return redirect(url_for('manage_assignments', class_id=class_id))
             
             cur.execute("""
-                INSERT INTO assignments (class_id, title, description, due_date)
-                VALUES (%s, %s, %s, %s)
-            """, (class_id, title, description, due_date))
+                INSERT INTO assignments (school_id, class_id, title, description, due_date)
+                VALUES (%s, %s, %s, %s, %s)
+            """, (class_obj['school_id'], class_id, title, description, due_date))
+            feed_cache.touch_class(class_id)
             
             flash('Assignment created successfully', 'success')
         
         # Get assignments
-        cur.execute("""
-            SELECT a.*, 
-                   CASE WHEN sa.submitted_at IS NOT NULL 
-                        THEN true ELSE false END as submitted,
-                   sa.grade
-            FROM assignments a
-            LEFT JOIN student_assignments sa ON 
-                a.id = sa.assignment_id AND sa.student_id = %s
-            WHERE a.class_id = %s
-            ORDER BY a.due_date DESC
-        """, (session['user_id'], class_id))
+        statements.execute(cur, 'assignments_for_class',
+                           {'student_id': session['user_id'], 'class_id': class_id,
+                            'school_id': class_obj['school_id']})
         assignments = cur.fetchall()
         
         return render_template('classes/assignments.html',
                              class_obj=class_obj,
                              assignments=assignments,
-                             is_teacher=(session['role'] == 'teacher'))
+                             is_teacher=(session['role'] == 'teacher'),
+                             now=utcnow())
     finally:
         cur.close()
         conn.close()
@@ -619,8 +813,8 @@ def submit_assignment(assignment_id):
             SELECT a.*, c.name as class_name 
             FROM assignments a
             JOIN classes c ON a.class_id = c.id
-            WHERE a.id = %s
-        """, (assignment_id,))
+            WHERE a.school_id = %s AND a.id = %s
+        """, (session['school_id'], assignment_id))
         assignment = cur.fetchone()
         
         if not assignment:
@@ -632,12 +826,12 @@ def submit_assignment(assignment_id):
             
             cur.execute("""
                 INSERT INTO student_assignments 
-                (assignment_id, student_id, submission_text, submitted_at)
-                VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
-                ON CONFLICT (assignment_id, student_id) DO UPDATE
+                (school_id, assignment_id, student_id, submission_text, submitted_at)
+                VALUES (%s, %s, %s, %s, (now() AT TIME ZONE 'utc'))
+                ON CONFLICT (school_id, assignment_id, student_id) DO UPDATE
                 SET submission_text = EXCLUDED.submission_text,
-                    submitted_at = CURRENT_TIMESTAMP
-            """, (assignment_id, session['user_id'], submission_text))
+                    submitted_at = EXCLUDED.submitted_at
+            """, (assignment['school_id'], assignment_id, session['user_id'], submission_text))
             
             flash('Assignment submitted successfully', 'success')
             return redirect(url_for('manage_assignments', 
@@ -646,8 +840,8 @@ def submit_assignment(assignment_id):
         # Check if already submitted
         cur.execute("""
             SELECT * FROM student_assignments
-            WHERE assignment_id = %s AND student_id = %s
-        """, (assignment_id, session['user_id']))
+            WHERE school_id = %s AND assignment_id = %s AND student_id = %s
+        """, (assignment['school_id'], assignment_id, session['user_id']))
         submission = cur.fetchone()
         
         return render_template('assignments/submit.html',
@@ -657,56 +851,53 @@ def submit_assignment(assignment_id):
         cur.close()
         conn.close()
 
-    # Dashboard data retrieval functions
-    def get_upcoming_sessions(user_id):
-        """Get upcoming class sessions for a teacher."""
+# Calendar feed routes
+@app.route('/calendar')
+def calendar_url():
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Not authenticated'}), 401
+    token = feed_signer.dumps(session['user_id'])
+    return jsonify({'success': True,
+                    'url': url_for('calendar_feed', token=token, _external=True)})
+
+@app.route('/calendar/<token>.ics')
+def calendar_feed(token):
+    try:
+        user_id = feed_signer.loads(token)
+    except BadSignature:
+        abort(404)
+
+    feed, fresh = feed_cache.get(user_id)
+    if not fresh:
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
-        
         try:
-            cur.execute("""
-                SELECT 
-                    cs.start_time,
-                    cs.end_time,
-                    c.name as class_name,
-                    COUNT(ce.student_id) as student_count,
-                    CASE
-                        WHEN cs.start_time <= CURRENT_TIMESTAMP + INTERVAL '15 minutes' 
-                        THEN 'success'
-                        ELSE 'secondary'
-                    END as status_color
-                FROM class_schedules cs
-                JOIN classes c ON cs.class_id = c.id
-                LEFT JOIN class_enrollments ce ON c.id = ce.class_id
-                WHERE c.teacher_id = %s
-                AND cs.start_time >= CURRENT_DATE
-                GROUP BY cs.id, cs.start_time, cs.end_time, c.name
-                ORDER BY cs.start_time ASC
-                LIMIT 5
-            """, (user_id,))
-            return cur.fetchall()
+            feed = build_calendar_feed(cur, user_id, request.host, feed)
         finally:
             cur.close()
             conn.close()
+        feed_cache.put(feed)
+
+    last_modified = None
+    if feed.last_modified:
+        last_modified = feed.last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(feed.etag)
+    else:
+        not_modified = bool(last_modified and request.if_modified_since and
+                            request.if_modified_since >= last_modified)
+
+    if not_modified:
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(feed.body, mimetype='text/calendar')
+    response.set_etag(feed.etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.max_age = 300
+    return response
 
-    @app.route('/')
-    def index():
-        if 'user_id' not in session:
-            return redirect(url_for('login'))
-        
-        try:
-            user_id = session['user_id']
-            upcoming_sessions = get_upcoming_sessions(user_id)
-            recent_activities = get_recent_activity(user_id)
-            
-            return render_template('dashboard/index.html',
-                                 upcoming_sessions=upcoming_sessions,
-                                 recent_activities=recent_activities,
-                                 now=datetime.now())
-        except Exception as e:
-            logger.error(f"Error in index route: {str(e)}")
-            flash("An error occurred while loading the dashboard.", "error")
-            return redirect(url_for('login'))
 # Dashboard Card CRUD Routes
 @app.route('/api/cards/<int:card_id>', methods=['PUT', 'DELETE'])
 def manage_card(card_id):
@@ -746,7 +937,7 @@ def manage_card(card_id):
             return jsonify({'success': False, 'error': 'Card not found'}), 404
     
     except Exception as e:
-        logger.error(f"Error managing card {card_id}: {str(e)}")
+        logger.exception("Error managing card %s: %s", card_id, e)
         return jsonify({'success': False, 'error': 'Server error'}), 500
     finally:
         cur.close()
@@ -780,7 +971,7 @@ def create_card():
         return jsonify({'success': True, 'id': new_card['id']})
     
     except Exception as e:
-        logger.error(f"Error creating card: {str(e)}")
+        logger.exception("Error creating card: %s", e)
         return jsonify({'success': False, 'error': 'Server error'}), 500
     finally:
         cur.close()
@@ -788,7 +979,10 @@ def create_card():
 if __name__ == '__main__':
     try:
         init_db()
+        db_pool.prewarm()
+        if replica_pool is not None:
+            replica_pool.prewarm()
         app.run(host='0.0.0.0', port=5000, debug=True)
     except Exception as e:
-        logger.error(f"Application startup failed: {e}")
+        logger.error("Application startup failed: %s", e)
         raise
\ No newline at end of file
@@ -0,0 +1,79 @@
+"""Statements and view helpers shared by ``app.py`` and ``async_app.py``.
+
+Kept apart from ``app.py`` so the async app can use them without importing
+the Flask app, its connection pools and its logging setup.
+"""
+from datetime import timedelta
+
+from due_dates import to_local
+from prepared import StatementRegistry
+from timetable import Timetable, describe, session_from_row
+
+# Hot statements, prepared once per pooled connection; the shared
+# repository queries are prepared automatically through PreparedExecutor
+statements = StatementRegistry()
+statements.register('user_by_email', """
+    SELECT u.*, s.timezone FROM users u JOIN schools s ON s.id = u.school_id
+    WHERE u.email = %(email)s
+""")
+# The school and its time zone, for sessions started before either was stored
+statements.register('school_of_user', """
+    SELECT u.school_id, s.timezone FROM users u JOIN schools s ON s.id = u.school_id
+    WHERE u.id = %(user_id)s
+""")
+statements.register('class_for_teacher', """
+    SELECT * FROM classes
+    WHERE id = %(class_id)s AND teacher_id = %(teacher_id)s
+""")
+statements.register('schedules_for_class', """
+    SELECT
+        id,
+        day_of_week,
+        TO_CHAR(start_time, 'HH24:MI') as start_time,
+        TO_CHAR(end_time, 'HH24:MI') as end_time,
+        room
+    FROM schedules
+    WHERE class_id = %(class_id)s
+    ORDER BY CASE
+        WHEN day_of_week = 'Monday' THEN 1
+        WHEN day_of_week = 'Tuesday' THEN 2
+        WHEN day_of_week = 'Wednesday' THEN 3
+        WHEN day_of_week = 'Thursday' THEN 4
+        WHEN day_of_week = 'Friday' THEN 5
+        ELSE 6
+    END, start_time
+""")
+statements.register('assignments_for_class', """
+    SELECT a.*,
+           CASE WHEN sa.submitted_at IS NOT NULL
+                THEN true ELSE false END as submitted,
+           sa.grade
+    FROM assignments a
+    LEFT JOIN student_assignments sa ON
+        sa.school_id = a.school_id AND a.id = sa.assignment_id AND sa.student_id = %(student_id)s
+    WHERE a.school_id = %(school_id)s AND a.class_id = %(class_id)s
+    ORDER BY a.due_date DESC
+""")
+
+
+def get_upcoming_sessions(schedules, now, zone='UTC', limit=5):
+    """Build the upcoming-sessions widget rows from already loaded schedules.
+
+    ``now`` is naive UTC; schedules are wall-clock times in ``zone`` (the
+    school's), and so are the returned start and end times.
+    """
+    now = to_local(now, zone)
+    timetable = Timetable(session_from_row(row) for row in schedules)
+    upcoming = []
+    for starts_at, entry in timetable.next_sessions(now, limit=limit):
+        ends_at = starts_at + timedelta(minutes=entry.end - entry.start)
+        upcoming.append({
+            'class_id': entry.class_id,
+            'class_name': entry.class_name,
+            'room': entry.room,
+            'start_time': starts_at,
+            'end_time': ends_at,
+            'label': describe(entry),
+            'status_color': 'success' if starts_at <= now + timedelta(minutes=15) else 'secondary',
+        })
+    return upcoming
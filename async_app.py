@@ -0,0 +1,264 @@
+"""Asyncio variant of ``app.py`` for high-concurrency deployments.
+
+Built on Quart (Flask's API on asyncio) and asyncpg, with one connection
+pool per process created at startup. Pages whose queries do not depend on
+each other run them concurrently on separate pooled connections: the
+dashboard loads classes, assignments, schedules and (for teachers) at-risk
+students at once, and the assignments page loads the class, the enrollment
+check and the assignment list at once.
+
+It serves the read-heavy pages (login, dashboard, class list, assignments)
+with the same SQL as ``app.py`` via :class:`repository.AsyncRepository` and
+``app_queries.statements``; everything else stays on the sync app. Run with any ASGI
+server, e.g. ``hypercorn async_app:app``. Requires the ``quart`` and
+``asyncpg`` packages.
+
+Both apps can serve the same users side by side. With ``REDIS_URL`` the
+session lives in the same store under the same signed id (see
+sessions.py); without it both use signed cookie sessions, which Quart
+encodes the way Flask does. POSTs need a CSRF token in Flask-WTF's
+format, so a form rendered by either app submits to both.
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+
+import asyncpg
+from itsdangerous import BadData, URLSafeTimedSerializer
+from quart import Quart, abort, flash, redirect, render_template, request, session, url_for
+from quart.sessions import SessionInterface
+from werkzeug.security import check_password_hash
+
+from app_queries import get_upcoming_sessions, statements
+from due_dates import to_utc, utcnow
+from logconfig import configure_logging
+from repository import APP_SCHEMA, AsyncpgExecutor, AsyncRepository, to_positional
+from sessions import ServerSideSessionInterface, make_session_store
+import tenants
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Flask-WTF's defaults, as used by app.py
+CSRF_SALT = 'wtf-csrf-token'
+CSRF_TIME_LIMIT = 3600
+CSRF_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+class ThreadedSessionInterface(SessionInterface):
+    """Quart adapter for a session interface of sessions.py; its store round
+    trips run in a worker thread instead of on the event loop."""
+
+    def __init__(self, interface):
+        self.interface = interface
+
+    async def open_session(self, app, request):
+        return await asyncio.to_thread(self.interface.open_session, app, request)
+
+    async def save_session(self, app, session, response):
+        await asyncio.to_thread(self.interface.save_session, app, session, response)
+
+
+app = Quart(__name__)
+app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'dev_key_123')
+app.config['WTF_CSRF_SECRET_KEY'] = os.environ.get('WTF_CSRF_SECRET_KEY', 'csrf_secret_key_123')
+if os.environ.get('REDIS_URL'):
+    app.session_interface = ThreadedSessionInterface(
+        ServerSideSessionInterface(make_session_store(os.environ['REDIS_URL'])))
+
+pool = None
+
+
+@app.before_serving
+async def open_pool():
+    global pool
+    pool = await asyncpg.create_pool(
+        database=os.environ.get('PGDATABASE'),
+        user=os.environ.get('PGUSER'),
+        password=os.environ.get('PGPASSWORD'),
+        host=os.environ.get('PGHOST'),
+        port=int(os.environ.get('PGPORT', 5432)),
+        min_size=int(os.environ.get('DB_POOL_MIN', 2)),
+        max_size=int(os.environ.get('DB_POOL_MAX', 20)),
+    )
+
+
+@app.after_serving
+async def close_pool():
+    await pool.close()
+
+
+def repository():
+    return AsyncRepository(AsyncpgExecutor(pool), APP_SCHEMA, school_id=session.get('school_id'))
+
+
+async def fetch(name, **params):
+    """Rows of a statement registered in ``app_queries.statements``."""
+    sql, names = to_positional(statements.source(name))
+    async with pool.acquire() as conn:
+        records = await conn.fetch(sql, *(params[key] for key in names))
+    return [dict(record) for record in records]
+
+
+async def fetchrow(sql, *args):
+    async with pool.acquire() as conn:
+        record = await conn.fetchrow(sql, *args)
+    return dict(record) if record is not None else None
+
+
+def _csrf_serializer():
+    return URLSafeTimedSerializer(app.config['WTF_CSRF_SECRET_KEY'], salt=CSRF_SALT)
+
+
+@app.template_global('csrf_token')
+def generate_csrf():
+    """A signed CSRF token for forms; the raw token is kept in the session."""
+    if 'csrf_token' not in session:
+        session['csrf_token'] = hashlib.sha1(os.urandom(64)).hexdigest()
+    return _csrf_serializer().dumps(session['csrf_token'])
+
+
+@app.before_request
+async def csrf_protect():
+    if request.method not in CSRF_METHODS:
+        return
+    form = await request.form
+    token = form.get('csrf_token') or request.headers.get('X-CSRFToken') or request.headers.get('X-CSRF-Token')
+    expected = session.get('csrf_token')
+    try:
+        valid = bool(token and expected) and hmac.compare_digest(
+            _csrf_serializer().loads(token, max_age=CSRF_TIME_LIMIT), expected)
+    except BadData:
+        valid = False
+    if not valid:
+        logger.warning("Rejected %s %s: missing or invalid CSRF token", request.method, request.path)
+        abort(400)
+
+
+@app.before_request
+async def load_school():
+    """Fill in ``school_id`` and the school's ``timezone`` for sessions
+    started before they were stored."""
+    if 'user_id' in session and ('school_id' not in session or 'timezone' not in session):
+        rows = await fetch('school_of_user', user_id=session['user_id'])
+        session['school_id'] = rows[0]['school_id'] if rows else tenants.DEFAULT_SCHOOL
+        session['timezone'] = rows[0]['timezone'] if rows else 'UTC'
+
+
+@app.route('/login', methods=['GET', 'POST'])
+async def login():
+    if request.method == 'POST':
+        form = await request.form
+        rows = await fetch('user_by_email', email=form.get('email'))
+        user = rows[0] if rows else None
+        if user and check_password_hash(user['password_hash'], form.get('password', '')):
+            session['user_id'] = user['id']
+            session['username'] = user['username']
+            session['role'] = user['role']
+            session['school_id'] = user['school_id']
+            session['timezone'] = user['timezone']
+            await flash('Welcome back!', 'success')
+            return redirect(url_for('index'))
+        await flash('Invalid email or password', 'error')
+    return await render_template('auth/login.html')
+
+
+@app.route('/logout')
+async def logout():
+    session.clear()
+    return redirect(url_for('login'))
+
+
+@app.route('/')
+async def index():
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+
+    repo = repository()
+    user_id, role = session['user_id'], session['role']
+    queries = [
+        repo.classes_for_user(user_id, role),
+        repo.assignments_for_user(user_id, role, limit=5),
+        repo.schedules_for_user(user_id),
+    ]
+    if role == 'teacher':
+        queries.append(repo.at_risk_students(user_id))
+    try:
+        classes, assignments, schedules, *at_risk = await asyncio.gather(*queries)
+    except Exception as e:
+        logger.exception("Error in index route: %s", e)
+        await flash('An error occurred while loading the dashboard', 'error')
+        classes, assignments, schedules, at_risk = [], [], [], []
+    at_risk_students = at_risk[0] if at_risk else []
+
+    now = utcnow()
+    # Schedules are wall-clock times in the school's zone, not UTC
+    upcoming_sessions = get_upcoming_sessions(schedules, now, session.get('timezone'))
+    return await render_template('dashboard/index.html',
+                                 classes=classes,
+                                 assignments=assignments,
+                                 schedules=schedules,
+                                 upcoming_sessions=upcoming_sessions,
+                                 at_risk_students=at_risk_students,
+                                 now=now)
+
+
+@app.route('/classes')
+async def list_classes():
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    classes = await repository().classes_for_user(session['user_id'], session['role'])
+    return await render_template('classes/list.html',
+                                 classes=classes,
+                                 is_teacher=(session['role'] == 'teacher'))
+
+
+@app.route('/classes/<int:class_id>/assignments', methods=['GET', 'POST'])
+async def manage_assignments(class_id):
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    user_id, school_id = session['user_id'], session['school_id']
+
+    # Classes of other schools are not found
+    class_obj, enrolled, assignments = await asyncio.gather(
+        fetchrow("SELECT * FROM classes WHERE id = $1 AND school_id = $2", class_id, school_id),
+        fetchrow("SELECT 1 FROM class_students WHERE school_id = $1 AND class_id = $2 AND student_id = $3",
+                 school_id, class_id, user_id),
+        fetch('assignments_for_class', student_id=user_id, class_id=class_id, school_id=school_id),
+    )
+    if not class_obj:
+        await flash('Class not found', 'error')
+        return redirect(url_for('index'))
+    if session['role'] != 'teacher' and class_obj['teacher_id'] != user_id and not enrolled:
+        await flash('Access denied', 'error')
+        return redirect(url_for('index'))
+
+    if request.method == 'POST' and session['role'] == 'teacher':
+        # Only the class's own teacher adds assignments to it
+        if class_obj['teacher_id'] != user_id:
+            await flash('Access denied', 'error')
+            return redirect(url_for('index'))
+        form = await request.form
+        # Entered in the browser's zone (a hidden field); stored as UTC
+        try:
+            due_date = to_utc(form['due_date'], form.get('timezone'))
+        except ValueError:
+            await flash('Invalid due date', 'error')
+            return redirect(url_for('manage_assignments', class_id=class_id))
+        async with pool.acquire() as conn:
+            await conn.execute("""
+                INSERT INTO assignments (school_id, class_id, title, description, due_date)
+                VALUES ($1, $2, $3, $4, $5::timestamp)
+            """, school_id, class_id, form['title'], form['description'], due_date)
+        await flash('Assignment created successfully', 'success')
+        # The list was loaded before the insert
+        assignments = await fetch('assignments_for_class', student_id=user_id, class_id=class_id,
+                                  school_id=school_id)
+
+    return await render_template('classes/assignments.html',
+                                 class_obj=class_obj,
+                                 assignments=assignments,
+                                 is_teacher=(session['role'] == 'teacher'),
+                                 now=utcnow())
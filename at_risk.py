@@ -0,0 +1,322 @@
+"""Nightly at-risk scoring of every student.
+
+Each student gets a risk score in ``[0, 1]`` from four signals: the share of
+past-due assignments never submitted, the share of submissions handed in
+late, a falling grade trend (least-squares slope of scores in due-date
+order) and, where the schema records attendance, the absence rate. Scores
+land in the ``student_risk`` table that the teacher dashboards read through
+:meth:`repository.Repository.at_risk_students`.
+
+The job is built to get through a district of ~100k students in minutes:
+
+* students are split into ``student_id % shards`` shards scored by parallel
+  worker processes, each on its own connection;
+* a shard's (student, assignment) rows are streamed through a server-side
+  cursor, ordered by student, and cut into chunks that never split a
+  student, so memory stays flat whatever the district size;
+* each chunk is scored with NumPy group-by reductions (``bincount``), with
+  no Python loop per student, and upserted before the next is read;
+* by default only students whose data changed since the last run are
+  re-scored: new or changed submissions and grades, changed assignments,
+  assignments that fell due, new enrollments and recent attendance.
+  ``--full`` re-scores everyone.
+
+Run with ``python -m at_risk`` (SQLAlchemy URL in ``DATABASE_URL``; by
+default Postgres via the ``PG*`` variables), or let the task workers run
+:func:`nightly` with ``python -m tasks --import at_risk``. Requires NumPy.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import logging
+import os
+import time
+
+import numpy as np
+
+from logconfig import configure_logging
+from repository import APP_SCHEMA, ORM_SCHEMA, Repository
+from tasks import task
+
+logger = logging.getLogger(__name__)
+
+SCHEMAS = {schema.name: schema for schema in (APP_SCHEMA, ORM_SCHEMA)}
+
+CHUNK_SIZE = 20000
+WEIGHTS = {'missing': 0.4, 'late': 0.15, 'trend': 0.2, 'absence': 0.25}
+# Losing this many points per assignment counts as the steepest decline
+TREND_FULL_RISK = 5.0
+LEVELS = ((0.5, 'high'), (0.25, 'medium'), (0.0, 'low'))
+
+
+def _changed_students(schema):
+    """Subquery of students whose risk inputs changed since ``:since``."""
+    parts = [
+        """SELECT s.{submission_student} FROM {submissions} s
+           WHERE s.{submission_updated} > :since OR {grade_updated} > :since""",
+        """SELECT e.{enrolled_student} FROM {enrollments} e
+           JOIN {assignments} a ON a.{assignment_class} = e.class_id
+           WHERE a.updated_at > :since OR (a.due_date > :since AND a.due_date <= :now)""",
+    ]
+    if schema.enrolled_at:
+        parts.append("SELECT {enrolled_student} FROM {enrollments} WHERE {enrolled_at} > :since")
+    if schema.attendance:
+        # Attendance rows carry no timestamp; they are recorded on the day
+        parts.append("SELECT student_id FROM {attendance} WHERE date >= :since_date")
+    return '\nUNION\n'.join(parts)
+
+
+def _shard_sql(schema, incremental):
+    changed = ''
+    if incremental:
+        changed = f'AND e.{{enrolled_student}} IN ({_changed_students(schema)})'
+    work = f"""
+        SELECT e.{{enrolled_student}} AS student_id,
+               CASE WHEN s.id IS NULL THEN 0 ELSE 1 END AS submitted,
+               CASE WHEN s.submitted_at > a.due_date THEN 1 ELSE 0 END AS late,
+               {{grade}} AS score
+        FROM {{enrollments}} e
+        JOIN {{assignments}} a ON a.{{assignment_class}} = e.class_id
+        LEFT JOIN {{submissions}} s
+               ON s.assignment_id = a.id AND s.{{submission_student}} = e.{{enrolled_student}}
+        WHERE a.due_date <= :now AND e.{{enrolled_student}} % :shards = :shard {changed}
+        ORDER BY e.{{enrolled_student}}, a.due_date, a.id
+    """
+    attendance = None
+    if schema.attendance:
+        changed = f'AND student_id IN ({_changed_students(schema)})' if incremental else ''
+        attendance = f"""
+            SELECT student_id, COUNT(*) AS sessions,
+                   SUM(CASE WHEN status = 'absent' THEN 1 ELSE 0 END) AS absences
+            FROM {{attendance}}
+            WHERE student_id % :shards = :shard {changed}
+            GROUP BY student_id
+            ORDER BY student_id
+        """
+    fields = schema._asdict()
+    return work.format(**fields), attendance and attendance.format(**fields)
+
+
+def _student_chunks(rows, size):
+    """Lists of about ``size`` rows, never splitting a student's rows."""
+    chunk = []
+    for row in rows:
+        if len(chunk) >= size and row[0] != chunk[-1][0]:
+            yield chunk
+            chunk = []
+        chunk.append(row)
+    if chunk:
+        yield chunk
+
+
+def _grouped_slope(groups, x, y, count):
+    """Least-squares slope of ``y`` over ``x`` per group; NaN below two points."""
+    n = np.bincount(groups, minlength=count)
+    sx = np.bincount(groups, weights=x, minlength=count)
+    sy = np.bincount(groups, weights=y, minlength=count)
+    sxy = np.bincount(groups, weights=x * y, minlength=count)
+    sxx = np.bincount(groups, weights=x * x, minlength=count)
+    denominator = n * sxx - sx * sx
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator > 0, (n * sxy - sx * sy) / denominator, np.nan)
+
+
+def score_chunk(work, attendance=()):
+    """Score the students in ``work`` rows ``(student_id, submitted, late,
+    score)`` (sorted by student, then due date) and ``attendance`` rows
+    ``(student_id, sessions, absences)``. Returns a dict of equal-length arrays.
+    """
+    work = np.array(work, dtype=float).reshape(-1, 4)
+    attendance = np.array(attendance, dtype=float).reshape(-1, 3)
+    students = np.union1d(work[:, 0], attendance[:, 0]).astype(np.int64)
+    count = students.size
+    groups = np.searchsorted(students, work[:, 0].astype(np.int64))
+
+    due = np.bincount(groups, minlength=count)
+    submitted = np.bincount(groups, weights=work[:, 1], minlength=count)
+    late = np.bincount(groups, weights=work[:, 2], minlength=count)
+    missing = due - submitted
+
+    # Position of each graded row within its student's grades
+    graded = ~np.isnan(work[:, 3])
+    graded_groups = groups[graded]
+    first = np.searchsorted(graded_groups, graded_groups)
+    position = np.arange(graded_groups.size) - first
+    slope = _grouped_slope(graded_groups, position.astype(float), work[graded, 3], count)
+
+    absence = np.full(count, np.nan)
+    rows = np.searchsorted(students, attendance[:, 0].astype(np.int64))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        absence[rows] = np.where(attendance[:, 1] > 0, attendance[:, 2] / attendance[:, 1], np.nan)
+        signals = {
+            'missing': np.where(due > 0, missing / due, np.nan),
+            'late': np.where(submitted > 0, late / submitted, np.nan),
+            'trend': np.clip(-slope / TREND_FULL_RISK, 0.0, 1.0),
+            'absence': absence,
+        }
+    # Weighted mean over the signals each student has data for
+    total = np.zeros(count)
+    weight = np.zeros(count)
+    for name, values in signals.items():
+        present = ~np.isnan(values)
+        total += np.where(present, values, 0.0) * WEIGHTS[name]
+        weight += present * WEIGHTS[name]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = np.where(weight > 0, total / weight, 0.0)
+
+    level = np.full(count, LEVELS[-1][1], dtype=object)
+    for threshold, name in reversed(LEVELS[:-1]):
+        level[score >= threshold] = name
+    return {
+        'student_id': students, 'score': score, 'level': level, 'assignments_due': due,
+        'missing': missing, 'late': late, 'grade_trend': slope, 'absence_rate': absence,
+    }
+
+
+def _records(scored, scored_at):
+    def value(array, index):
+        item = array[index]
+        if isinstance(item, str):
+            return item
+        return None if np.isnan(item) else float(item)
+
+    columns = ('score', 'level', 'grade_trend', 'absence_rate')
+    return [dict({name: value(scored[name], index) for name in columns},
+                 student_id=int(scored['student_id'][index]),
+                 assignments_due=int(scored['assignments_due'][index]),
+                 missing=int(scored['missing'][index]), late=int(scored['late'][index]),
+                 scored_at=scored_at)
+            for index in range(scored['student_id'].size)]
+
+
+def _upsert_sql(schema):
+    columns = ('student_id', 'score', 'level', 'assignments_due', 'missing', 'late',
+               'grade_trend', 'absence_rate', 'scored_at')
+    updates = ', '.join(f'{column} = excluded.{column}' for column in columns[1:])
+    return (f"INSERT INTO {schema.student_risk} ({', '.join(columns)}) "
+            f"VALUES ({', '.join(':' + column for column in columns)}) "
+            f"ON CONFLICT (student_id) DO UPDATE SET {updates}")
+
+
+def create_engine(url):
+    from sqlalchemy import create_engine as sa_create_engine
+    from sqlalchemy.engine import make_url
+    from sqlalchemy.pool import NullPool
+    options = {}
+    if make_url(url).get_driver_name() == 'psycopg2':
+        # Batch the per-chunk upserts instead of one round trip per row
+        options['executemany_mode'] = 'values_plus_batch'
+    return sa_create_engine(url, poolclass=NullPool, **options)
+
+
+def score_shard(url, schema, shard, shards, now, since=None, chunk_size=CHUNK_SIZE):
+    """Score one shard in a single transaction; returns the number of students."""
+    from sqlalchemy import text
+    work_sql, attendance_sql = _shard_sql(schema, incremental=since is not None)
+    params = {'now': now, 'shard': shard, 'shards': shards}
+    if since is not None:
+        params.update(since=since, since_date=since.date())
+    upsert = text(_upsert_sql(schema))
+    scored_total = 0
+
+    engine = create_engine(url)
+    try:
+        with engine.begin() as conn:
+            def stream(sql):
+                # Server-side cursor on Postgres; rows arrive as they are consumed
+                statement = text(sql).execution_options(stream_results=True, max_row_buffer=chunk_size)
+                return conn.execute(statement, params)
+
+            work = stream(work_sql)
+            attendance = iter(stream(attendance_sql) if attendance_sql else ())
+            pending = next(attendance, None)
+
+            def attendance_through(last_student=None, limit=None):
+                nonlocal pending
+                rows = []
+                while (pending is not None and (last_student is None or pending[0] <= last_student)
+                       and (limit is None or len(rows) < limit)):
+                    rows.append(tuple(pending))
+                    pending = next(attendance, None)
+                return rows
+
+            chunks = _student_chunks((tuple(row) for row in work), chunk_size)
+            for chunk in chunks:
+                scored = score_chunk(chunk, attendance_through(chunk[-1][0]))
+                conn.execute(upsert, _records(scored, now))
+                scored_total += scored['student_id'].size
+            # Students with attendance but nothing due yet
+            while pending is not None:
+                scored = score_chunk([], attendance_through(limit=chunk_size))
+                conn.execute(upsert, _records(scored, now))
+                scored_total += scored['student_id'].size
+    finally:
+        engine.dispose()
+    return scored_total
+
+
+def last_run_started(conn):
+    from sqlalchemy import text
+    value = conn.execute(text("SELECT MAX(started_at) FROM risk_job_runs")).scalar()
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value
+
+
+def run(url, schema=ORM_SCHEMA, workers=None, full=False, now=None):
+    """Score every student (``full``) or those changed since the last run."""
+    from sqlalchemy import text
+    workers = workers or os.cpu_count() or 1
+    now = now or datetime.utcnow()
+    started = time.perf_counter()
+
+    engine = create_engine(url)
+    try:
+        with engine.begin() as conn:
+            for statement in Repository(None, schema).risk_table_statements():
+                conn.execute(text(statement))
+            since = None if full else last_run_started(conn)
+        mode = 'full' if since is None else 'incremental'
+        logger.info("Scoring students (%s, %d shards)", mode, workers)
+
+        if workers == 1:
+            counts = [score_shard(url, schema, 0, 1, now, since)]
+        else:
+            with ProcessPoolExecutor(workers) as pool:
+                futures = [pool.submit(score_shard, url, schema, shard, workers, now, since)
+                           for shard in range(workers)]
+                counts = [future.result() for future in futures]
+
+        with engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO risk_job_runs (started_at, finished_at, mode, students) "
+                "VALUES (:started_at, :finished_at, :mode, :students)"),
+                {'started_at': now, 'finished_at': datetime.utcnow(), 'mode': mode,
+                 'students': sum(counts)})
+    finally:
+        engine.dispose()
+    logger.info("Scored %d students in %.1fs", sum(counts), time.perf_counter() - started)
+    return sum(counts)
+
+
+@task(every=24 * 3600, retries=1, concurrency=1, timeout=4 * 3600)
+def nightly():
+    """Incremental run over ``DATABASE_URL`` and ``AT_RISK_SCHEMA``."""
+    run(os.environ.get('DATABASE_URL', 'postgresql+psycopg2://'),
+        SCHEMAS[os.environ.get('AT_RISK_SCHEMA', ORM_SCHEMA.name)])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default=os.environ.get('DATABASE_URL', 'postgresql+psycopg2://'),
+                        help='SQLAlchemy database URL (default: DATABASE_URL, else PG* settings)')
+    parser.add_argument('--schema', choices=sorted(SCHEMAS), default=ORM_SCHEMA.name)
+    parser.add_argument('--workers', type=int, default=None, help='parallel shards (default: CPUs)')
+    parser.add_argument('--full', action='store_true', help='re-score every student')
+    args = parser.parse_args(argv)
+    configure_logging()
+    run(args.url, SCHEMAS[args.schema], workers=args.workers, full=args.full)
+
+
+if __name__ == '__main__':
+    main()
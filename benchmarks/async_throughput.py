@@ -0,0 +1,115 @@
+"""Dashboard throughput of the sync app against the asyncio variant.
+
+Run with ``python -m benchmarks.async_throughput`` against the Postgres
+database configured by the ``PG*`` variables; needs ``quart`` and
+``asyncpg``. Both apps serve ``GET /`` in-process through their test clients
+as the first user in ``users`` (or ``BENCH_USER_ID``), with ``CONCURRENCY``
+requests in flight: threads for ``app.py``, tasks for ``async_app.py``.
+
+Both sides do the same work per request. ``app.py``'s routes are served by
+a bare Flask app (see :func:`bare_app`) without the conditional GET on the
+dashboard and the instrumentation and replica hooks, which
+``async_app.py`` does not have. The sessions already hold the user's
+school, so neither app writes the session back.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import inspect
+import os
+import sys
+import time
+
+REQUESTS = 2000
+CONCURRENCY = int(os.environ.get('BENCH_CONCURRENCY', 64))
+
+
+def bench_user(app_module):
+    conn = app_module.get_db_connection()
+    cur = conn.cursor()
+    try:
+        if os.environ.get('BENCH_USER_ID'):
+            cur.execute("SELECT u.id, u.username, u.role, u.school_id, s.timezone FROM users u "
+                        "JOIN schools s ON s.id = u.school_id WHERE u.id = %s",
+                        (int(os.environ['BENCH_USER_ID']),))
+        else:
+            cur.execute("SELECT u.id, u.username, u.role, u.school_id, s.timezone FROM users u "
+                        "JOIN schools s ON s.id = u.school_id ORDER BY u.id LIMIT 1")
+        row = cur.fetchone()
+    finally:
+        cur.close()
+        conn.close()
+    if row is None:
+        sys.exit('No users in the database to benchmark with')
+    return {'user_id': row[0], 'username': row[1], 'role': row[2], 'school_id': row[3],
+            'timezone': row[4]}
+
+
+def bare_app(app_module):
+    """``app.py``'s routes and sessions on a Flask app with only the
+    ``load_school`` hook, and the dashboard without its conditional GET."""
+    from flask import Flask
+    source = app_module.app
+    bare = Flask(source.import_name, root_path=source.root_path, template_folder=source.template_folder)
+    bare.config.update(source.config)
+    bare.session_interface = source.session_interface
+    bare.jinja_env.globals.update(source.jinja_env.globals)
+    for rule in source.url_map.iter_rules():
+        if rule.endpoint == 'static':
+            continue
+        view = source.view_functions[rule.endpoint]
+        if rule.endpoint == 'index':
+            view = inspect.unwrap(view)
+        bare.add_url_rule(rule.rule, rule.endpoint, view, methods=rule.methods)
+    bare.before_request(app_module.load_school)
+    return bare
+
+
+def run_sync(app_module, user):
+    app = bare_app(app_module)
+
+    def worker(count):
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess.update(user)
+        for _ in range(count):
+            assert client.get('/').status_code == 200
+
+    per_worker = REQUESTS // CONCURRENCY
+    started = time.perf_counter()
+    with ThreadPoolExecutor(CONCURRENCY) as executor:
+        list(executor.map(worker, [per_worker] * CONCURRENCY))
+    elapsed = time.perf_counter() - started
+    return per_worker * CONCURRENCY / elapsed
+
+
+async def run_async(user):
+    from async_app import app
+
+    async def worker(test_app, count):
+        client = test_app.test_client()
+        async with client.session_transaction() as sess:
+            sess.update(user)
+        for _ in range(count):
+            response = await client.get('/')
+            assert response.status_code == 200
+
+    per_worker = REQUESTS // CONCURRENCY
+    async with app.test_app() as test_app:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(test_app, per_worker) for _ in range(CONCURRENCY)))
+        elapsed = time.perf_counter() - started
+    return per_worker * CONCURRENCY / elapsed
+
+
+def main():
+    if not os.environ.get('PGDATABASE'):
+        sys.exit('Set PGDATABASE (and PGHOST/PGUSER/...) to run this benchmark')
+    import app
+    user = bench_user(app)
+    print(f'{CONCURRENCY} concurrent requests, {REQUESTS} total')
+    print(f'{"app.py (threads)":>24}: {run_sync(app, user):8.1f} req/s')
+    print(f'{"async_app.py (asyncio)":>24}: {asyncio.run(run_async(user)):8.1f} req/s')
+
+
+if __name__ == '__main__':
+    main()
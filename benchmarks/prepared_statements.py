@@ -0,0 +1,73 @@
+"""Planning and round-trip cost of app.py's hot SQL, text vs. prepared.
+
+Run with ``python -m benchmarks.prepared_statements`` against the Postgres
+database configured by the ``PG*`` variables (the schema from
+``app.init_db``). For each statement it reports the mean latency of sending
+the SQL text against ``EXECUTE`` of the prepared statement. It also reports
+the ``Planning Time`` from ``EXPLAIN (ANALYZE)``; once Postgres has switched
+to a generic plan, a prepared statement no longer plans per call.
+"""
+import os
+import re
+import sys
+import time
+
+ITERATIONS = 500
+PARAMS = {'email': 'nobody@example.com', 'class_id': 1, 'teacher_id': 1, 'school_id': 1,
+          'student_id': 1, 'user_id': 1, 'limit': 5}
+PLANNING = re.compile(r'Planning Time: ([\d.]+) ms')
+
+
+def planning_ms(cur, statement, args):
+    cur.execute('EXPLAIN (ANALYZE, SUMMARY) ' + statement, args)
+    for (line,) in cur.fetchall():
+        match = PLANNING.search(line)
+        if match:
+            return float(match.group(1))
+    return 0.0
+
+
+def main():
+    if not os.environ.get('PGDATABASE'):
+        sys.exit('Set PGDATABASE (and PGHOST/PGUSER/...) to run this benchmark')
+    import app
+    from repository import to_positional
+
+    # Register the shared repository queries under their usual names
+    conn = app.get_db_connection()
+    repo = app.repository(conn, school_id=PARAMS['school_id'])
+    repo.data_version(PARAMS['user_id'])
+    repo.classes_for_user(PARAMS['user_id'], 'teacher')
+    repo.assignments_for_user(PARAMS['user_id'], 'student', limit=PARAMS['limit'])
+    repo.schedules_for_user(PARAMS['user_id'])
+
+    cur = conn.cursor()
+    registry = app.statements
+    print(f'{"statement":<32} {"text ms":>9} {"prepared ms":>12} {"plan text":>10} {"plan prep":>10}')
+    for name in registry.names():
+        sql = registry.source(name)
+        _, names = to_positional(sql)
+        args = [PARAMS[key] for key in names]
+
+        started = time.perf_counter()
+        for _ in range(ITERATIONS):
+            cur.execute(sql, PARAMS)
+            cur.fetchall()
+        text_ms = (time.perf_counter() - started) * 1000 / ITERATIONS
+
+        started = time.perf_counter()
+        for _ in range(ITERATIONS):
+            registry.execute(cur, name, PARAMS)
+            cur.fetchall()
+        prepared_ms = (time.perf_counter() - started) * 1000 / ITERATIONS
+
+        text_plan = planning_ms(cur, sql, PARAMS)
+        execute = f'EXECUTE {name}' + (' (' + ', '.join(['%s'] * len(args)) + ')' if args else '')
+        prepared_plan = planning_ms(cur, execute, args)
+        print(f'{name:<32} {text_ms:9.3f} {prepared_ms:12.3f} {text_plan:10.3f} {prepared_plan:10.3f}')
+    cur.close()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
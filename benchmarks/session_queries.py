@@ -0,0 +1,78 @@
+"""Per-request query count with and without the cached user principal.
+
+Run with ``python -m benchmarks.session_queries``. Uses an in-memory SQLite
+database so it needs no running services.
+"""
+import time
+
+from flask import Flask
+from flask_login import LoginManager, current_user, login_required, login_user
+from sqlalchemy import event
+
+from database import db
+from models import User
+from sessions import MEMORY_URL, cached_user_loader, init_sessions
+
+REQUESTS = 500
+
+
+def build_app(cached):
+    app = Flask(__name__)
+    app.secret_key = 'benchmark'
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    init_sessions(app, MEMORY_URL)
+
+    login_manager = LoginManager(app)
+    if cached:
+        login_manager.user_loader(cached_user_loader(db, User))
+    else:
+        login_manager.user_loader(lambda user_id: db.session.get(User, int(user_id)))
+
+    @app.route('/login')
+    def login():
+        login_user(db.session.scalars(db.select(User)).first())
+        return 'ok'
+
+    @app.route('/whoami')
+    @login_required
+    def whoami():
+        return f'{current_user.username} ({current_user.role})'
+
+    with app.app_context():
+        db.create_all()
+        user = User(username='teacher', email='teacher@example.com', role='teacher')
+        user.set_password('secret')
+        db.session.add(user)
+        db.session.commit()
+    return app
+
+
+def run(cached):
+    app = build_app(cached)
+    queries = 0
+
+    def count(*args):
+        nonlocal queries
+        queries += 1
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count)
+    client = app.test_client()
+    client.get('/login')
+    queries = 0
+    started = time.perf_counter()
+    for _ in range(REQUESTS):
+        assert client.get('/whoami').status_code == 200
+    elapsed = time.perf_counter() - started
+    return queries / REQUESTS, elapsed / REQUESTS * 1000
+
+
+def main():
+    for label, cached in (('per-request user_loader', False), ('cached principal', True)):
+        per_request, ms = run(cached)
+        print(f'{label:>24}: {per_request:.2f} queries/request, {ms:.3f} ms/request')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Cold start: time from process spawn to the first HTTP response.
+
+Run with ``python -m benchmarks.startup``. Each scenario starts a fresh
+interpreter that imports the app, initialises it and serves one request
+through the test client (``/metrics`` for ``app.py``, a one-query route for
+the Flask-SQLAlchemy app); the median wall time over ``RUNS`` starts is
+reported. The Flask-SQLAlchemy scenarios use a SQLite file so they need no
+running services: the first boot creates the schema, later boots find the
+schema version current and skip the DDL.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RUNS = 5
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PSYCOPG_APP = """
+import os
+os.environ['METRICS_TOKEN'] = 'benchmark'
+from app import app
+response = app.test_client().get('/metrics', headers={'Authorization': 'Bearer benchmark'})
+print(response.status_code)
+"""
+
+ORM_APP = """
+import sys
+from flask import Flask
+from database import db, init_db
+from routes import auth_bp, login_manager
+app = Flask('benchmark', root_path=sys.argv[1])
+app.secret_key = 'benchmark'
+app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + sys.argv[2]
+init_db(app, prewarm=False)
+login_manager.init_app(app)
+app.register_blueprint(auth_bp)
+app.add_url_rule('/ping', 'ping', lambda: str(db.session.execute(db.text('SELECT 1')).scalar()))
+response = app.test_client().get('/ping')
+print(response.status_code)
+"""
+
+
+def time_start(script, *args):
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', script, ROOT, *args], cwd=ROOT, check=True,
+                   stdout=subprocess.DEVNULL, env=dict(os.environ, LOG_LEVEL='WARNING'))
+    return time.perf_counter() - started
+
+
+def main():
+    baseline = statistics.median(time_start('pass') for _ in range(RUNS))
+    print(f'{"interpreter only":>28}: {baseline * 1000:7.1f} ms')
+
+    psycopg = statistics.median(time_start(PSYCOPG_APP) for _ in range(RUNS))
+    print(f'{"app.py first response":>28}: {psycopg * 1000:7.1f} ms')
+
+    firsts = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for run in range(RUNS):
+            path = os.path.join(tmp, f'startup{run}.sqlite3')
+            firsts.append(time_start(ORM_APP, path))
+        first = statistics.median(firsts)
+        warm = statistics.median(time_start(ORM_APP, path) for _ in range(RUNS))
+    print(f'{"routes.py first boot (DDL)":>28}: {first * 1000:7.1f} ms')
+    print(f'{"routes.py schema current":>28}: {warm * 1000:7.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
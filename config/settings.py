@@ -1,16 +1,42 @@
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+
+def env_bool(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# DJANGO_ENV=production switches on the production profile below
+ENVIRONMENT = os.environ.get('DJANGO_ENV', 'development')
+PRODUCTION = ENVIRONMENT == 'production'
+
+
+def env_required(name, default):
+    """``name`` from the environment. Production refuses to start without
+    it rather than run on the development ``default``."""
+    value = os.environ.get(name)
+    if value:
+        return value
+    if PRODUCTION:
+        raise ImproperlyConfigured(f'{name} must be set when DJANGO_ENV=production')
+    return default
+
+
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-default-key-for-development'
+SECRET_KEY = env_required('DJANGO_SECRET_KEY', 'django-insecure-default-key-for-development')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = env_bool('DJANGO_DEBUG', not PRODUCTION)
 
-ALLOWED_HOSTS = ['*']
+ALLOWED_HOSTS = env_required('DJANGO_ALLOWED_HOSTS', '*').split(',')
 
 # Handle CSRF verification for Replit
 CSRF_TRUSTED_ORIGINS = [
@@ -43,23 +69,34 @@ CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 MIDDLEWARE = [
+    'dashboard.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'replicas.ReplicaRoutingMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'dashboard.middleware.ConditionalGetMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
 
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+if not DEBUG:
+    # Compile each template once per process instead of on every render
+    TEMPLATE_LOADERS = [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS,
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -73,12 +110,74 @@ TEMPLATES = [
 WSGI_APPLICATION = 'config.wsgi.application'
 
 # Database Configuration
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Postgres is used whenever the PG* variables are set (the Flask app reads
+# the same ones); connections are kept open across requests and health
+# checked before reuse. Production requires it; SQLite is for development.
+if os.environ.get('PGDATABASE'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('PGDATABASE'),
+            'USER': os.environ.get('PGUSER'),
+            'PASSWORD': os.environ.get('PGPASSWORD'),
+            'HOST': os.environ.get('PGHOST'),
+            'PORT': os.environ.get('PGPORT'),
+            'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': 5,
+            },
+        }
+    }
+    # Read-only views go to the replica; see replicas.ReplicaRouter
+    if os.environ.get('PGREPLICA_HOST'):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'HOST': os.environ['PGREPLICA_HOST'],
+            'PORT': os.environ.get('PGREPLICA_PORT', os.environ.get('PGPORT')),
+            'TEST': {'MIRROR': 'default'},
+        }
+elif PRODUCTION:
+    raise ImproperlyConfigured('PGDATABASE must be set when DJANGO_ENV=production')
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
     }
-}
+
+DATABASE_ROUTERS = ['replicas.ReplicaRouter']
+
+# Cache Configuration
+# A shared Redis cache when REDIS_URL is set, otherwise a per-process cache.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+            'TIMEOUT': 300,
+            'KEY_PREFIX': 'edudash',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'edudash',
+            'TIMEOUT': 300,
+            'OPTIONS': {
+                'MAX_ENTRIES': 5000,
+            },
+        }
+    }
+
+# Sessions live in the cache; cached_db keeps a database copy unless the
+# cache is shared between workers.
+if PRODUCTION and os.environ.get('REDIS_URL'):
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
+else:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = []
@@ -96,9 +195,36 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
 
+# Hashed, pre-compressed assets outside DEBUG; see dashboard.storage and
+# config.static for the build and serving side.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': ('django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+                    else 'dashboard.storage.CompressedManifestStaticFilesStorage'),
+    },
+}
+
+# Bundles written into static/ by `manage.py build_assets`
+STATIC_BUNDLES = {
+    'build/app.css': ['css/custom.css'],
+    'build/app.js': ['js/main.js', 'js/dashboard.js', 'js/student_picker.js'],
+}
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Logging goes through logconfig's background queue listener, configured
+# from LOG_LEVEL / LOG_LEVELS / LOG_SAMPLE / LOG_FORMAT.
+LOGGING_CONFIG = 'logconfig.configure_django_logging'
+LOGGING = {
+    'levels': {
+        'django.db.backends': 'INFO',
+    },
+}
+
 # Authentication
 LOGIN_URL = 'dashboard:login'
 LOGOUT_URL = 'dashboard:logout'
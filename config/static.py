@@ -0,0 +1,119 @@
+"""
+In-process static file serving for the WSGI application.
+
+The file table is built once at startup, so a request is a dict lookup plus a
+``sendfile``-friendly file wrapper. Pre-compressed ``.br``/``.gz`` siblings
+written by ``CompressedManifestStaticFilesStorage`` are chosen from
+``Accept-Encoding``, and hashed file names get a far-future immutable
+``Cache-Control``.
+"""
+import json
+import mimetypes
+import os
+from email.utils import formatdate, parsedate_to_datetime
+
+FOREVER = 'public, max-age=31536000, immutable'
+SHORT = 'public, max-age=60'
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+CHUNK_SIZE = 64 * 1024
+
+
+def _read_chunks(handle):
+    with handle:
+        while chunk := handle.read(CHUNK_SIZE):
+            yield chunk
+
+
+class StaticFile:
+    def __init__(self, path, immutable):
+        stat = os.stat(path)
+        self.path = path
+        self.size = stat.st_size
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        self.mtime = int(stat.st_mtime)
+        self.etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+        content_type, _ = mimetypes.guess_type(path)
+        if content_type and (content_type.startswith('text/') or content_type.endswith(('javascript', 'json', 'xml'))):
+            content_type += '; charset=utf-8'
+        self.content_type = content_type or 'application/octet-stream'
+        self.cache_control = FOREVER if immutable else SHORT
+        self.variants = {}
+        for encoding, suffix in ENCODINGS:
+            if os.path.exists(path + suffix):
+                self.variants[encoding] = (path + suffix, os.path.getsize(path + suffix))
+
+
+class StaticFilesMiddleware:
+    """WSGI middleware serving ``root`` under ``prefix`` ahead of ``application``."""
+
+    def __init__(self, application, root, prefix, manifest_name='staticfiles.json'):
+        self.application = application
+        self.prefix = '/' + prefix.strip('/') + '/'
+        self.files = {}
+        root = str(root)
+        if not os.path.isdir(root):
+            return
+        hashed = set()
+        manifest = os.path.join(root, manifest_name)
+        if os.path.exists(manifest):
+            with open(manifest, encoding='utf-8') as fh:
+                hashed = set(json.load(fh).get('paths', {}).values())
+        for directory, _, names in os.walk(root):
+            for name in names:
+                if name.endswith(('.gz', '.br')):
+                    continue
+                path = os.path.join(directory, name)
+                relative = os.path.relpath(path, root).replace(os.sep, '/')
+                self.files[self.prefix + relative] = StaticFile(path, relative in hashed)
+
+    def __call__(self, environ, start_response):
+        static_file = self.files.get(environ.get('PATH_INFO', ''))
+        if static_file is None:
+            return self.application(environ, start_response)
+        method = environ['REQUEST_METHOD']
+        if method not in ('GET', 'HEAD'):
+            start_response('405 Method Not Allowed', [('Allow', 'GET, HEAD')])
+            return [b'']
+
+        path, size, etag, encoding = static_file.path, static_file.size, static_file.etag, None
+        accepted = environ.get('HTTP_ACCEPT_ENCODING', '')
+        for candidate, _ in ENCODINGS:
+            if candidate in static_file.variants and candidate in accepted:
+                encoding = candidate
+                path, size = static_file.variants[encoding]
+                etag = f'{etag[:-1]}-{encoding}"'
+                break
+
+        headers = [
+            ('Cache-Control', static_file.cache_control),
+            ('ETag', etag),
+            ('Last-Modified', static_file.last_modified),
+            ('Vary', 'Accept-Encoding'),
+        ]
+        if self._not_modified(environ, etag, static_file.mtime):
+            start_response('304 Not Modified', headers)
+            return [b'']
+        if encoding:
+            headers.append(('Content-Encoding', encoding))
+        headers += [('Content-Type', static_file.content_type), ('Content-Length', str(size))]
+        start_response('200 OK', headers)
+        if method == 'HEAD':
+            return [b'']
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        handle = open(path, 'rb')
+        if file_wrapper is not None:
+            return file_wrapper(handle, CHUNK_SIZE)
+        return _read_chunks(handle)
+
+    @staticmethod
+    def _not_modified(environ, etag, mtime):
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            return etag in if_none_match or if_none_match.strip() == '*'
+        if_modified_since = environ.get('HTTP_IF_MODIFIED_SINCE')
+        if if_modified_since:
+            try:
+                return parsedate_to_datetime(if_modified_since).timestamp() >= mtime
+            except (TypeError, ValueError):
+                return False
+        return False
@@ -3,9 +3,12 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import RedirectView
+from dashboard.views import metrics_view, profile_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
+    path('debug/profile/', profile_view, name='profile'),
     path('', RedirectView.as_view(url='/dashboard/', permanent=True)),
     path('dashboard/', include('dashboard.urls', namespace='dashboard')),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
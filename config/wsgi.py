@@ -9,3 +9,9 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 # Get the WSGI application for the Django project
 application = get_wsgi_application()
+
+# Serve collected static files in-process, ahead of Django
+from django.conf import settings
+from config.static import StaticFilesMiddleware
+
+application = StaticFilesMiddleware(application, settings.STATIC_ROOT, settings.STATIC_URL)
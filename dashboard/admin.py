@@ -1,17 +1,125 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
-from .models import Class, Assignment, Submission, DashboardItem
+from django.core.paginator import Paginator
+from django.db import connections
+from django.http import JsonResponse
+from django.urls import path, reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+
+from tasks import get_queue, new_batch
+from .models import Class, Assignment, Membership, School, Submission, DashboardItem, overdue_q
+from .tasks import bulk_update, update_queryset
+
+# Selections larger than this are updated by the task workers
+BULK_BACKGROUND_THRESHOLD = 5000
+BULK_CHUNK_SIZE = 2000
+# Unfiltered changelists of tables estimated above this size skip COUNT(*)
+ESTIMATED_COUNT_THRESHOLD = 100000
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that takes the row count of an unfiltered table from the planner.
+
+    ``COUNT(*)`` scans the whole table in Postgres. When the changelist has
+    no filter or search and ``pg_class.reltuples`` puts the table above
+    ``ESTIMATED_COUNT_THRESHOLD`` rows, that estimate (kept current by
+    autovacuum) is used instead. Filtered lists are counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                               [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] > ESTIMATED_COUNT_THRESHOLD:
+                return row[0]
+        return super().count
+
+
+class LargeTableAdminMixin:
+    """Changelist settings for tables that grow to millions of rows."""
+    paginator = EstimatedCountPaginator
+    # The "N total" link under the search box costs a second full count
+    show_full_result_count = False
+
+
+class BulkUpdateMixin:
+    """Admin actions as set-based ``UPDATE`` statements.
+
+    A selection (including "select all" across the filtered changelist) is
+    updated with one statement. Above ``BULK_BACKGROUND_THRESHOLD`` rows it
+    is split into primary-key chunks for the task workers instead, and the
+    message links to a JSON progress view.
+    """
+
+    def bulk_update(self, request, queryset, **values):
+        opts = self.model._meta
+        count = queryset.count()
+        if count <= BULK_BACKGROUND_THRESHOLD:
+            updated = update_queryset(queryset, values)
+            self.message_user(request, f'Updated {updated} {opts.verbose_name_plural}.', messages.SUCCESS)
+            return
+
+        batch = new_batch()
+        chunk, jobs = [], 0
+        for pk in queryset.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=BULK_CHUNK_SIZE):
+            chunk.append(pk)
+            if len(chunk) == BULK_CHUNK_SIZE:
+                bulk_update.schedule((opts.label, chunk, values), batch=batch)
+                chunk, jobs = [], jobs + 1
+        if chunk:
+            bulk_update.schedule((opts.label, chunk, values), batch=batch)
+            jobs += 1
+        url = reverse(f'admin:{opts.app_label}_{opts.model_name}_bulk_progress', args=[batch])
+        self.message_user(request, format_html(
+            'Updating {} {} in the background ({} jobs). <a href="{}">Progress</a>',
+            count, opts.verbose_name_plural, jobs, url), messages.INFO)
+
+    def bulk_progress_view(self, request, batch):
+        return JsonResponse(get_queue().progress(batch))
+
+    def get_urls(self):
+        opts = self.model._meta
+        return [
+            path('bulk-progress/<str:batch>/', self.admin_site.admin_view(self.bulk_progress_view),
+                 name=f'{opts.app_label}_{opts.model_name}_bulk_progress'),
+        ] + super().get_urls()
+
+
+class OverdueFilter(admin.SimpleListFilter):
+    title = 'overdue'
+    parameter_name = 'overdue'
+
+    def lookups(self, request, model_admin):
+        return (('yes', 'Yes'), ('no', 'No'))
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.overdue()
+        if self.value() == 'no':
+            return queryset.exclude(overdue_q())
+        return queryset
+
 
 @admin.register(DashboardItem)
-class DashboardItemAdmin(admin.ModelAdmin):
+class DashboardItemAdmin(BulkUpdateMixin, LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('title', 'owner', 'item_type', 'status', 'priority', 'due_date', 'is_overdue', 'created_at')
-    list_filter = ('status', 'priority', 'item_type', 'created_at')
+    list_filter = (OverdueFilter, 'status', 'priority', 'item_type', 'created_at')
     search_fields = ('title', 'description', 'owner__username', 'owner__email')
     date_hierarchy = 'created_at'
     list_editable = ('status', 'priority')
     readonly_fields = ('created_at', 'updated_at', 'is_overdue')
+    autocomplete_fields = ('owner',)
     list_per_page = 20
+    actions = ('mark_in_progress', 'mark_completed', 'archive', 'set_high_priority', 'set_low_priority')
     
     fieldsets = (
         (None, {
@@ -31,30 +139,108 @@ class DashboardItemAdmin(admin.ModelAdmin):
         return obj.is_overdue
     is_overdue.boolean = True
     is_overdue.short_description = 'Overdue'
+    is_overdue.admin_order_field = 'overdue'
     
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('owner')
+        # Overdue is computed by the database so it can be filtered and sorted on
+        return super().get_queryset(request).select_related('owner').with_overdue()
+
+    @admin.action(description='Mark selected items in progress')
+    def mark_in_progress(self, request, queryset):
+        self.bulk_update(request, queryset, status='in_progress')
+
+    @admin.action(description='Mark selected items completed')
+    def mark_completed(self, request, queryset):
+        self.bulk_update(request, queryset, status='completed')
+
+    @admin.action(description='Archive selected items')
+    def archive(self, request, queryset):
+        self.bulk_update(request, queryset, status='archived')
+
+    @admin.action(description='Set priority to high')
+    def set_high_priority(self, request, queryset):
+        self.bulk_update(request, queryset, priority='high')
+
+    @admin.action(description='Set priority to low')
+    def set_low_priority(self, request, queryset):
+        self.bulk_update(request, queryset, priority='low')
+
+@admin.register(School)
+class SchoolAdmin(admin.ModelAdmin):
+    list_display = ('name', 'slug')
+    search_fields = ('name', 'slug')
 
 @admin.register(Class)
 class ClassAdmin(admin.ModelAdmin):
-    list_display = ('name', 'teacher', 'created_at')
-    list_filter = ('created_at',)
+    list_display = ('name', 'teacher', 'school', 'created_at')
+    list_filter = ('school', 'created_at')
+    list_select_related = ('teacher', 'school')
     search_fields = ('name', 'description')
+    autocomplete_fields = ('teacher', 'students')
 
 @admin.register(Assignment)
-class AssignmentAdmin(admin.ModelAdmin):
+class AssignmentAdmin(BulkUpdateMixin, LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('title', 'class_obj', 'due_date', 'status', 'created_at')
     list_filter = ('status', 'due_date', 'created_at')
+    list_select_related = ('class_obj',)
     search_fields = ('title', 'description')
+    autocomplete_fields = ('class_obj',)
     date_hierarchy = 'due_date'
+    actions = ('publish', 'archive')
+
+    @admin.action(description='Publish selected assignments')
+    def publish(self, request, queryset):
+        self.bulk_update(request, queryset, status='published')
+
+    @admin.action(description='Archive selected assignments')
+    def archive(self, request, queryset):
+        self.bulk_update(request, queryset, status='archived')
+
+
+class SubmissionActionForm(ActionForm):
+    grade = forms.IntegerField(required=False, min_value=0, label='Grade')
+    feedback = forms.CharField(required=False, label='Feedback')
 
 @admin.register(Submission)
-class SubmissionAdmin(admin.ModelAdmin):
+class SubmissionAdmin(BulkUpdateMixin, LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('student', 'assignment', 'submitted_at', 'grade')
-    list_filter = ('submitted_at', 'grade')
+    # No date_hierarchy: its year/month links need a DISTINCT scan of submitted_at,
+    # and a per-value grade filter would need one of grade
+    list_filter = ('submitted_at', ('grade', admin.EmptyFieldListFilter))
+    list_select_related = ('student', 'assignment')
     search_fields = ('student__username', 'assignment__title', 'feedback')
-    date_hierarchy = 'submitted_at'
+    autocomplete_fields = ('student', 'assignment')
+    action_form = SubmissionActionForm
+    actions = ('set_grade', 'set_feedback')
+
+    def _action_value(self, request, field):
+        form = self.action_form(request.POST)
+        form.fields['action'].choices = self.get_action_choices(request)
+        if form.is_valid() and form.cleaned_data[field] not in (None, ''):
+            return form.cleaned_data[field]
+        self.message_user(request, f'Enter a valid {field} to apply.', messages.ERROR)
+        return None
+
+    @admin.action(description='Set grade of selected submissions')
+    def set_grade(self, request, queryset):
+        grade = self._action_value(request, 'grade')
+        if grade is not None:
+            self.bulk_update(request, queryset, grade=grade)
+
+    @admin.action(description='Set feedback of selected submissions')
+    def set_feedback(self, request, queryset):
+        feedback = self._action_value(request, 'feedback')
+        if feedback is not None:
+            self.bulk_update(request, queryset, feedback=feedback)
+
+class MembershipInline(admin.StackedInline):
+    model = Membership
+    autocomplete_fields = ('school',)
+    can_delete = False
+
+class SchoolUserAdmin(UserAdmin):
+    inlines = (MembershipInline,)
 
-# Re-register UserAdmin with minimal customization
+# Re-register UserAdmin with the user's school
 admin.site.unregister(User)
-admin.site.register(User, UserAdmin)
+admin.site.register(User, SchoolUserAdmin)
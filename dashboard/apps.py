@@ -3,3 +3,11 @@ from django.apps import AppConfig
 class DashboardConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'dashboard'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+        from . import checks, signals
+        post_migrate.connect(signals.add_missing_fields, sender=self)
+        from django.conf import settings
+        if settings.PRODUCTION:
+            checks.log_performance_settings()
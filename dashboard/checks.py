@@ -0,0 +1,47 @@
+import logging
+
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+logger = logging.getLogger(__name__)
+
+
+def performance_settings():
+    """Return ``(name, value, ok)`` for each performance-relevant setting."""
+    database = settings.DATABASES['default']
+    cache = settings.CACHES['default']['BACKEND']
+    loaders = settings.TEMPLATES[0]['OPTIONS'].get('loaders', [])
+    cached_loader = any(isinstance(loader, (list, tuple)) and loader[0].endswith('cached.Loader')
+                        for loader in loaders)
+    return [
+        ('DEBUG', settings.DEBUG, not settings.DEBUG),
+        ('Database engine', database['ENGINE'], 'postgresql' in database['ENGINE']),
+        ('Persistent connections (CONN_MAX_AGE)', database.get('CONN_MAX_AGE', 0),
+         bool(database.get('CONN_MAX_AGE'))),
+        ('Connection health checks', database.get('CONN_HEALTH_CHECKS', False),
+         database.get('CONN_HEALTH_CHECKS', False)),
+        ('Cached template loader', cached_loader, cached_loader),
+        ('Cache backend', cache, 'locmem' not in cache and 'dummy' not in cache),
+        ('Session engine', settings.SESSION_ENGINE, 'cache' in settings.SESSION_ENGINE),
+        ('Static files storage', settings.STORAGES['staticfiles']['BACKEND'],
+         'Manifest' in settings.STORAGES['staticfiles']['BACKEND']),
+    ]
+
+
+def log_performance_settings():
+    for name, value, ok in performance_settings():
+        if ok:
+            logger.info("[ok] %s: %s", name, value)
+        else:
+            logger.warning("[--] %s: %s", name, value)
+
+
+@register(Tags.database, Tags.caches, deploy=True)
+def check_performance_settings(app_configs, **kwargs):
+    """Warn about slow defaults left on in a production deployment."""
+    return [
+        Warning(f'{name} is {value!r}', hint='See the production profile in config/settings.py',
+                id='dashboard.W001')
+        for name, value, ok in performance_settings()
+        if not ok
+    ]
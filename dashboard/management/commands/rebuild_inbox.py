@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from dashboard.models import AssignmentInbox
+from dashboard.signals import refresh_inbox
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the per-student assignment inbox from assignments, enrollments and submissions'
+
+    def handle(self, *args, **options):
+        refresh_inbox()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt inbox with {AssignmentInbox.objects.count()} rows'))
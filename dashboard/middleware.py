@@ -0,0 +1,156 @@
+from contextlib import ExitStack
+import datetime
+import hashlib
+import logging
+import time
+
+from django.contrib import messages
+from django.db import connections
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+
+from due_dates import bucket_bounds, clock_bucket
+from instrumentation import finish_request, profiler, record_cache, record_query, record_template, start_request
+from repository import django_repository
+
+from .models import DashboardItem, overdue_q, school_id_of
+
+logger = logging.getLogger(__name__)
+
+
+def user_data_version(user):
+    """Return ``(version, last_modified)`` for everything a user's pages show.
+
+    Classes, assignments and submissions come from the shared
+    :meth:`repository.Repository.data_version` query; dashboard items are
+    Django-only and added here.
+    """
+    repo = django_repository(school_id=school_id_of(user))
+    parts, last_modified = repo.data_version(user.pk)
+    if last_modified and timezone.is_naive(last_modified):
+        last_modified = timezone.make_aware(last_modified, datetime.timezone.utc)
+    # Items fall overdue without being written, so their count is part of the version
+    items = DashboardItem.objects.filter(
+        Q(owner=user) | Q(owner__is_superuser=True)
+    ).aggregate(updated=Max('updated_at'), count=Count('id'),
+                overdue=Count('id', filter=Q(owner=user) & overdue_q()))
+    # Likewise assignments in the deadline buckets, which also move at local midnight
+    now = timezone.now()
+    bounds = bucket_bounds(now, timezone.get_current_timezone())
+    # Plus a 15-minute clock bucket, as in app.py's dashboard_version, for
+    # times shown relative to now
+    version = parts + (items['updated'], items['count'], items['overdue'],
+                       repo.overdue_count(user.pk, bounds['now']), bounds['end_of_day'],
+                       *clock_bucket(now))
+    if items['updated'] and (last_modified is None or items['updated'] > last_modified):
+        last_modified = items['updated']
+    return version, last_modified
+
+
+def conditional_get(view):
+    """Opt a function view into :class:`ConditionalGetMiddleware`."""
+    view.conditional_get = True
+    return view
+
+
+class ConditionalGetMiddleware:
+    """Answer opted-in GETs with 304 before the view runs.
+
+    Views opt in with ``conditional_get = True`` (class-based views) or the
+    :func:`conditional_get` decorator. Unlike Django's own
+    ``ConditionalGetMiddleware``, the ETag is derived from the user's data
+    version rather than the rendered body, so a match skips the queries and
+    template rendering entirely. ``request.data_version`` is also exposed for
+    keying ``{% cache %}`` fragments.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        validators = getattr(request, 'data_validators', None)
+        if validators and response.status_code in (200, 304) and not response.streaming:
+            etag, last_modified = validators
+            if not response.has_header('ETag'):
+                response.headers['ETag'] = etag
+            if last_modified and not response.has_header('Last-Modified'):
+                response.headers['Last-Modified'] = http_date(last_modified.timestamp())
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ('Cookie',))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in ('GET', 'HEAD') or not request.user.is_authenticated:
+            return None
+        if not getattr(getattr(view_func, 'view_class', view_func), 'conditional_get', False):
+            return None
+
+        version, last_modified = user_data_version(request.user)
+        request.data_version = hashlib.sha1(
+            repr((request.user.pk, request.get_full_path(), version)).encode()
+        ).hexdigest()[:32]
+        etag = quote_etag(request.data_version)
+        request.data_validators = (etag, last_modified)
+
+        # Pending messages must be rendered, never short-circuited
+        if len(messages.get_messages(request)):
+            return None
+        response = get_conditional_response(
+            request, etag=etag,
+            last_modified=int(last_modified.timestamp()) if last_modified else None,
+        )
+        record_cache('conditional_get', response is not None)
+        return response
+
+
+def _time_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record_query(sql, time.perf_counter() - started)
+
+
+class InstrumentationMiddleware:
+    """Per-request DB/template/cache timing, metrics and opt-in profiling.
+
+    Should sit first in ``MIDDLEWARE`` so the totals cover the whole stack.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats, token = start_request('unmatched')
+        request._instrumentation = stats
+        status = 500
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(_time_query))
+            request._profiling = stack
+            try:
+                response = self.get_response(request)
+                status = response.status_code
+            finally:
+                finish_request(stats, token, status)
+        response.headers['Server-Timing'] = stats.server_timing()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = getattr(request, '_instrumentation', None)
+        if stats is None:
+            return None
+        match = request.resolver_match
+        stats.route = match.view_name if match and match.view_name else request.path
+        request._profiling.enter_context(profiler.sample(stats.route))
+        return None
+
+    def process_template_response(self, request, response):
+        started = time.perf_counter()
+        response.add_post_render_callback(
+            lambda rendered: record_template(time.perf_counter() - started))
+        return response
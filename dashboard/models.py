@@ -1,7 +1,29 @@
 from django.db import models
+from django.db.models import BooleanField, Case, Q, Value, When
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+from tenants import DEFAULT_SCHOOL
+
+# Items that can still become overdue; also the ``dashboard_item_open_due`` index condition
+OPEN = ~Q(status='completed')
+
+
+def overdue_q(now=None):
+    return OPEN & Q(due_date__lt=now or timezone.now())
+
+
+class DashboardItemQuerySet(models.QuerySet):
+    def overdue(self, now=None):
+        """Open items whose due date has passed."""
+        return self.filter(overdue_q(now))
+
+    def with_overdue(self, now=None):
+        """Annotate ``overdue``, which :attr:`DashboardItem.is_overdue` then reads."""
+        return self.annotate(overdue=Case(When(overdue_q(now), then=Value(True)),
+                                          default=Value(False), output_field=BooleanField()))
+
+
 class DashboardItem(models.Model):
     PRIORITY_CHOICES = [
         ('low', 'Low'),
@@ -30,18 +52,29 @@ class DashboardItem(models.Model):
     priority = models.CharField(max_length=10, choices=PRIORITY_CHOICES, default='medium')
     item_type = models.CharField(max_length=20, choices=ITEM_TYPES, default='task')
     due_date = models.DateTimeField(null=True, blank=True)
+    # Set on the reminders ``dashboard.tasks.create_assignment_reminders`` keeps
+    assignment = models.ForeignKey('Assignment', on_delete=models.CASCADE, null=True, blank=True,
+                                   related_name='reminders')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = DashboardItemQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Only open items can become overdue, so completed ones stay out of the index
+            models.Index(fields=['owner', 'due_date'], condition=OPEN, name='dashboard_item_open_due'),
+            models.Index(fields=['created_at'], name='dashboard_item_created'),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.item_type})"
 
     @property
     def is_overdue(self):
-        from django.utils import timezone
+        if 'overdue' in self.__dict__:
+            return self.overdue
         if self.due_date and self.status != 'completed':
             return self.due_date < timezone.now()
         return False
@@ -73,11 +106,34 @@ class DashboardItem(models.Model):
                 self.due_date = timezone.now() + timezone.timedelta(days=7)
         super().save(*args, **kwargs)
 
+class School(models.Model):
+    """A school sharing the database; see tenants.py."""
+    slug = models.SlugField(max_length=50, unique=True)
+    name = models.CharField(max_length=100)
+
+    def __str__(self):
+        return self.name
+
+class Membership(models.Model):
+    """The school a user belongs to; users without one are in the default school."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True,
+                                related_name='school_membership')
+    school = models.ForeignKey(School, on_delete=models.PROTECT, related_name='memberships')
+
+    def __str__(self):
+        return f"{self.user_id} in {self.school_id}"
+
+def school_id_of(user):
+    """The id of ``user``'s school; the related row is cached on the user."""
+    membership = getattr(user, 'school_membership', None)
+    return membership.school_id if membership is not None else DEFAULT_SCHOOL
+
 class Class(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     teacher = models.ForeignKey(User, on_delete=models.CASCADE, related_name='teaching_classes')
     students = models.ManyToManyField(User, related_name='enrolled_classes')
+    school = models.ForeignKey(School, on_delete=models.PROTECT, default=DEFAULT_SCHOOL, related_name='classes')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -90,6 +146,8 @@ class Class(models.Model):
 
 class Assignment(models.Model):
     class_obj = models.ForeignKey(Class, on_delete=models.CASCADE, related_name='assignments')
+    # Copied from the class on save, so school-scoped queries need no join
+    school = models.ForeignKey(School, on_delete=models.PROTECT, default=DEFAULT_SCHOOL, related_name='+')
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
     due_date = models.DateTimeField()
@@ -105,21 +163,72 @@ class Assignment(models.Model):
 
     class Meta:
         ordering = ['-due_date']
+        indexes = [
+            models.Index(fields=['due_date'], name='dashboard_assignment_due'),
+            models.Index(fields=['status', 'due_date'], name='dashboard_assignment_status'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        if self.class_obj_id is not None:
+            self.school_id = self.class_obj.school_id
+        super().save(*args, **kwargs)
+
 class Submission(models.Model):
     assignment = models.ForeignKey(Assignment, on_delete=models.CASCADE, related_name='submissions')
     student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='submissions')
+    # Copied from the assignment on save
+    school = models.ForeignKey(School, on_delete=models.PROTECT, default=DEFAULT_SCHOOL, related_name='+')
     content = models.TextField()
     submitted_at = models.DateTimeField(auto_now_add=True)
     grade = models.IntegerField(null=True, blank=True)
     feedback = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-submitted_at']
         unique_together = ['assignment', 'student']
+        indexes = [
+            # The admin changelist sorts and filters on these
+            models.Index(fields=['submitted_at'], name='dashboard_submission_at'),
+            models.Index(fields=['grade'], name='dashboard_submission_grade'),
+        ]
 
     def __str__(self):
         return f"{self.student.username}'s submission for {self.assignment.title}"
+
+    def save(self, *args, **kwargs):
+        if self.assignment_id is not None:
+            self.school_id = self.assignment.school_id
+        super().save(*args, **kwargs)
+
+class AssignmentInbox(models.Model):
+    """One row per student and published assignment in their classes (see inbox.py).
+
+    Maintained by ``dashboard/signals.py``; rebuilt with ``manage.py rebuild_inbox``.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('submitted', 'Submitted'),
+        ('late', 'Submitted late'),
+        ('graded', 'Graded'),
+    ]
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='assignment_inbox')
+    assignment = models.ForeignKey(Assignment, on_delete=models.CASCADE, related_name='inbox_entries')
+    class_obj = models.ForeignKey(Class, on_delete=models.CASCADE, related_name='+', db_column='class_id')
+    due_date = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+
+    class Meta:
+        unique_together = ['student', 'assignment']
+        indexes = [
+            models.Index(fields=['student', 'due_date'], name='dashboard_inbox_student_due'),
+            # Deadline buckets only read pending rows
+            models.Index(fields=['student', 'due_date'], condition=Q(status='pending'),
+                         name='dashboard_inbox_pending_due'),
+        ]
+
+    def __str__(self):
+        return f"{self.assignment_id} for {self.student_id}: {self.status}"
@@ -0,0 +1,101 @@
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from repository import django_repository
+from tenants import DEFAULT_SCHOOL
+from .models import Assignment, AssignmentInbox, Class, DashboardItem, School, Submission
+
+# syncdb only creates missing tables; fields added to existing ones since
+ADDED_FIELDS = [
+    (Class, 'school'),
+    (Assignment, 'school'),
+    (Submission, 'school'),
+    (Submission, 'updated_at'),
+    (DashboardItem, 'assignment'),
+]
+# ... and indexes added to their ``Meta.indexes`` since, by name
+ADDED_INDEXES = [
+    (DashboardItem, 'dashboard_item_open_due'),
+    (DashboardItem, 'dashboard_item_created'),
+    (Assignment, 'dashboard_assignment_due'),
+    (Assignment, 'dashboard_assignment_status'),
+    (Submission, 'dashboard_submission_at'),
+    (Submission, 'dashboard_submission_grade'),
+]
+
+
+def add_missing_fields(using=DEFAULT_DB_ALIAS, **kwargs):
+    """``post_migrate`` hook: create the default school, then add
+    :data:`ADDED_FIELDS` and :data:`ADDED_INDEXES` missing from existing
+    tables (their rows join the default school)."""
+    if not router.allow_migrate_model(using, School):
+        return
+    connection = connections[using]
+    _, created = School.objects.using(using).get_or_create(
+        pk=DEFAULT_SCHOOL, defaults={'slug': 'default', 'name': 'Default school'})
+    if created:
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [School]):
+                cursor.execute(sql)
+    for model, name in ADDED_FIELDS:
+        field = model._meta.get_field(name)
+        with connection.cursor() as cursor:
+            columns = {column.name for column in
+                       connection.introspection.get_table_description(cursor, model._meta.db_table)}
+        if field.column not in columns:
+            with connection.schema_editor() as editor:
+                editor.add_field(model, field)
+    for model, name in ADDED_INDEXES:
+        index = next(index for index in model._meta.indexes if index.name == name)
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+        if name not in constraints:
+            with connection.schema_editor() as editor:
+                editor.add_index(model, index)
+
+
+def refresh_inbox(**scope):
+    """Rewrite the inbox rows in ``scope`` (see ``Repository.refresh_inbox``)."""
+    using = router.db_for_write(AssignmentInbox)
+    with transaction.atomic(using=using):
+        django_repository(using=using).refresh_inbox(**scope)
+
+
+@receiver(m2m_changed, sender=Class.students.through)
+def touch_class_on_enrollment(sender, instance, action, reverse, pk_set, **kwargs):
+    """Bump ``Class.updated_at`` when enrollment changes so page validators move."""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        classes = Class.objects.filter(pk__in=pk_set) if pk_set else instance.enrolled_classes.all()
+    else:
+        classes = Class.objects.filter(pk=instance.pk)
+    classes.update(updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=Class.students.through)
+def refresh_inbox_on_enrollment(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        refresh_inbox(class_id=instance.pk)
+    elif action == 'post_clear':
+        refresh_inbox(student_id=instance.pk)
+    else:
+        for class_id in pk_set:
+            refresh_inbox(class_id=class_id, student_id=instance.pk)
+
+
+@receiver(post_save, sender=Assignment)
+def refresh_inbox_on_assignment(sender, instance, **kwargs):
+    # Publishing, archiving or moving the due date all change the rows
+    refresh_inbox(assignment_id=instance.pk)
+
+
+@receiver(post_save, sender=Submission)
+@receiver(post_delete, sender=Submission)
+def refresh_inbox_on_submission(sender, instance, **kwargs):
+    refresh_inbox(assignment_id=instance.assignment_id, student_id=instance.student_id)
@@ -0,0 +1,30 @@
+"""Django side of streaming.py: streamed pages with long listings."""
+from django.http import StreamingHttpResponse
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from streaming import CHUNK_SIZE, chunked, marker, page_parts
+
+
+def stream_page(request, template_name, context, streams, chunk_size=CHUNK_SIZE):
+    """``StreamingHttpResponse`` for ``template_name``.
+
+    ``streams`` maps a context name, which the page template outputs where
+    the listing goes, to ``(row_template, rows)``. ``rows`` -- typically a
+    ``QuerySet.iterator(chunk_size=...)`` -- is read ``chunk_size`` rows at
+    a time, and each chunk rendered with the row template, which loops over
+    ``rows``.
+    """
+    page = get_template(template_name).render(
+        {**context, **{name: mark_safe(marker(name)) for name in streams}}, request)
+
+    def generate():
+        for text, name in page_parts(page, streams):
+            yield text
+            if name is not None:
+                row_template, rows = streams[name]
+                template = get_template(row_template)
+                for chunk in chunked(rows, chunk_size):
+                    yield template.render({**context, 'rows': chunk}, request)
+
+    return StreamingHttpResponse(generate(), content_type='text/html; charset=utf-8')
@@ -0,0 +1,123 @@
+"""Background tasks for the dashboard app (see tasks.py).
+
+Workers run these with ``DJANGO_SETTINGS_MODULE=config.settings
+python -m tasks --import dashboard.tasks``.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import groupby
+
+from django.db import transaction
+from django.utils import timezone
+
+from tasks import get_queue, task
+
+SWEEP_INTERVAL = 15 * 60
+SWEEP_KEY = 'dashboard:overdue_sweep_at'
+
+
+@task(retries=5)
+def create_assignment_reminders(assignment_id):
+    """Keep one dashboard reminder per enrolled student for a published assignment.
+
+    Existing reminders follow the assignment's title and due date, students
+    who left the class lose theirs and only students without one get a new
+    one, so running it again (after an edit, or on a retry) is harmless.
+    Drafts and archived assignments are left alone.
+    """
+    from .models import Assignment, DashboardItem
+    assignment = Assignment.objects.select_related('class_obj').filter(pk=assignment_id).first()
+    if assignment is None or assignment.status != 'published':
+        return
+    values = {'title': f'{assignment.title} due',
+              'description': f'{assignment.class_obj.name}: {assignment.title}',
+              'due_date': assignment.due_date}
+    students = assignment.class_obj.students.values_list('pk', flat=True)
+    reminders = DashboardItem.objects.filter(assignment=assignment, item_type='reminder')
+    reminders.exclude(owner_id__in=students).delete()
+    reminders.exclude(**values).update(**stamped(DashboardItem, values))
+    DashboardItem.objects.bulk_create([
+        DashboardItem(owner_id=student_id, assignment=assignment, item_type='reminder', **values)
+        for student_id in students.exclude(pk__in=reminders.values('owner_id'))
+    ], batch_size=500)
+
+
+def remind_on_commit(assignment_ids):
+    """Queue :func:`create_assignment_reminders` for ``assignment_ids`` once
+    the current transaction commits."""
+    for assignment_id in assignment_ids:
+        transaction.on_commit(lambda assignment_id=assignment_id: create_assignment_reminders.delay(assignment_id))
+
+
+def _reminder(owner, items):
+    from django.core.mail import EmailMessage
+    lines = [f'- {item.title} (due {timezone.localtime(item.due_date):%b %d, %H:%M})' for item in items]
+    return EmailMessage(f'{len(items)} dashboard item(s) overdue',
+                        f'Hi {owner.username},\n\nThese items are now overdue:\n' + '\n'.join(lines),
+                        to=[owner.email])
+
+
+@task(every=SWEEP_INTERVAL, concurrency=1)
+def sweep_overdue_items(batch_size=500):
+    """Email owners about items that fell overdue since the last sweep.
+
+    Items are streamed in owner order and the emails sent ``batch_size`` at a
+    time over one connection. The time of the last sweep is kept in the task
+    queue file, not a per-process cache, so a restarted or different worker
+    neither repeats nor skips emails.
+    """
+    from django.core.mail import get_connection
+    from .models import DashboardItem
+    queue = get_queue()
+    now = timezone.now()
+    last = queue.get_mark(SWEEP_KEY)
+    since = (datetime.fromtimestamp(last, dt_timezone.utc) if last is not None
+             else now - timedelta(seconds=SWEEP_INTERVAL))
+    items = (DashboardItem.objects.overdue(now).filter(due_date__gte=since)
+             .exclude(owner__email='').select_related('owner')
+             .only('title', 'due_date', 'owner__username', 'owner__email')
+             .order_by('owner_id', 'due_date'))
+
+    connection = get_connection()
+    batch = []
+    for owner, owner_items in groupby(items.iterator(chunk_size=batch_size), key=lambda item: item.owner):
+        batch.append(_reminder(owner, list(owner_items)))
+        if len(batch) >= batch_size:
+            connection.send_messages(batch)
+            batch = []
+    if batch:
+        connection.send_messages(batch)
+    queue.set_mark(SWEEP_KEY, now.timestamp())
+
+
+def stamped(model, values):
+    """``values`` plus ``updated_at``, which ``QuerySet.update`` does not set."""
+    if any(field.name == 'updated_at' for field in model._meta.concrete_fields):
+        return {**values, 'updated_at': timezone.now()}
+    return values
+
+
+def update_queryset(queryset, values):
+    """``queryset.update(**values)``, then refresh the assignment inbox rows it
+    changes, since ``QuerySet.update`` sends no signals."""
+    from .models import Assignment, Submission
+    from .signals import refresh_inbox
+    model = queryset.model
+    assignment_ids = []
+    if model is Assignment:
+        assignment_ids = list(queryset.order_by().values_list('pk', flat=True))
+    elif model is Submission and 'grade' in values:
+        assignment_ids = list(queryset.order_by().values_list('assignment_id', flat=True).distinct())
+    updated = queryset.update(**stamped(model, values))
+    for assignment_id in assignment_ids:
+        refresh_inbox(assignment_id=assignment_id)
+    if model is Assignment and {'status', 'title', 'due_date'} & values.keys():
+        remind_on_commit(assignment_ids)
+    return updated
+
+
+@task(retries=3)
+def bulk_update(model, pks, values):
+    """One ``UPDATE`` of ``values`` over ``pks`` of ``model`` (an ``app_label.Model`` label)."""
+    from django.apps import apps
+    model_class = apps.get_model(model)
+    update_queryset(model_class.objects.filter(pk__in=pks), values)
@@ -0,0 +1,25 @@
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+from django.utils.html import format_html_join
+
+register = template.Library()
+
+
+@register.simple_tag
+def asset_bundle(name):
+    """Emit tags for a ``STATIC_BUNDLES`` entry.
+
+    In DEBUG every source file is linked individually so edits show up without
+    a rebuild; otherwise the single hashed bundle built by ``build_assets`` is
+    used.
+    """
+    if settings.DEBUG:
+        files = settings.STATIC_BUNDLES[name]
+    else:
+        files = [name]
+    if name.endswith('.css'):
+        return format_html_join('\n', '<link rel="stylesheet" href="{}">',
+                                ((static(path),) for path in files))
+    return format_html_join('\n', '<script src="{}" defer></script>',
+                            ((static(path),) for path in files))
@@ -25,8 +25,11 @@ urlpatterns = [
     path('classes/<int:pk>/edit/', views.ClassUpdateView.as_view(), name='class_edit'),
     path('classes/<int:pk>/delete/', views.ClassDeleteView.as_view(), name='class_delete'),
     path('classes/<int:pk>/students/', views.ClassStudentsView.as_view(), name='class_students'),
+    path('classes/<int:pk>/gradebook/', views.ClassGradebookView.as_view(), name='class_gradebook'),
+    path('classes/<int:pk>/students/search/', views.ClassStudentSearchView.as_view(), name='search_students'),
     path('classes/<int:pk>/students/add/', views.AddStudentToClassView.as_view(), name='add_student_to_class'),
     path('classes/<int:pk>/students/remove/', views.RemoveStudentFromClassView.as_view(), name='remove_student_from_class'),
+    path('classes/<int:pk>/grade-stats/', views.grade_stats_view, name='class_grade_stats'),
     
     # Assignment URLs
     path('assignments/', views.AssignmentListView.as_view(), name='assignment_list'),
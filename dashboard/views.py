@@ -1,14 +1,24 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import require_http_methods
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, DetailView, TemplateView
 from django.urls import reverse_lazy
 from django.contrib import messages
+from django.core.exceptions import PermissionDenied
 from django.views import View
 from django.contrib.auth.models import User
+from django.db.models import Q
 from django.utils import timezone
 from .forms import RegistrationForm, DashboardItemForm, ClassForm, AssignmentForm
-from .models import DashboardItem, Class, Assignment, Submission
+from .models import DashboardItem, Class, Assignment, Submission, school_id_of
+from instrumentation import metrics, metrics_authorized, profiler
+from due_dates import bucket_bounds, group_deadlines
+from repository import django_repository
+from streaming import CHUNK_SIZE, gradebook_rows
+from tenants import DEFAULT_SCHOOL
+from .streaming import stream_page
 
 class RegistrationView(View):
     template_name = 'auth/register.html'
@@ -27,6 +37,7 @@ class RegistrationView(View):
 
 class DashboardView(LoginRequiredMixin, TemplateView):
     template_name = 'dashboard/index.html'
+    conditional_get = True
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -35,6 +46,9 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         # Common data for both roles
         context['username'] = user.username
         context['dashboard_items'] = DashboardItem.objects.filter(owner=user)[:5]
+        overdue = DashboardItem.objects.filter(owner=user).overdue()
+        context['overdue_items'] = overdue.order_by('due_date')[:5]
+        context['overdue_count'] = overdue.count()
         
         if hasattr(user, 'userprofile'):
             context['role'] = user.userprofile.role
@@ -44,12 +58,9 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         if context['role'] == 'teacher':
             # Teacher-specific data
             context['classes'] = Class.objects.filter(teacher=user)
-            context['total_students'] = User.objects.filter(
-                enrolled_classes__teacher=user
-            ).distinct().count()
-            context['total_assignments'] = Assignment.objects.filter(
-                class_obj__teacher=user
-            ).count()
+            stats = django_repository(school_id=school_id_of(user)).teacher_stats(user.pk)
+            context['total_students'] = stats['total_students']
+            context['total_assignments'] = stats['total_assignments']
             context['recent_assignments'] = Assignment.objects.filter(
                 class_obj__teacher=user
             ).order_by('-created_at')[:5]
@@ -60,9 +71,12 @@ class DashboardView(LoginRequiredMixin, TemplateView):
             # Student-specific data
             context['enrolled_classes'] = Class.objects.filter(students=user)
             context['upcoming_assignments'] = Assignment.objects.filter(
-                class_obj__students=user,
-                due_date__gte=timezone.now()
-            ).order_by('due_date')[:5]
+                inbox_entries__student=user,
+                inbox_entries__due_date__gte=timezone.now()
+            ).order_by('inbox_entries__due_date')[:5]
+            bounds = bucket_bounds(timezone.now(), timezone.get_current_timezone())
+            context['deadlines'] = group_deadlines(
+                django_repository(school_id=school_id_of(user)).deadlines(user.pk, **bounds), aware=True)
             context['recent_grades'] = Submission.objects.filter(
                 student=user
             ).exclude(grade=None).order_by('-submitted_at')[:5]
@@ -75,6 +89,7 @@ class DashboardView(LoginRequiredMixin, TemplateView):
 
 class DashboardItemListView(LoginRequiredMixin, ListView):
     model = DashboardItem
+    conditional_get = True
     template_name = 'dashboard/item_list.html'
     context_object_name = 'items'
 
@@ -133,9 +148,36 @@ def dashboard(request):
     }
     return render(request, 'dashboard/index.html', context)
 
+@login_required
+def grade_stats_view(request, pk):
+    """Grade distribution of a class as JSON (see analytics.py)."""
+    from analytics import class_grade_stats
+    class_obj = get_object_or_404(Class, pk=pk, teacher=request.user)
+    return JsonResponse(class_grade_stats(django_repository(school_id=class_obj.school_id), pk))
+
+def metrics_view(request):
+    """Prometheus metrics, for staff or scrapers presenting ``METRICS_TOKEN``."""
+    if not (request.user.is_staff or metrics_authorized(request.headers.get('Authorization'))):
+        raise PermissionDenied
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4')
+
+@user_passes_test(lambda user: user.is_staff)
+@require_http_methods(['GET', 'POST'])
+def profile_view(request):
+    """Toggle the sampling profiler for a route (POST) or read its collapsed stacks."""
+    route = request.POST.get('route') or request.GET.get('route', '')
+    if request.method == 'POST':
+        if request.POST.get('enabled', '1') in ('1', 'true', 'on'):
+            profiler.enable(route)
+        else:
+            profiler.disable(route)
+        return JsonResponse({'enabled_routes': profiler.enabled_routes()})
+    return HttpResponse(profiler.collapsed(route), content_type='text/plain')
+
 # Class Views
 class ClassListView(LoginRequiredMixin, ListView):
     model = Class
+    conditional_get = True
     template_name = 'classes/list.html'
     context_object_name = 'classes'
 
@@ -150,6 +192,7 @@ class ClassCreateView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         form.instance.teacher = self.request.user
+        form.instance.school_id = school_id_of(self.request.user)
         messages.success(self.request, 'Class created successfully!')
         return super().form_valid(form)
 
@@ -189,13 +232,14 @@ class ClassDetailView(LoginRequiredMixin, DetailView):
 # Assignment Views
 class AssignmentListView(LoginRequiredMixin, ListView):
     model = Assignment
+    conditional_get = True
     template_name = 'assignments/list.html'
     context_object_name = 'assignments'
 
     def get_queryset(self):
         if self.request.user.has_perm('dashboard.view_assignment'):
             return Assignment.objects.filter(class_obj__teacher=self.request.user)
-        return Assignment.objects.filter(class_obj__students=self.request.user)
+        return Assignment.objects.filter(inbox_entries__student=self.request.user)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -217,7 +261,12 @@ class AssignmentCreateView(LoginRequiredMixin, CreateView):
     def form_valid(self, form):
         form.instance.teacher = self.request.user
         messages.success(self.request, 'Assignment created successfully!')
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        # Fan out to the class's students once a published assignment is committed
+        if self.object.status == 'published':
+            from .tasks import remind_on_commit
+            remind_on_commit([self.object.pk])
+        return response
 
 class AssignmentUpdateView(LoginRequiredMixin, UpdateView):
     model = Assignment
@@ -236,7 +285,13 @@ class AssignmentUpdateView(LoginRequiredMixin, UpdateView):
 
     def form_valid(self, form):
         messages.success(self.request, 'Assignment updated successfully!')
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        # Publishing adds the students' reminders; a new title, due date or
+        # class updates them
+        if self.object.status == 'published' and {'status', 'title', 'due_date', 'class_obj'} & set(form.changed_data):
+            from .tasks import remind_on_commit
+            remind_on_commit([self.object.pk])
+        return response
 
 class AssignmentDeleteView(LoginRequiredMixin, DeleteView):
     model = Assignment
@@ -263,27 +318,71 @@ class AssignmentDetailView(LoginRequiredMixin, DetailView):
 
     def get_queryset(self):
         return Assignment.objects.filter(class_obj__teacher=self.request.user)
-class ClassStudentsView(LoginRequiredMixin, DetailView):
-    model = Class
-    template_name = 'classes/students.html'
-    context_object_name = 'class'
-
-    def get_queryset(self):
-        return Class.objects.filter(teacher=self.request.user)
+class ClassStudentsView(LoginRequiredMixin, View):
+    """Roster, streamed (see streaming.py) so very large classes never sit
+    in memory. The add-student picker searches ``ClassStudentSearchView``."""
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['enrolled_students'] = self.object.students.all()
-        context['available_students'] = User.objects.filter(groups__name='Student').exclude(
-            id__in=self.object.students.values_list('id', flat=True)
+    def get(self, request, pk):
+        class_obj = get_object_or_404(Class, pk=pk, teacher=request.user)
+        enrolled = class_obj.students.order_by('username', 'pk').only('username', 'email', 'date_joined')
+        return stream_page(request, 'classes/students.html', {
+            'class_obj': class_obj,
+            'enrolled_count': enrolled.count(),
+        }, {
+            'enrolled_students': ('classes/_student_rows.html', enrolled.iterator(chunk_size=CHUNK_SIZE)),
+        })
+
+class ClassStudentSearchView(LoginRequiredMixin, View):
+    """Autocomplete for the add-student picker (see student_search.py)."""
+
+    def get(self, request, pk):
+        from student_search import LIMIT, search_students
+        class_obj = get_object_or_404(Class, pk=pk, teacher=request.user)
+        try:
+            limit = int(request.GET.get('limit', LIMIT))
+        except ValueError:
+            limit = LIMIT
+        results = search_students(django_repository(school_id=class_obj.school_id), request.GET.get('q', ''),
+                                  class_id=class_obj.pk, limit=limit)
+        return JsonResponse({'results': results})
+
+class ClassGradebookView(LoginRequiredMixin, View):
+    """Students by assignments grid of a class, streamed a chunk of students
+    at a time from two cursors merged by ``gradebook_rows``."""
+
+    def get(self, request, pk):
+        class_obj = get_object_or_404(Class, pk=pk, teacher=request.user)
+        assignments = list(class_obj.assignments.order_by('due_date', 'pk').only('title', 'due_date'))
+        # Both cursors in id order: the merge compares keys in Python, which
+        # would not agree with a database collation on usernames
+        students = class_obj.students.order_by('pk').only('username')
+        grades = Submission.objects.filter(assignment__class_obj=class_obj).order_by(
+            'student_id'
+        ).values_list('student_id', 'assignment_id', 'grade')
+        rows = gradebook_rows(
+            students.iterator(chunk_size=CHUNK_SIZE),
+            grades.iterator(chunk_size=CHUNK_SIZE),
+            [assignment.pk for assignment in assignments],
+            key=lambda student: student.pk,
         )
-        return context
+        return stream_page(request, 'classes/gradebook.html', {
+            'class_obj': class_obj,
+            'assignments': assignments,
+        }, {
+            'gradebook_rows': ('classes/_gradebook_rows.html', rows),
+        })
 class AddStudentToClassView(LoginRequiredMixin, View):
     def post(self, request, pk):
         class_obj = get_object_or_404(Class, pk=pk, teacher=request.user)
         student_id = request.POST.get('student_id')
         if student_id:
-            student = get_object_or_404(User, pk=student_id)
+            # Only students of the class's own school
+            students = User.objects.filter(pk=student_id)
+            if class_obj.school_id == DEFAULT_SCHOOL:
+                students = students.filter(Q(school_membership=None) | Q(school_membership__school=DEFAULT_SCHOOL))
+            else:
+                students = students.filter(school_membership__school=class_obj.school_id)
+            student = get_object_or_404(students)
             class_obj.students.add(student)
             messages.success(request, f'{student.username} has been added to {class_obj.name}')
         return redirect('dashboard:class_students', pk=pk)
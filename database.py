@@ -1,5 +1,12 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import DeclarativeBase
+from dbpool import prewarm_engine
+from instrumentation import instrument_sqlalchemy
+import replicas
+from repository import ORM_SCHEMA, Repository
 import logging
 
 logger = logging.getLogger(__name__)
@@ -9,26 +16,98 @@ class Base(DeclarativeBase):
 
 db = SQLAlchemy(model_class=Base)
 
-def init_db(app):
-    """Initialize the database and verify connection."""
+# Bump whenever the models or index_statements change
+SCHEMA_VERSION = 7
+
+# create_all only creates missing tables; columns added to existing ones since
+ADDED_COLUMNS = [
+    ('user_profile', 'timezone', "VARCHAR(64) NOT NULL DEFAULT 'UTC'"),
+    # Existing rows belong to the default school (tenants.DEFAULT_SCHOOL)
+    ('user', 'school_id', "INTEGER NOT NULL DEFAULT 1"),
+    ('class', 'school_id', "INTEGER NOT NULL DEFAULT 1"),
+    ('class_students', 'school_id', "INTEGER NOT NULL DEFAULT 1"),
+    ('assignment', 'school_id', "INTEGER NOT NULL DEFAULT 1"),
+    ('submission', 'school_id', "INTEGER NOT NULL DEFAULT 1"),
+]
+
+def schema_is_current():
+    try:
+        version = db.session.execute(db.text("SELECT version FROM schema_version")).scalar()
+    except SQLAlchemyError:
+        db.session.rollback()
+        return False
+    return version == SCHEMA_VERSION
+
+def add_missing_columns():
+    inspector = inspect(db.engine)
+    quote = db.engine.dialect.identifier_preparer.quote
+    for table, column, definition in ADDED_COLUMNS:
+        if column not in {existing['name'] for existing in inspector.get_columns(table)}:
+            db.session.execute(db.text(f"ALTER TABLE {quote(table)} ADD COLUMN {column} {definition}"))
+            if db.metadata.tables[table].c[column].index:
+                db.session.execute(db.text(f"CREATE INDEX ix_{table}_{column} ON {quote(table)} ({column})"))
+
+def add_default_school():
+    """The school that rows without one belong to (see tenants.py)."""
+    from models import School
+    from tenants import DEFAULT_SCHOOL
+    if db.session.get(School, DEFAULT_SCHOOL) is None:
+        db.session.add(School(id=DEFAULT_SCHOOL, slug='default', name='Default school'))
+        db.session.flush()
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(db.text(
+                "SELECT setval(pg_get_serial_sequence('school', 'id'), (SELECT MAX(id) FROM school))"))
+
+def configure_replica(app):
+    """Add a ``replica`` bind pointing at PGREPLICA_HOST, if configured."""
+    settings = replicas.replica_settings()
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    if settings is None or replicas.REPLICA_ALIAS in binds:
+        return
+    host, port = settings
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI']).set(
+        host=host, port=int(port) if port else None)
+    binds[replicas.REPLICA_ALIAS] = url.render_as_string(hide_password=False)
+
+def init_db(app, prewarm=True):
+    """Initialize the database, skipping DDL when the schema is current.
+
+    The connection pool is then filled on a background thread so the first
+    requests do not pay for connecting.
+    """
     try:
         # Initialize the database
+        configure_replica(app)
         db.init_app(app)
+        if replicas.REPLICA_ALIAS in app.config['SQLALCHEMY_BINDS']:
+            replicas.init_flask(app)
         
         with app.app_context():
-            # Test database connection
-            result = db.session.execute('SELECT 1')
-            result.scalar()
-            logger.info("Database connection verified successfully")
-            
-            # Create all tables
-            db.create_all()
-            logger.info("Database tables created successfully")
+            instrument_sqlalchemy(db.engine)
+            if schema_is_current():
+                logger.debug("Schema version %s is current, skipping DDL", SCHEMA_VERSION)
+            else:
+                # Create all tables
+                db.create_all()
+                add_default_school()
+                add_missing_columns()
+                repo = Repository(None, ORM_SCHEMA)
+                for statement in repo.index_statements() + repo.risk_table_statements():
+                    db.session.execute(db.text(statement))
+                db.session.execute(db.text(
+                    "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+                db.session.execute(db.text("DELETE FROM schema_version"))
+                db.session.execute(db.text("INSERT INTO schema_version (version) VALUES (:version)"),
+                                   {'version': SCHEMA_VERSION})
+                db.session.commit()
+                logger.info("Database tables created successfully")
+            if prewarm:
+                for engine in db.engines.values():
+                    prewarm_engine(engine)
             
             return True
     except Exception as e:
-        logger.error(f"Database initialization failed: {str(e)}")
-        logger.exception(e)  # Log the full stack trace
+        logger.exception("Database initialization failed: %s", e)
         raise
     finally:
         try:
@@ -0,0 +1,116 @@
+"""Connection reuse and start-up warm-up.
+
+:class:`ConnectionPool` keeps idle psycopg2 connections for ``app.py``.
+Connections are checked out with :meth:`ConnectionPool.get`, and callers
+keep calling ``conn.close()`` as before: :func:`pooled` makes ``close()``
+hand the connection back instead of disconnecting.
+
+Both :meth:`ConnectionPool.prewarm` and :func:`prewarm_engine` open
+connections on a background thread, so the TCP/TLS/auth handshakes happen
+while the process is still starting rather than on the first request.
+"""
+from collections import deque
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def pooled(connection_class):
+    """Subclass a psycopg2 connection class so ``close()`` returns it to its pool."""
+    class PooledConnection(connection_class):
+        pool = None
+
+        def close(self):
+            if self.pool is None or not self.pool.put(self):
+                super().close()
+
+    return PooledConnection
+
+
+class ConnectionPool:
+    def __init__(self, connect, max_idle=10, setup=None):
+        self.connect = connect
+        self.max_idle = max_idle
+        self.setup = setup
+        self._idle = deque()
+        self._lock = threading.Lock()
+
+    def get(self):
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                break
+            if not conn.closed:
+                return conn
+        conn = self.connect()
+        conn.pool = self
+        if self.setup:
+            self.setup(conn)
+        return conn
+
+    def put(self, conn):
+        """Keep ``conn`` for reuse; ``False`` means the caller should close it."""
+        import psycopg2.extensions
+        if conn.closed:
+            return False
+        if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except Exception:
+                return False
+        with self._lock:
+            if len(self._idle) >= self.max_idle:
+                return False
+            self._idle.append(conn)
+        return True
+
+    def clear(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn in idle:
+            conn.pool = None
+            conn.close()
+
+    def prewarm(self, count=2, background=True):
+        """Open ``count`` connections ahead of the first request."""
+        def warm():
+            try:
+                conns = [self.get() for _ in range(count)]
+            except Exception as e:
+                logger.warning("Connection pre-warm failed: %s", e)
+                return
+            for conn in conns:
+                conn.close()
+            logger.debug("Pre-warmed %d database connections", count)
+
+        if not background:
+            warm()
+            return None
+        thread = threading.Thread(target=warm, name='db-prewarm', daemon=True)
+        thread.start()
+        return thread
+
+
+def prewarm_engine(engine, count=None, background=True):
+    """Fill a SQLAlchemy engine's pool (``pool_size`` connections by default)."""
+    def warm():
+        size = count or getattr(engine.pool, 'size', lambda: 1)()
+        conns = []
+        try:
+            for _ in range(size):
+                conns.append(engine.connect())
+        except Exception as e:
+            logger.warning("Connection pre-warm failed: %s", e)
+        finally:
+            for conn in conns:
+                conn.close()
+        logger.debug("Pre-warmed %d database connections", len(conns))
+
+    if not background:
+        warm()
+        return None
+    thread = threading.Thread(target=warm, name='db-prewarm', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,91 @@
+"""Due dates: parsing, UTC storage and deadline buckets.
+
+Due dates are entered in the user's local time, parsed once and stored as
+UTC: naive UTC in the Flask-SQLAlchemy models, aware UTC in Django
+(``USE_TZ``). Everything that compares against "now" uses :func:`utcnow`
+rather than the server's local clock.
+
+A student's deadline widget splits pending assignments into ``overdue``,
+``today`` and ``this_week``. The bucket edges depend on the student's time
+zone (where their day and week end), so :func:`bucket_bounds` turns them
+into UTC instants once per request. :meth:`repository.Repository.deadlines`
+then reads every bucket with one range scan of the pending rows of the
+assignment inbox (see inbox.py) instead of comparing each row in a template.
+"""
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError, available_timezones
+
+BUCKETS = (('overdue', 'Overdue'), ('today', 'Due today'), ('this_week', 'Due this week'))
+
+
+def utcnow():
+    """The current time as naive UTC, the way the Flask models store it."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def clock_bucket(now, minutes=15):
+    """The ``minutes``-long slot of the day ``now`` falls in, as ``(hour,
+    slot)``; page validators include it so pages showing times relative to
+    now (sessions starting soon, overdue items) are re-rendered as it moves."""
+    return now.strftime('%Y%m%d%H'), now.minute // minutes
+
+
+def get_zone(name):
+    """``ZoneInfo`` for ``name``, falling back to UTC for unknown names."""
+    try:
+        return ZoneInfo(name or 'UTC')
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo('UTC')
+
+
+def timezone_choices():
+    return [(name, name.replace('_', ' ')) for name in sorted(available_timezones())]
+
+
+def to_utc(value, zone='UTC'):
+    """Naive UTC for a datetime or ISO 8601 string.
+
+    Naive input is local time in ``zone`` (a name or tzinfo); aware input
+    keeps its own offset.
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.strip())
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=get_zone(zone) if isinstance(zone, str) else zone)
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def to_local(value, zone='UTC'):
+    """Naive wall-clock time in ``zone`` for naive UTC or aware ``value``,
+    for comparing with local times such as weekly schedule slots."""
+    zone = get_zone(zone) if isinstance(zone, str) else zone
+    return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).astimezone(zone).replace(tzinfo=None)
+
+
+def bucket_bounds(now, zone='UTC'):
+    """Naive UTC edges of the deadline buckets for a user in ``zone``.
+
+    ``overdue`` ends at ``now``, ``today`` at the user's next local
+    midnight and ``this_week`` at the end of their Sunday.
+    """
+    zone = get_zone(zone) if isinstance(zone, str) else zone
+    local = (now if now.tzinfo else now.replace(tzinfo=timezone.utc)).astimezone(zone)
+    tomorrow = local.date() + timedelta(days=1)
+    next_week = local.date() + timedelta(days=7 - local.weekday())
+    return {
+        'now': to_utc(local),
+        'end_of_day': to_utc(datetime.combine(tomorrow, time()), zone),
+        'end_of_week': to_utc(datetime.combine(next_week, time()), zone),
+    }
+
+
+def group_deadlines(rows, aware=False):
+    """Rows from ``Repository.deadlines`` as ``[{'name', 'label', 'items'}]``,
+    skipping empty buckets; ``aware`` marks the due dates as UTC for Django."""
+    grouped = {name: [] for name, _ in BUCKETS}
+    for row in rows:
+        if aware:
+            row['due_date'] = row['due_date'].replace(tzinfo=timezone.utc)
+        grouped[row['bucket']].append(row)
+    return [{'name': name, 'label': label, 'items': grouped[name]}
+            for name, label in BUCKETS if grouped[name]]
@@ -1,7 +1,8 @@
 from flask_wtf import FlaskForm
 from wtforms import (StringField, TextAreaField, SelectField, PasswordField, 
-                    EmailField, DateTimeField, FileField)
-from wtforms.validators import DataRequired, Email, Length
+                    EmailField, DateTimeField, DateTimeLocalField, FileField)
+from wtforms.validators import DataRequired, Email, Length, Optional
+from due_dates import timezone_choices
 
 class LoginForm(FlaskForm):
     email = EmailField('Email', validators=[DataRequired(), Email()])
@@ -18,6 +19,7 @@ class RegistrationForm(FlaskForm):
 
 class ProfileForm(FlaskForm):
     bio = TextAreaField('Bio', validators=[Length(max=500)])
+    timezone = SelectField('Time Zone', choices=timezone_choices(), default='UTC')
 
 class ClassForm(FlaskForm):
     name = StringField('Class Name', validators=[DataRequired(), Length(max=100)])
@@ -26,7 +28,8 @@ class ClassForm(FlaskForm):
 class AssignmentForm(FlaskForm):
     title = StringField('Title', validators=[DataRequired(), Length(max=200)])
     description = TextAreaField('Description')
-    due_date = StringField('Due Date', validators=[DataRequired()])
+    # Local time of the teacher's profile time zone; routes store it as UTC
+    due_date = DateTimeLocalField('Due Date', format='%Y-%m-%dT%H:%M', validators=[DataRequired()])
     file = FileField('Assignment File')
 
 class SubmissionForm(FlaskForm):
@@ -55,3 +58,4 @@ class ScheduleForm(FlaskForm):
     ], validators=[DataRequired()])
     start_time = StringField('Start Time', validators=[DataRequired()])
     end_time = StringField('End Time', validators=[DataRequired()])
+    room = StringField('Room', validators=[Optional(), Length(max=50)])
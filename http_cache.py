@@ -0,0 +1,77 @@
+"""Conditional GET support for the Flask views.
+
+Views opt in with :func:`conditional`, passing a cheap validator function that
+returns the per-user data version (``(parts, last_modified)``). When the
+client already holds that version the view is not run at all and a 304 is
+returned, so neither the view's queries nor template rendering happen.
+"""
+from datetime import timezone
+from functools import wraps
+import hashlib
+import logging
+
+from flask import current_app, make_response, request, session
+
+from instrumentation import record_cache
+
+logger = logging.getLogger(__name__)
+
+
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:32]
+
+
+def _as_http_date(value):
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.replace(microsecond=0)
+
+
+def is_not_modified(etag, last_modified):
+    """Evaluate ``If-None-Match`` / ``If-Modified-Since`` for the current request."""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    return bool(last_modified and request.if_modified_since and
+                request.if_modified_since >= last_modified)
+
+
+def conditional(validator):
+    """Answer GET/HEAD requests with 304 when ``validator()`` is unchanged.
+
+    ``validator`` returns ``(parts, last_modified)`` or ``None`` to skip
+    caching. The ETag covers the user, the URL and ``parts``; responses are
+    marked ``private, no-cache`` so browsers revalidate on each navigation.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            # Pending flash messages must be rendered, never short-circuited
+            if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                return view(*args, **kwargs)
+            version = validator()
+            if version is None:
+                return view(*args, **kwargs)
+            parts, last_modified = version
+            etag = make_etag(session.get('user_id') or session.get('_user_id'),
+                             request.full_path, parts)
+            last_modified = _as_http_date(last_modified)
+
+            not_modified = is_not_modified(etag, last_modified)
+            record_cache('conditional_get', not_modified)
+            if not_modified:
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response
+        return wrapped
+    return decorator
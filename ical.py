@@ -0,0 +1,167 @@
+"""iCalendar (RFC 5545) rendering and per-user feed caching.
+
+Calendar clients poll feeds every few minutes, so a feed is kept in memory as
+a map of pre-rendered ``VEVENT`` blocks. A poll whose classes have not been
+touched since the feed was built is answered from memory (usually with a 304)
+without touching the database; after a change only the rows whose
+``updated_at`` moved are re-rendered.
+"""
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta, timezone
+import hashlib
+import threading
+import time
+import logging
+
+from instrumentation import record_cache
+from timetable import DAYS, to_minutes
+
+logger = logging.getLogger(__name__)
+
+PRODID = '-//EduDash//Class Calendar//EN'
+ICAL_DAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+
+
+def escape_text(value):
+    return (str(value or '').replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def fold_line(line):
+    """Fold a content line to 75 octets as required by RFC 5545."""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line
+    parts = []
+    while len(encoded) > 75:
+        cut = 75 if not parts else 74
+        while cut and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+    parts.append(encoded.decode('utf-8'))
+    return '\r\n '.join(parts)
+
+
+def format_dt(value, utc=False):
+    """A DATE-TIME value: floating local time, or with ``utc`` a UTC time
+    ending in ``Z``. Naive values given with ``utc`` are already UTC."""
+    if not utc:
+        return value.strftime('%Y%m%dT%H%M%S')
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.strftime('%Y%m%dT%H%M%SZ')
+
+
+def _event(uid, stamp, props):
+    # RFC 5545 requires DTSTAMP in UTC
+    lines = ['BEGIN:VEVENT', f'UID:{uid}', f'DTSTAMP:{format_dt(stamp, utc=True)}']
+    lines.extend(props)
+    lines.append('END:VEVENT')
+    return '\r\n'.join(fold_line(line) for line in lines) + '\r\n'
+
+
+def schedule_event(row, host):
+    """Render a weekly recurring event for a ``schedules`` row."""
+    anchor = (row.get('created_at') or datetime.now()).date()
+    anchor += timedelta(days=(DAYS.index(row['day_of_week']) - anchor.weekday()) % 7)
+    start = datetime.combine(anchor, datetime.min.time()) + timedelta(minutes=to_minutes(row['start_time']))
+    end = datetime.combine(anchor, datetime.min.time()) + timedelta(minutes=to_minutes(row['end_time']))
+    props = [
+        f'SUMMARY:{escape_text(row["class_name"])}',
+        f'DTSTART:{format_dt(start)}',
+        f'DTEND:{format_dt(end)}',
+        f'RRULE:FREQ=WEEKLY;BYDAY={ICAL_DAYS[DAYS.index(row["day_of_week"])]}',
+    ]
+    if row.get('room'):
+        props.append(f'LOCATION:{escape_text(row["room"])}')
+    return _event(f'schedule-{row["id"]}@{host}', row['updated_at'], props)
+
+
+def assignment_event(row, host):
+    """Render an event at an assignment's due date, which is stored as UTC."""
+    props = [
+        f'SUMMARY:{escape_text(row["title"])} due ({escape_text(row["class_name"])})',
+        f'DTSTART:{format_dt(row["due_date"], utc=True)}',
+        f'DTEND:{format_dt(row["due_date"], utc=True)}',
+    ]
+    if row.get('description'):
+        props.append(f'DESCRIPTION:{escape_text(row["description"])}')
+    return _event(f'assignment-{row["id"]}@{host}', row['updated_at'], props)
+
+
+class CalendarFeed:
+    """A rendered feed plus the validators and versions it was built from."""
+
+    def __init__(self, user_id, class_ids, versions, events, last_modified):
+        # ``events`` maps a UID to ``(updated_at, rendered VEVENT)``
+        self.user_id = user_id
+        self.class_ids = tuple(sorted(class_ids))
+        self.versions = versions
+        self.events = events
+        self.last_modified = last_modified
+        self.checked_at = time.monotonic()
+        digest = hashlib.sha1(repr((user_id, self.class_ids, last_modified,
+                                    sorted(events))).encode()).hexdigest()
+        self.etag = digest[:32]
+        self._body = None
+
+    @property
+    def body(self):
+        if self._body is None:
+            self._body = ''.join([
+                'BEGIN:VCALENDAR\r\n', 'VERSION:2.0\r\n', f'PRODID:{PRODID}\r\n',
+                'CALSCALE:GREGORIAN\r\n', *(text for _, text in self.events.values()),
+                'END:VCALENDAR\r\n',
+            ])
+        return self._body
+
+
+class FeedCache:
+    """In-process LRU of per-user feeds with class/user change counters.
+
+    Write paths call :meth:`touch_class` / :meth:`touch_user`; a cached feed is
+    served without a database round trip until one of its counters moves or
+    ``ttl`` seconds pass (the TTL bounds staleness across worker processes).
+    """
+
+    def __init__(self, ttl=300, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._class_versions = defaultdict(int)
+        self._user_versions = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def touch_class(self, class_id):
+        with self._lock:
+            self._class_versions[class_id] += 1
+
+    def touch_user(self, user_id):
+        with self._lock:
+            self._user_versions[user_id] += 1
+
+    def versions_for(self, user_id, class_ids):
+        with self._lock:
+            return (self._user_versions[user_id],
+                    tuple(self._class_versions[class_id] for class_id in sorted(class_ids)))
+
+    def get(self, user_id):
+        """Return ``(feed, fresh)``; stale feeds are still returned for reuse."""
+        with self._lock:
+            feed = self._entries.get(user_id)
+            if feed is None:
+                record_cache('calendar_feed', False)
+                return None, False
+            self._entries.move_to_end(user_id)
+        fresh = (time.monotonic() - feed.checked_at < self.ttl and
+                 feed.versions == self.versions_for(user_id, feed.class_ids))
+        record_cache('calendar_feed', fresh)
+        return feed, fresh
+
+    def put(self, feed):
+        with self._lock:
+            self._entries[feed.user_id] = feed
+            self._entries.move_to_end(feed.user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,89 @@
+"""Per-student assignment inbox.
+
+Student pages used to find their assignments by joining assignments to
+classes to enrollments, which grows with every enrollment. The inbox keeps
+one row per (student, assignment in one of their classes) with the due date
+and a status -- ``pending``, ``submitted``, ``late`` or ``graded`` -- so a
+student's assignments are one range of the ``(student_id, due_date)`` index.
+
+Rows are rewritten with set-based SQL by
+:meth:`repository.Repository.refresh_inbox` whenever an assignment, an
+enrollment, a submission or a grade changes, in the same transaction: by
+:func:`refresh_inbox_after_flush` for the Flask-SQLAlchemy models and by
+``dashboard/signals.py`` for Django, where only published assignments are
+listed. ``python -m inbox`` (or ``manage.py rebuild_inbox``) rebuilds the
+whole table from the source tables.
+"""
+import argparse
+from itertools import chain
+import logging
+import os
+
+from sqlalchemy import inspect
+
+from logconfig import configure_logging
+from repository import DJANGO_SCHEMA, ORM_SCHEMA, Repository, SqlAlchemyExecutor
+
+logger = logging.getLogger(__name__)
+
+SCHEMAS = {schema.name: schema for schema in (ORM_SCHEMA, DJANGO_SCHEMA)}
+
+
+def _flushed_scopes(session):
+    """``refresh_inbox`` keyword sets for the objects in a flush."""
+    from models import Assignment, Class, ClassStudents, Grade, Submission
+    scopes = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Assignment):
+            if obj in session.new or obj in session.deleted or session.is_modified(obj):
+                scopes.add((('assignment_id', obj.id),))
+        elif isinstance(obj, ClassStudents):
+            scopes.add((('class_id', obj.class_id), ('student_id', obj.student_id)))
+        elif isinstance(obj, Submission):
+            scopes.add((('assignment_id', obj.assignment_id), ('student_id', obj.student_id)))
+        elif isinstance(obj, Grade):
+            submission = session.get(Submission, obj.submission_id)
+            if submission is not None:
+                scopes.add((('assignment_id', submission.assignment_id), ('student_id', submission.student_id)))
+        elif isinstance(obj, Class):
+            # Enrollments made through ``Class.students`` bypass ClassStudents
+            added, _, removed = inspect(obj).attrs.students.history
+            scopes.update((('class_id', obj.id), ('student_id', user.id)) for user in chain(added, removed))
+    return scopes
+
+
+def refresh_inbox_after_flush(session, flush_context):
+    """``after_flush`` hook on the Flask-SQLAlchemy session."""
+    scopes = _flushed_scopes(session)
+    if not scopes:
+        return
+    repo = Repository(SqlAlchemyExecutor(session.connection()), ORM_SCHEMA)
+    for scope in scopes:
+        repo.refresh_inbox(**dict(scope))
+
+
+def rebuild(url, schema):
+    from sqlalchemy import create_engine
+    engine = create_engine(url)
+    try:
+        with engine.begin() as conn:
+            Repository(SqlAlchemyExecutor(conn), schema).refresh_inbox()
+            rows = conn.exec_driver_sql(f'SELECT COUNT(*) FROM {schema.inbox}').scalar()
+    finally:
+        engine.dispose()
+    logger.info("Rebuilt %s with %d rows", schema.inbox, rows)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Rebuild the per-student assignment inbox')
+    parser.add_argument('--url', default=os.environ.get('DATABASE_URL', 'postgresql+psycopg2://'),
+                        help='SQLAlchemy database URL (default: DATABASE_URL, else PG* settings)')
+    parser.add_argument('--schema', choices=sorted(SCHEMAS), default=ORM_SCHEMA.name)
+    args = parser.parse_args(argv)
+    configure_logging()
+    rebuild(args.url, SCHEMAS[args.schema])
+
+
+if __name__ == '__main__':
+    main()
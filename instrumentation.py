@@ -0,0 +1,427 @@
+"""Request instrumentation shared by the Flask and Django apps.
+
+Each request gets a :class:`RequestStats` (held in a context variable) that the
+database hooks, template hooks and caches add to. On completion the numbers
+are folded into a small Prometheus registry, slow statements are logged by
+normalized fingerprint, and a ``Server-Timing`` header is emitted.
+
+The sampling profiler is off by default and can be switched on for a single
+route at runtime; it collects collapsed stacks (the input format of
+``flamegraph.pl`` and speedscope).
+
+The metrics endpoints are closed unless the scraper presents
+``METRICS_TOKEN`` as a bearer token (Prometheus' ``authorization`` scrape
+setting); the Django one is also open to staff.
+"""
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+import contextvars
+import hmac
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger('instrumentation.slow_queries')
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class RequestStats:
+    __slots__ = ('route', 'started', 'db_time', 'queries', 'template_time',
+                 'cache_hits', 'cache_misses')
+
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.queries = 0
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        return (f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries", '
+                f'tpl;dur={self.template_time * 1000:.1f}, '
+                f'total;dur={self.elapsed * 1000:.1f}')
+
+
+_current = contextvars.ContextVar('request_stats', default=None)
+
+_FINGERPRINT_RULES = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'%\(\w+\)s|%s|\$\d+'), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(?)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def fingerprint(sql):
+    """Normalize ``sql`` so statements differing only in literals group together."""
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    for pattern, replacement in _FINGERPRINT_RULES:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+class Metrics:
+    """Minimal Prometheus registry: counters and fixed-bucket histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._help = {}
+        self._collectors = []
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += value
+
+    def collector(self, func):
+        """Register ``func`` returning ``(name, type, labels, value)`` samples
+        read at render time, for numbers kept outside this process."""
+        self._collectors.append(func)
+        return func
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(LATENCY_BUCKETS), 0, 0.0]
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    histogram[0][index] += 1
+            histogram[1] += 1
+            histogram[2] += value
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{k}="{str(v).replace(chr(34), chr(39))}"' for k, v in pairs) + '}'
+
+    def render(self):
+        """Return the registry in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(h[0]), h[1], h[2])) for key, h in self._histograms.items())
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f'# HELP {name} {self._help.get(name, name)}')
+                lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name}{self._labels(labels)} {value:g}')
+        for (name, labels), (buckets, count, total) in histograms:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f'# HELP {name} {self._help.get(name, name)}')
+                lines.append(f'# TYPE {name} histogram')
+            for bound, bucket_count in zip(LATENCY_BUCKETS, buckets):
+                lines.append(f'{name}_bucket{self._labels(labels, [("le", bound)])} {bucket_count}')
+            lines.append(f'{name}_bucket{self._labels(labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{name}_count{self._labels(labels)} {count}')
+            lines.append(f'{name}_sum{self._labels(labels)} {total:.6f}')
+        for func in self._collectors:
+            try:
+                samples = sorted(func(), key=lambda sample: sample[0])
+            except Exception:
+                logger.exception("Metrics collector %r failed", func)
+                continue
+            for name, kind, labels, value in samples:
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f'# HELP {name} {self._help.get(name, name)}')
+                    lines.append(f'# TYPE {name} {kind}')
+                lines.append(f'{name}{self._labels(sorted(labels.items()))} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+
+class SlowQueryLog:
+    """Aggregates statements slower than ``threshold_ms`` by fingerprint."""
+
+    def __init__(self, threshold_ms=SLOW_QUERY_MS):
+        self.threshold = threshold_ms / 1000
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, sql, duration, route=None):
+        if duration < self.threshold:
+            return
+        key = fingerprint(sql)
+        with self._lock:
+            count, total, worst = self._stats.get(key, (0, 0.0, 0.0))
+            self._stats[key] = (count + 1, total + duration, max(worst, duration))
+        slow_query_logger.warning("slow query %.1fms route=%s: %s", duration * 1000, route, key)
+
+    def top(self, limit=20):
+        """Return ``(fingerprint, count, total, max)`` ordered by total time."""
+        with self._lock:
+            rows = [(key, *values) for key, values in self._stats.items()]
+        return sorted(rows, key=lambda row: row[2], reverse=True)[:limit]
+
+
+class SamplingProfiler:
+    """Samples the stack of request threads for routes switched on at runtime."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._routes = set()
+        self._stacks = defaultdict(Counter)
+        self._lock = threading.Lock()
+
+    def enable(self, route):
+        with self._lock:
+            self._routes.add(route)
+
+    def disable(self, route):
+        with self._lock:
+            self._routes.discard(route)
+
+    def enabled_routes(self):
+        with self._lock:
+            return sorted(self._routes)
+
+    @contextmanager
+    def sample(self, route):
+        if route not in self._routes:
+            yield
+            return
+        target = threading.get_ident()
+        done = threading.Event()
+        stacks = Counter()
+
+        def run():
+            while not done.wait(self.interval):
+                frame = sys._current_frames().get(target)
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                    frame = frame.f_back
+                if names:
+                    stacks[';'.join(reversed(names))] += 1
+
+        sampler = threading.Thread(target=run, name=f'profiler:{route}', daemon=True)
+        sampler.start()
+        try:
+            yield
+        finally:
+            done.set()
+            sampler.join()
+            with self._lock:
+                self._stacks[route].update(stacks)
+
+    def collapsed(self, route):
+        """Collapsed stack lines (``frame;frame;frame count``) for ``route``."""
+        with self._lock:
+            stacks = dict(self._stacks.get(route, {}))
+        return ''.join(f'{stack} {count}\n' for stack, count in sorted(stacks.items()))
+
+    def reset(self, route):
+        with self._lock:
+            self._stacks.pop(route, None)
+
+
+metrics = Metrics()
+metrics.describe('http_requests_total', 'HTTP requests by route and status')
+metrics.describe('http_request_duration_seconds', 'Request latency by route')
+metrics.describe('db_queries_total', 'Database statements executed, by route')
+metrics.describe('db_query_duration_seconds', 'Database time per request, by route')
+metrics.describe('template_render_duration_seconds', 'Template render time per request, by route')
+metrics.describe('cache_requests_total', 'Cache lookups by cache and result')
+slow_queries = SlowQueryLog()
+profiler = SamplingProfiler()
+
+
+def start_request(route):
+    stats = RequestStats(route)
+    return stats, _current.set(stats)
+
+
+def finish_request(stats, token, status):
+    _current.reset(token)
+    route = stats.route
+    metrics.inc('http_requests_total', route=route, status=status)
+    metrics.observe('http_request_duration_seconds', stats.elapsed, route=route)
+    metrics.inc('db_queries_total', stats.queries, route=route)
+    metrics.observe('db_query_duration_seconds', stats.db_time, route=route)
+    if stats.template_time:
+        metrics.observe('template_render_duration_seconds', stats.template_time, route=route)
+
+
+def current_stats():
+    return _current.get()
+
+
+def record_query(sql, duration):
+    stats = _current.get()
+    route = None
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += duration
+        route = stats.route
+    slow_queries.record(sql, duration, route)
+
+
+def record_template(duration):
+    stats = _current.get()
+    if stats is not None:
+        stats.template_time += duration
+
+
+def record_cache(cache, hit):
+    stats = _current.get()
+    if stats is not None:
+        if hit:
+            stats.cache_hits += 1
+        else:
+            stats.cache_misses += 1
+    metrics.inc('cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+
+
+# -- Database hooks ---------------------------------------------------------
+
+def instrumented_connection_factory():
+    """Return a psycopg2 connection class whose cursors time every statement."""
+    import psycopg2.extensions
+
+    cursor_classes = {}
+
+    def timed(cursor_class):
+        if cursor_class not in cursor_classes:
+            class TimedCursor(cursor_class):
+                def execute(self, query, vars=None):
+                    started = time.perf_counter()
+                    try:
+                        return super().execute(query, vars)
+                    finally:
+                        record_query(query, time.perf_counter() - started)
+
+                def executemany(self, query, vars_list):
+                    started = time.perf_counter()
+                    try:
+                        return super().executemany(query, vars_list)
+                    finally:
+                        record_query(query, time.perf_counter() - started)
+
+            cursor_classes[cursor_class] = TimedCursor
+        return cursor_classes[cursor_class]
+
+    class InstrumentedConnection(psycopg2.extensions.connection):
+        def cursor(self, *args, **kwargs):
+            factory = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+            kwargs['cursor_factory'] = timed(factory)
+            return super().cursor(*args, **kwargs)
+
+    return InstrumentedConnection
+
+
+def instrument_sqlalchemy(engine):
+    """Time every statement executed through a SQLAlchemy ``engine``."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after(conn, cursor, statement, parameters, context, executemany):
+        record_query(statement, time.perf_counter() - conn.info['query_started'].pop())
+
+
+def metrics_authorized(authorization):
+    """Whether an ``Authorization`` header value carries ``METRICS_TOKEN``."""
+    token = os.environ.get('METRICS_TOKEN')
+    return bool(token) and hmac.compare_digest((authorization or '').encode(), f'Bearer {token}'.encode())
+
+
+# -- Flask integration ------------------------------------------------------
+
+def init_flask(app, metrics_path='/metrics'):
+    """Instrument requests and templates of a Flask ``app`` and add endpoints.
+
+    ``metrics_path`` answers only requests authorized by
+    :func:`metrics_authorized`. ``/debug/profile`` toggles and reads the sampling profiler; it is only
+    registered when ``PROFILER_TOKEN`` is set and requires that token in the
+    ``X-Profiler-Token`` header.
+    """
+    from flask import Response, abort, g, request, before_render_template, template_rendered
+
+    @app.before_request
+    def _start():
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        g._instrumentation = start_request(route)
+        g._profiling = profiler.sample(route)
+        g._profiling.__enter__()
+
+    @app.after_request
+    def _server_timing(response):
+        state = g.get('_instrumentation')
+        if state is not None:
+            g._status = response.status_code
+            response.headers['Server-Timing'] = state[0].server_timing()
+        return response
+
+    @app.teardown_request
+    def _finish(exc):
+        state = g.pop('_instrumentation', None)
+        profiling = g.pop('_profiling', None)
+        if profiling is not None:
+            profiling.__exit__(None, None, None)
+        if state is not None:
+            finish_request(*state, status=500 if exc else g.get('_status', 200))
+
+    def _template_started(sender, template, context, **extra):
+        g._template_started = time.perf_counter()
+
+    def _template_finished(sender, template, context, **extra):
+        started = g.pop('_template_started', None)
+        if started is not None:
+            record_template(time.perf_counter() - started)
+
+    before_render_template.connect(_template_started, app, weak=False)
+    template_rendered.connect(_template_finished, app, weak=False)
+
+    @app.route(metrics_path, endpoint='instrumentation_metrics')
+    def _metrics():
+        if not metrics_authorized(request.headers.get('Authorization')):
+            abort(404)
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    token = os.environ.get('PROFILER_TOKEN')
+    if token:
+        @app.route('/debug/profile', methods=['GET', 'POST'], endpoint='instrumentation_profile')
+        def _profile():
+            if request.headers.get('X-Profiler-Token') != token:
+                abort(404)
+            route = request.values.get('route', '')
+            if request.method == 'POST':
+                if request.values.get('enabled', '1') in ('1', 'true', 'on'):
+                    profiler.enable(route)
+                else:
+                    profiler.disable(route)
+                return {'enabled_routes': profiler.enabled_routes()}
+            return Response(profiler.collapsed(route), mimetype='text/plain')
+
+        csrf = app.extensions.get('csrf')
+        if csrf is not None:
+            csrf.exempt(_profile)
@@ -0,0 +1,160 @@
+"""Structured, non-blocking logging shared by the Flask and Django apps.
+
+Request threads only put records on a queue; a background
+``QueueListener`` formats them (JSON by default) and writes to stderr, so a
+slow stdout never blocks a worker. Levels can be set per module and chatty
+INFO/DEBUG messages can be sampled, all from the environment:
+
+``LOG_LEVEL``   root level (default ``INFO``)
+``LOG_LEVELS``  per-logger overrides, e.g. ``routes=WARNING,app=DEBUG``
+``LOG_SAMPLE``  keep 1 in N INFO/DEBUG records per logger, e.g. ``routes=10``
+``LOG_FORMAT``  ``json`` (default) or ``text``
+"""
+from collections import defaultdict
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+import atexit
+import itertools
+import json
+import logging
+import os
+import threading
+
+TEXT_FORMAT = '%(asctime)s [%(levelname)s] %(name)s: %(message)s'
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+_LAZY_TYPES = (str, int, float, bool, type(None))
+
+_listener = None
+_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; ``extra=`` fields are kept as keys."""
+
+    def format(self, record):
+        payload = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload['exc'] = record.exc_text
+        return json.dumps(payload, default=str)
+
+
+class LazyQueueHandler(QueueHandler):
+    """Queue handler that defers message formatting to the listener thread.
+
+    ``QueueHandler.prepare`` renders ``msg % args`` in the calling thread.
+    When every argument is an immutable scalar it is safe to hand the record
+    over as-is and let the listener do the work instead.
+    """
+
+    def prepare(self, record):
+        args = record.args
+        if not record.exc_info and (not args or (isinstance(args, tuple) and
+                                                 all(isinstance(arg, _LAZY_TYPES) for arg in args))):
+            return record
+        return super().prepare(record)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep one in ``rate`` INFO/DEBUG records for the configured loggers."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self._counters = defaultdict(itertools.count)
+
+    def filter(self, record):
+        if record.levelno > logging.INFO:
+            return True
+        name = record.name
+        while name:
+            rate = self.rates.get(name)
+            if rate:
+                # count() is atomic under the GIL, so no lock is needed here
+                return next(self._counters[(record.name, record.msg)]) % rate == 0
+            name = name.rpartition('.')[0]
+        return True
+
+
+def parse_mapping(spec, convert=str):
+    """Parse ``a=1,b.c=2`` into a dict."""
+    mapping = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        name, _, value = item.partition('=')
+        mapping[name.strip()] = convert(value.strip())
+    return mapping
+
+
+def _apply_levels(level, levels):
+    if level:
+        logging.getLogger().setLevel(level.upper())
+    for name, name_level in levels.items():
+        logging.getLogger(name).setLevel(name_level.upper())
+
+
+def configure_logging(level=None, levels=None, sample=None, fmt=None):
+    """Route all logging through a background queue listener.
+
+    Idempotent: once the listener runs, a later call (e.g. Django's
+    ``LOGGING_CONFIG`` hook after an import already configured logging) only
+    applies the ``level`` and ``levels`` it is given; sampling and format
+    stay as first configured.
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _apply_levels(level, levels or {})
+            return _listener
+        level = level or os.environ.get('LOG_LEVEL', 'INFO')
+        levels = levels if levels is not None else parse_mapping(os.environ.get('LOG_LEVELS'))
+        sample = sample if sample is not None else parse_mapping(os.environ.get('LOG_SAMPLE'), int)
+        fmt = fmt or os.environ.get('LOG_FORMAT', 'json')
+
+        stream = logging.StreamHandler()
+        stream.setFormatter(JsonFormatter() if fmt == 'json' else logging.Formatter(TEXT_FORMAT))
+
+        queue = SimpleQueue()
+        handler = LazyQueueHandler(queue)
+        if sample:
+            handler.addFilter(SamplingFilter(sample))
+
+        root = logging.getLogger()
+        for existing in root.handlers[:]:
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        _apply_levels(level, levels)
+
+        _listener = QueueListener(queue, stream, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+        return _listener
+
+
+def configure_django_logging(config):
+    """``LOGGING_CONFIG`` hook for Django.
+
+    Django installs its default console handlers on the ``django`` loggers
+    before calling this; they are removed so those records go through the
+    queue too. ``config`` may hold ``level``, ``levels`` and ``sample``,
+    which take precedence over the environment.
+    """
+    for name in ('django', 'django.server'):
+        django_logger = logging.getLogger(name)
+        for existing in django_logger.handlers[:]:
+            django_logger.removeHandler(existing)
+        django_logger.propagate = True
+    levels = parse_mapping(os.environ.get('LOG_LEVELS'))
+    levels.update(config.get('levels', {}))
+    sample = parse_mapping(os.environ.get('LOG_SAMPLE'), int)
+    sample.update(config.get('sample', {}))
+    return configure_logging(level=config.get('level'), levels=levels, sample=sample)
@@ -2,11 +2,9 @@ import os
 import sys
 import logging
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[logging.StreamHandler()]
-)
+from logconfig import configure_logging
+
+configure_logging()
 
 def main():
     try:
@@ -14,7 +12,7 @@ def main():
         from django.core.management import execute_from_command_line
         execute_from_command_line(sys.argv)
     except Exception as e:
-        logging.error(f"Failed to start application: {e}")
+        logging.error("Failed to start application: %s", e)
         raise
 
 if __name__ == "__main__":
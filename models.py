@@ -1,17 +1,42 @@
 from database import db
 from flask_login import UserMixin
+from sqlalchemy import event
+from inbox import refresh_inbox_after_flush
+from tenants import DEFAULT_SCHOOL
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 import logging
 
 logger = logging.getLogger(__name__)
 
+def school_of(table, column):
+    """Column default: the school of the ``table`` row that ``column`` points
+    at, so rows inserted without one (e.g. through ``Class.students``)
+    land in their parent's school."""
+    def default(context):
+        school_id = context.connection.execute(
+            db.text(f'SELECT school_id FROM "{table}" WHERE id = :id'),
+            {'id': context.get_current_parameters()[column]}).scalar()
+        return DEFAULT_SCHOOL if school_id is None else school_id
+    return default
+
+class School(db.Model):
+    """A school sharing the database; see tenants.py."""
+    id = db.Column(db.Integer, primary_key=True)
+    slug = db.Column(db.String(50), unique=True, nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+
+    def __repr__(self):
+        return f'<School {self.slug}>'
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(256))
     role = db.Column(db.String(20), nullable=False)  # 'teacher' or 'student'
+    school_id = db.Column(db.Integer, db.ForeignKey('school.id'), nullable=False, index=True,
+                          default=DEFAULT_SCHOOL)
     profile = db.relationship('UserProfile', backref='user', uselist=False, cascade='all, delete-orphan')
     notifications = db.relationship('Notification', backref='user', lazy=True, cascade='all, delete-orphan')
     
@@ -28,6 +53,7 @@ class UserProfile(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     bio = db.Column(db.Text)
+    timezone = db.Column(db.String(64), nullable=False, default='UTC', server_default='UTC')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def __repr__(self):
@@ -38,7 +64,10 @@ class Class(db.Model):
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
     teacher_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    school_id = db.Column(db.Integer, db.ForeignKey('school.id'), nullable=False, index=True,
+                          default=school_of('user', 'teacher_id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     teacher = db.relationship('User', backref='teaching_classes', foreign_keys=[teacher_id])
     students = db.relationship('User', secondary='class_students', backref=db.backref('enrolled_classes', lazy='dynamic'))
     assignments = db.relationship('Assignment', backref='class', cascade='all, delete-orphan')
@@ -52,6 +81,8 @@ class ClassStudents(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=False)
     student_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    school_id = db.Column(db.Integer, db.ForeignKey('school.id'), nullable=False, index=True,
+                          default=school_of('class', 'class_id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     __table_args__ = (db.UniqueConstraint('class_id', 'student_id', name='unique_class_student'),)
@@ -64,17 +95,45 @@ class Assignment(db.Model):
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
     class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=False)
+    school_id = db.Column(db.Integer, db.ForeignKey('school.id'), nullable=False, index=True,
+                          default=school_of('class', 'class_id'))
     due_date = db.Column(db.DateTime, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     submissions = db.relationship('Submission', backref='assignment', cascade='all, delete-orphan')
+    inbox_entries = db.relationship('AssignmentInbox', backref='assignment', cascade='all, delete-orphan')
 
     def __repr__(self):
         return f'<Assignment {self.title}>'
 
+class AssignmentInbox(db.Model):
+    """One row per student and assignment in their classes (see inbox.py).
+
+    The partial index on pending rows is in ``Repository.index_statements``.
+    """
+    __tablename__ = 'assignment_inbox'
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'), nullable=False)
+    class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=False, index=True)
+    due_date = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # 'pending', 'submitted', 'late', 'graded'
+
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'assignment_id', name='unique_inbox_entry'),
+        db.Index('ix_assignment_inbox_student_due', 'student_id', 'due_date'),
+        db.Index('ix_assignment_inbox_assignment', 'assignment_id'),
+    )
+
+    def __repr__(self):
+        return f'<AssignmentInbox student_id={self.student_id} assignment_id={self.assignment_id} {self.status}>'
+
 class Submission(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'), nullable=False)
     student_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    school_id = db.Column(db.Integer, db.ForeignKey('school.id'), nullable=False, index=True,
+                          default=school_of('assignment', 'assignment_id'))
     file_path = db.Column(db.String(255))
     submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
     student = db.relationship('User', backref='submissions')
@@ -105,6 +164,18 @@ class Attendance(db.Model):
     def __repr__(self):
         return f'<Attendance class_id={self.class_id} student_id={self.student_id} date={self.date}>'
 
+class ReminderLog(db.Model):
+    """Deadline reminders already sent, one row per assignment, offset and due date (see reminders.py)."""
+    __tablename__ = 'reminder_log'
+    assignment_id = db.Column(db.Integer, primary_key=True)
+    offset_minutes = db.Column(db.Integer, primary_key=True)
+    due_date = db.Column(db.DateTime, primary_key=True)
+    recipients = db.Column(db.Integer, nullable=False)
+    sent_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<ReminderLog assignment_id={self.assignment_id} offset_minutes={self.offset_minutes}>'
+
 class Notification(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -115,3 +186,6 @@ class Notification(db.Model):
 
     def __repr__(self):
         return f'<Notification user_id={self.user_id} type={self.type}>'
+
+# Keep the assignment inbox in step with every flush that touches its sources
+event.listen(db.session.session_factory, 'after_flush', refresh_inbox_after_flush)
@@ -0,0 +1,24 @@
+"""Notification fan-out for the Flask-SQLAlchemy app, run as background tasks.
+
+Queue with ``notify_new_assignment.delay(assignment.id)`` after the commit;
+workers run these with ``python -m tasks --import notifications
+--flask-app <module>:<app>`` so the session has an app context.
+"""
+from database import db
+from models import Assignment, ClassStudents, Notification
+from tasks import task
+
+
+@task(retries=5)
+def notify_new_assignment(assignment_id):
+    """Tell every student in the assignment's class about it."""
+    assignment = db.session.get(Assignment, assignment_id)
+    if assignment is None or assignment.class_id is None:
+        return
+    student_ids = [student_id for (student_id,) in db.session.query(ClassStudents.student_id)
+                   .filter(ClassStudents.class_id == assignment.class_id)]
+    message = f'New assignment: {assignment.title} (due {assignment.due_date:%Y-%m-%d})'
+    db.session.execute(db.insert(Notification), [
+        {'user_id': student_id, 'message': message, 'type': 'assignment'} for student_id in student_ids
+    ])
+    db.session.commit()
@@ -0,0 +1,148 @@
+"""Server-side prepared statements for the hot SQL in ``app.py``.
+
+Statements are registered once by name in a :class:`StatementRegistry`
+using ``%(name)s`` parameters. The first time a pooled connection runs one it
+is ``PREPARE``d on that connection; after that only ``EXECUTE name (...)``
+and the arguments go over the wire, so Postgres skips parsing and analysis
+and, once it settles on a generic plan, planning too.
+
+:class:`PreparedExecutor` plugs the registry into the shared
+:class:`repository.Repository`. Its queries are prepared automatically, in
+the style of psycopg 3's auto-prepare.
+
+Per-statement latency goes to the ``db_statement_seconds`` histogram on
+``/metrics``. :meth:`StatementRegistry.stats` returns the same numbers.
+"""
+from collections import defaultdict
+import hashlib
+import re
+import threading
+import time
+import weakref
+
+from instrumentation import metrics
+from repository import to_positional
+
+metrics.describe('db_statement_seconds', 'Execution time of prepared statements')
+
+
+class StatementRegistry:
+    def __init__(self):
+        self._statements = {}
+        self._sources = {}
+        self._names_by_sql = {}
+        self._prepared = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {'calls': 0, 'prepares': 0, 'total': 0.0, 'max': 0.0})
+
+    def register(self, name, sql):
+        if not re.fullmatch(r'[a-z_][a-z0-9_]*', name):
+            raise ValueError(f'invalid statement name {name!r}')
+        compiled = to_positional(sql)
+        with self._lock:
+            existing = self._statements.get(name)
+            if existing is not None and existing != compiled:
+                raise ValueError(f'statement {name!r} is already registered with different SQL')
+            self._statements[name] = compiled
+            self._sources[name] = sql
+            self._names_by_sql[sql] = name
+        return name
+
+    def names(self):
+        with self._lock:
+            return sorted(self._statements)
+
+    def source(self, name):
+        """The statement as registered, with ``%(name)s`` placeholders."""
+        return self._sources[name]
+
+    def ensure(self, sql, name='stmt'):
+        """Name for ``sql``, registering it on first use."""
+        registered = self._names_by_sql.get(sql)
+        if registered is not None:
+            return registered
+        digest = hashlib.sha1(sql.encode()).hexdigest()[:8]
+        return self.register(f'{name}_{digest}', sql)
+
+    def _prepared_on(self, conn):
+        with self._lock:
+            prepared = self._prepared.get(conn)
+            if prepared is None:
+                prepared = self._prepared[conn] = set()
+            return prepared
+
+    def _prepare(self, cur, name, prepared):
+        sql, _ = self._statements[name]
+        cur.execute(f'PREPARE {name} AS {sql}')
+        prepared.add(name)
+        with self._lock:
+            self._stats[name]['prepares'] += 1
+
+    def execute(self, cur, name, params=None):
+        """Run statement ``name`` on ``cur``, preparing it on this connection first if needed."""
+        import psycopg2.errors
+        _, names = self._statements[name]
+        args = [params[key] for key in names] if names else []
+        statement = f'EXECUTE {name}'
+        if args:
+            statement += ' (' + ', '.join(['%s'] * len(args)) + ')'
+
+        prepared = self._prepared_on(cur.connection)
+        if name not in prepared:
+            self._prepare(cur, name, prepared)
+        started = time.perf_counter()
+        try:
+            cur.execute(statement, args)
+        except psycopg2.errors.InvalidSqlStatementName:
+            # Dropped server side (DISCARD ALL, a pooler handing out another
+            # backend); re-prepare once when no transaction is in the way
+            prepared.discard(name)
+            if not cur.connection.autocommit:
+                raise
+            self._prepare(cur, name, prepared)
+            started = time.perf_counter()
+            cur.execute(statement, args)
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            stats = self._stats[name]
+            stats['calls'] += 1
+            stats['total'] += elapsed
+            stats['max'] = max(stats['max'], elapsed)
+        metrics.observe('db_statement_seconds', elapsed, statement=name)
+        return cur
+
+    def stats(self):
+        """Per-statement call counts and latencies, slowest total first."""
+        with self._lock:
+            items = [(name, dict(values)) for name, values in self._stats.items()]
+        rows = []
+        for name, values in items:
+            calls = values['calls']
+            rows.append({
+                'statement': name,
+                'calls': calls,
+                'prepares': values['prepares'],
+                'total_ms': values['total'] * 1000,
+                'mean_ms': values['total'] * 1000 / calls if calls else 0.0,
+                'max_ms': values['max'] * 1000,
+            })
+        return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+
+class PreparedExecutor:
+    """Repository executor that runs every query as a prepared statement."""
+
+    def __init__(self, connection, registry):
+        self.connection = connection
+        self.registry = registry
+
+    def rows(self, sql, params, name=None):
+        statement = self.registry.ensure(sql, name or 'stmt')
+        cur = self.connection.cursor()
+        try:
+            self.registry.execute(cur, statement, params)
+            columns = [column[0] for column in cur.description]
+            return [dict(zip(columns, row)) for row in cur.fetchall()]
+        finally:
+            cur.close()
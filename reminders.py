@@ -0,0 +1,266 @@
+"""Deadline reminders for the Flask-SQLAlchemy app.
+
+A long-running scheduler (``python -m reminders``) notifies students 24
+hours and 1 hour before an assignment is due, unless they have already
+handed it in.
+
+Timers are kept per assignment and offset, not per student. When one
+fires, a single ``INSERT ... SELECT`` over the assignment inbox (see
+inbox.py) creates a ``Notification`` for every student still pending.
+Pending timers sit in a hierarchical :class:`TimerWheel`. Each timer is
+one 64-bit integer in an array slot, so hundreds of thousands of them take
+a few megabytes. Adding a timer and firing it are O(1).
+
+Nothing is kept across restarts. At start-up the wheel is rebuilt from
+the database: every upcoming assignment gets a timer for each offset not
+yet in ``reminder_log``. A reminder missed while the scheduler was down
+still goes out, unless a later one is already due. The log row is written
+in the same transaction as the notifications, so a reminder is sent once
+per due date. Assignments created or changed later are picked up by
+polling ``updated_at``. A timer left behind by a changed due date fires
+nothing.
+
+Set the SQLAlchemy URL in ``DATABASE_URL``; by default it is Postgres via
+the ``PG*`` variables.
+"""
+import argparse
+from array import array
+from datetime import timedelta, timezone
+import heapq
+import logging
+import os
+import signal
+import threading
+import time
+
+from sqlalchemy import DateTime, bindparam, create_engine, text
+
+from due_dates import utcnow
+from logconfig import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Longest first; a reminder is only sent until the next one is due
+OFFSETS = (timedelta(hours=24), timedelta(hours=1))
+TICK = 60
+# Changes committed late can carry an older updated_at than the last poll
+POLL_OVERLAP = timedelta(minutes=2)
+FIRE_BATCH = 500
+
+
+class TimerWheel:
+    """Hierarchical timing wheel of integer timers.
+
+    Time advances in ticks of ``tick`` seconds. Level 0 has ``2 ** bits``
+    slots of one tick each. Each slot of a higher level spans one full turn
+    of the level below. A timer goes into the lowest level that can hold
+    its expiry. When the wheel reaches a slot of a higher level, its timers
+    move down a level; timers in level 0 fire. Expiries beyond the top
+    level (64 ** 4 minutes by default, about 30 years) wait in a heap.
+    """
+
+    def __init__(self, now, tick=TICK, bits=6, levels=4):
+        self.tick = tick
+        self.bits = bits
+        self.levels = levels
+        self.mask = (1 << bits) - 1
+        self.current = int(now // tick)
+        # Level 0 holds bare timers; higher levels interleave (expiry tick, timer)
+        self.wheels = [[array('q') for _ in range(1 << bits)] for _ in range(levels)]
+        self.overflow = []
+        self.expired = array('q')
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, when, timer):
+        """Fire ``timer`` at the first tick at or after ``when`` (epoch seconds)."""
+        self.count += 1
+        self._place(-(-int(when) // self.tick), timer)
+
+    def _place(self, expires, timer):
+        if expires <= self.current:
+            self.expired.append(timer)
+            return
+        for level in range(self.levels):
+            if expires >> (self.bits * (level + 1)) == self.current >> (self.bits * (level + 1)):
+                slot = self.wheels[level][(expires >> (self.bits * level)) & self.mask]
+                if level:
+                    slot.append(expires)
+                slot.append(timer)
+                return
+        heapq.heappush(self.overflow, (expires, timer))
+
+    def _cascade(self, level):
+        index = (self.current >> (self.bits * level)) & self.mask
+        entries, self.wheels[level][index] = self.wheels[level][index], array('q')
+        for i in range(0, len(entries), 2):
+            self._place(entries[i], entries[i + 1])
+
+    def advance(self, now):
+        """Move to ``now`` and return the timers that expired on the way."""
+        target = int(now // self.tick)
+        while self.current < target:
+            if self.count == len(self.expired):
+                # Nothing left to cascade: jump straight to the target
+                self.current = target
+                break
+            self.current += 1
+            top = self.bits * self.levels
+            if self.current & ((1 << top) - 1) == 0:
+                while self.overflow and self.overflow[0][0] >> top == self.current >> top:
+                    self._place(*heapq.heappop(self.overflow))
+            for level in range(self.levels - 1, 0, -1):
+                if self.current & ((1 << (self.bits * level)) - 1) == 0:
+                    self._cascade(level)
+            index = self.current & self.mask
+            self.expired.extend(self.wheels[0][index])
+            self.wheels[0][index] = array('q')
+        expired, self.expired = self.expired, array('q')
+        self.count -= len(expired)
+        return expired
+
+
+def _epoch(value):
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _timer(assignment_id, index):
+    return assignment_id * len(OFFSETS) + index
+
+
+def _message(title, due_date, offset):
+    hours = int(offset.total_seconds() // 3600)
+    return f'Reminder: {title} is due in {hours} hour{"s" if hours != 1 else ""} ({due_date:%Y-%m-%d %H:%M} UTC)'
+
+
+class ReminderScheduler:
+    def __init__(self, engine, tick=TICK):
+        self.engine = engine
+        self.wheel = TimerWheel(time.time(), tick)
+        self.watermark = None
+        # assignment_id -> (updated_at, due_date) of rows inside the poll overlap,
+        # which every poll reads again
+        self.recent = {}
+
+    def _schedule(self, assignment_id, due_date, logged=frozenset()):
+        for index, offset in enumerate(OFFSETS):
+            if (assignment_id, int(offset.total_seconds() // 60), due_date) not in logged:
+                self.wheel.add(_epoch(due_date - offset), _timer(assignment_id, index))
+
+    def load(self):
+        """Rebuild the wheel from every upcoming assignment."""
+        now = utcnow()
+        self.watermark = now
+        with self.engine.connect() as conn:
+            logged = {tuple(row) for row in conn.execute(text(
+                "SELECT assignment_id, offset_minutes, due_date FROM reminder_log WHERE due_date > :now"
+            ).columns(due_date=DateTime), {'now': now})}
+            result = conn.execution_options(stream_results=True, yield_per=10000).execute(text(
+                "SELECT id, due_date, updated_at FROM assignment WHERE due_date > :now"
+            ).columns(due_date=DateTime, updated_at=DateTime), {'now': now})
+            for assignment_id, due_date, updated_at in result:
+                self._schedule(assignment_id, due_date, logged)
+                if updated_at > now - POLL_OVERLAP:
+                    self.recent[assignment_id] = (updated_at, due_date)
+        logger.info("Loaded %d reminder timers", len(self.wheel))
+
+    def poll(self):
+        """Add timers for assignments created or changed since the last poll.
+
+        Rows read again because of ``POLL_OVERLAP`` are skipped while their
+        due date is the one already scheduled, so the wheel does not collect
+        a duplicate timer every tick. Returns the number of assignments
+        scheduled.
+        """
+        now = utcnow()
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(
+                "SELECT id, due_date, updated_at FROM assignment"
+                " WHERE updated_at > :since AND due_date > :now"
+            ).columns(due_date=DateTime, updated_at=DateTime),
+                {'since': self.watermark - POLL_OVERLAP, 'now': now}).all()
+        scheduled = 0
+        for assignment_id, due_date, updated_at in rows:
+            seen = self.recent.get(assignment_id)
+            if seen is None or seen[1] != due_date:
+                self._schedule(assignment_id, due_date)
+                scheduled += 1
+            self.recent[assignment_id] = (updated_at, due_date)
+            self.watermark = max(self.watermark, updated_at)
+        # Rows at or before the new overlap edge are not read again
+        since = self.watermark - POLL_OVERLAP
+        self.recent = {assignment_id: seen for assignment_id, seen in self.recent.items() if seen[0] > since}
+        return scheduled
+
+    def fire(self, timers):
+        """Create the notifications for expired timers that are still current."""
+        now = utcnow()
+        wanted = {}
+        for timer in timers:
+            wanted.setdefault(timer // len(OFFSETS), set()).add(timer % len(OFFSETS))
+        sent = 0
+        with self.engine.begin() as conn:
+            ids = list(wanted)
+            assignments = conn.execute(text(
+                "SELECT id, title, due_date FROM assignment WHERE id IN :ids"
+            ).bindparams(bindparam('ids', expanding=True)).columns(due_date=DateTime), {'ids': ids}).all()
+            logged = {tuple(row) for row in conn.execute(text(
+                "SELECT assignment_id, offset_minutes, due_date FROM reminder_log WHERE assignment_id IN :ids"
+            ).bindparams(bindparam('ids', expanding=True)).columns(due_date=DateTime), {'ids': ids})}
+            for assignment_id, title, due_date in assignments:
+                for index in sorted(wanted[assignment_id]):
+                    offset = OFFSETS[index]
+                    minutes = int(offset.total_seconds() // 60)
+                    until = due_date - OFFSETS[index + 1] if index + 1 < len(OFFSETS) else due_date
+                    # A moved due date leaves stale timers behind, and after downtime
+                    # only the latest of several missed reminders goes out
+                    if not due_date - offset <= now < until or (assignment_id, minutes, due_date) in logged:
+                        continue
+                    recipients = conn.execute(text("""
+                        INSERT INTO notification (user_id, message, type, is_read, created_at)
+                        SELECT student_id, :message, 'assignment', :is_read, :now
+                        FROM assignment_inbox
+                        WHERE assignment_id = :assignment_id AND status = 'pending'
+                    """), {'message': _message(title, due_date, offset), 'is_read': False, 'now': now,
+                           'assignment_id': assignment_id}).rowcount
+                    conn.execute(text(
+                        "INSERT INTO reminder_log (assignment_id, offset_minutes, due_date, recipients, sent_at)"
+                        " VALUES (:assignment_id, :minutes, :due_date, :recipients, :now)"
+                    ), {'assignment_id': assignment_id, 'minutes': minutes, 'due_date': due_date,
+                        'recipients': recipients, 'now': now})
+                    sent += recipients
+        return sent
+
+    def run(self, stop):
+        self.load()
+        while not stop.is_set():
+            self.poll()
+            expired = self.wheel.advance(time.time())
+            for start in range(0, len(expired), FIRE_BATCH):
+                sent = self.fire(expired[start:start + FIRE_BATCH])
+                if sent:
+                    logger.info("Sent %d deadline reminders", sent)
+            # Wake at the start of the next tick
+            stop.wait(self.wheel.tick - time.time() % self.wheel.tick)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the deadline reminder scheduler')
+    parser.add_argument('--url', default=os.environ.get('DATABASE_URL', 'postgresql+psycopg2://'),
+                        help='SQLAlchemy database URL (default: DATABASE_URL, else PG* settings)')
+    args = parser.parse_args(argv)
+    configure_logging()
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+    engine = create_engine(args.url, pool_pre_ping=True)
+    try:
+        ReminderScheduler(engine).run(stop)
+    finally:
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
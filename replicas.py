@@ -0,0 +1,122 @@
+"""Read-replica routing shared by the three front ends.
+
+Safe (GET/HEAD) requests may read from a replica; any other request counts
+as a write and pins that user's reads to the primary for
+``REPLICA_STICKY_SECONDS`` so they always see their own changes despite
+replication lag. The decision is made once per request and kept in a
+context variable that the psycopg2 pool selector in ``app.py``, the
+SQLAlchemy bind choice in ``routes.py`` and :class:`ReplicaRouter` all read.
+
+Replicas are configured with ``PGREPLICA_HOST`` (and optionally
+``PGREPLICA_PORT``); the other ``PG*`` settings are shared with the primary.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+import os
+import time
+
+REPLICA_ALIAS = 'replica'
+LAST_WRITE_KEY = '_last_write'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+def replica_configured():
+    return bool(os.environ.get('PGREPLICA_HOST'))
+
+
+def replica_settings():
+    """``(host, port)`` of the replica, or ``None`` when not configured."""
+    if not replica_configured():
+        return None
+    return os.environ['PGREPLICA_HOST'], os.environ.get('PGREPLICA_PORT', os.environ.get('PGPORT'))
+
+
+def reads_from_replica():
+    """Whether the current request may send read-only queries to a replica."""
+    return _use_replica.get()
+
+
+def replica_allowed(method, last_write, now=None):
+    if method not in SAFE_METHODS:
+        return False
+    if last_write is None:
+        return True
+    return (now or time.time()) - last_write > STICKY_SECONDS
+
+
+def begin_request(method, session):
+    """Decide routing for a request; returns a token for :func:`end_request`.
+
+    Non-safe requests are recorded in ``session`` so the user's next reads
+    stay on the primary.
+    """
+    if method not in SAFE_METHODS:
+        session[LAST_WRITE_KEY] = time.time()
+        return _use_replica.set(False)
+    return _use_replica.set(replica_allowed(method, session.get(LAST_WRITE_KEY)))
+
+
+def end_request(token):
+    _use_replica.reset(token)
+
+
+@contextmanager
+def use_primary():
+    """Force primary reads, e.g. for a read that must follow a write."""
+    token = _use_replica.set(False)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def init_flask(app):
+    """Make routing decisions for every request of a Flask app."""
+    from flask import g, request, session
+
+    @app.before_request
+    def _route_reads():
+        g._replica_token = begin_request(request.method, session)
+
+    @app.teardown_request
+    def _reset_routing(exc=None):
+        token = g.pop('_replica_token', None)
+        if token is not None:
+            end_request(token)
+
+
+class ReplicaRouter:
+    """Django ``DATABASE_ROUTERS`` entry sending reads to ``replica`` when allowed."""
+
+    def db_for_read(self, model, **hints):
+        from django.conf import settings
+        if REPLICA_ALIAS in settings.DATABASES and reads_from_replica():
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaRoutingMiddleware:
+    """Django counterpart of :func:`init_flask`; place after SessionMiddleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = begin_request(request.method, request.session)
+        try:
+            return self.get_response(request)
+        finally:
+            end_request(token)
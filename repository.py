@@ -0,0 +1,603 @@
+"""Shared data access for the three front ends.
+
+The psycopg2 app (``app.py``), the Flask-SQLAlchemy app (``routes.py``) and
+the Django project (``dashboard``) keep the same domain -- classes,
+enrollments, assignments, submissions and schedules -- in differently named
+tables. :class:`Schema` describes one layout and :class:`Repository` holds
+the single SQL implementation of each read use case, run through whichever
+connection the front end already has:
+
+* :class:`DbApiExecutor` for a psycopg2 connection or ``django.db.connection``
+* :class:`SqlAlchemyExecutor` for a SQLAlchemy session or engine
+* :class:`AsyncpgExecutor` for an asyncpg pool, with :class:`AsyncRepository`
+
+Queries use ``%(name)s`` parameters and portable SQL (Postgres and SQLite).
+Rows come back as plain dicts. A repository built with a ``school_id`` only
+sees that school's rows (see tenants.py): ``app.py``'s tables are
+partitioned by school, the other two schemas filter on an indexed column.
+"""
+from collections import namedtuple
+from datetime import datetime
+import re
+
+from tenants import DEFAULT_SCHOOL
+
+Schema = namedtuple('Schema', [
+    'name',
+    'users', 'classes',
+    'enrollments', 'enrolled_student', 'enrolled_at',
+    'assignments', 'assignment_class',
+    'submissions', 'submission_student', 'submission_updated', 'grade', 'grade_updated',
+    'schedules', 'attendance', 'student_risk',
+    'inbox', 'assignment_visible', 'student_filter', 'tenant', 'tenant_via',
+])
+
+# app.py (raw psycopg2)
+APP_SCHEMA = Schema(
+    name='app',
+    users='users', classes='classes',
+    enrollments='class_students', enrolled_student='student_id', enrolled_at='created_at',
+    assignments='assignments', assignment_class='class_id',
+    submissions='student_assignments', submission_student='student_id',
+    submission_updated='submitted_at', grade='s.grade', grade_updated='s.submitted_at',
+    schedules='schedules', attendance=None, student_risk='student_risk',
+    inbox=None, assignment_visible=None, student_filter="u.role = 'student'",
+    tenant='school_id', tenant_via=None,
+)
+
+# models.py (Flask-SQLAlchemy); grades live in their own table
+ORM_SCHEMA = Schema(
+    name='orm',
+    users='"user"', classes='"class"',
+    enrollments='class_students', enrolled_student='student_id', enrolled_at='created_at',
+    assignments='assignment', assignment_class='class_id',
+    submissions='submission', submission_student='student_id',
+    submission_updated='submitted_at',
+    grade='(SELECT g.score FROM grade g WHERE g.submission_id = s.id)',
+    grade_updated='(SELECT g.created_at FROM grade g WHERE g.submission_id = s.id)',
+    schedules=None, attendance='attendance', student_risk='student_risk',
+    inbox='assignment_inbox', assignment_visible=None, student_filter="u.role = 'student'",
+    tenant='school_id', tenant_via=None,
+)
+
+# dashboard/models.py (Django ORM)
+DJANGO_SCHEMA = Schema(
+    name='django',
+    users='auth_user', classes='dashboard_class',
+    enrollments='dashboard_class_students', enrolled_student='user_id', enrolled_at=None,
+    assignments='dashboard_assignment', assignment_class='class_obj_id',
+    submissions='dashboard_submission', submission_student='student_id',
+    submission_updated='updated_at', grade='s.grade', grade_updated='s.updated_at',
+    schedules=None, attendance=None, student_risk=None,
+    inbox='dashboard_assignmentinbox', assignment_visible="a.status = 'published'",
+    student_filter="""u.id IN (SELECT ug.user_id FROM auth_user_groups ug
+                              JOIN auth_group g ON g.id = ug.group_id
+                              WHERE g.name = 'Student')""",
+    # auth_user and the enrollment table have no school column; their rows
+    # belong to a school through Membership (default school without one) and Class
+    tenant='school_id',
+    tenant_via={
+        'e': "{alias}.class_id IN (SELECT tc.id FROM dashboard_class tc WHERE tc.school_id = %(school_id)s)",
+        'u': "COALESCE((SELECT tm.school_id FROM dashboard_membership tm WHERE tm.user_id = {alias}.id),"
+             f" {DEFAULT_SCHOOL}) = %(school_id)s",
+    },
+)
+
+_PYFORMAT = re.compile(r'%\((\w+)\)s')
+
+
+def to_positional(sql):
+    """Rewrite ``%(name)s`` placeholders as ``$n``; returns ``(sql, names)``."""
+    names = []
+
+    def number(match):
+        name = match.group(1)
+        if name not in names:
+            names.append(name)
+        return f'${names.index(name) + 1}'
+
+    return _PYFORMAT.sub(number, sql), names
+
+
+# Classes the user teaches or is enrolled in; every per-user query starts here
+_MY_CLASSES = """
+    WITH my_classes AS (
+        SELECT id FROM {classes} WHERE teacher_id = %(user_id)s
+        UNION
+        SELECT e.class_id FROM {enrollments} e WHERE e.{enrolled_student} = %(user_id)s{in_school[e]}
+    )
+"""
+
+
+class _SchoolFilter:
+    """``{in_school[alias]}`` in a query template: ``AND alias.school_id =
+    %(school_id)s`` for a repository scoped to a school, so Postgres reads
+    only that school's partitions (see tenants.py); empty otherwise.
+
+    Aliases listed in the schema's ``tenant_via`` use that condition
+    instead, for tables that reach their school through another table.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+
+    def __getitem__(self, alias):
+        if self.schema is None:
+            return ''
+        via = (self.schema.tenant_via or {}).get(alias)
+        if via is not None:
+            return ' AND ' + via.format(alias=alias)
+        return f' AND {alias}.{self.schema.tenant} = %(school_id)s'
+
+
+def _as_datetime(value):
+    # SQLite hands back aggregated timestamps as text
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+
+class DbApiExecutor:
+    """Run queries on a DB-API connection that accepts ``pyformat`` parameters."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def rows(self, sql, params, name=None):
+        cur = self.connection.cursor()
+        try:
+            cur.execute(sql, params)
+            columns = [column[0] for column in cur.description]
+            return [dict(zip(columns, row)) for row in cur.fetchall()]
+        finally:
+            cur.close()
+
+    def execute(self, sql, params):
+        cur = self.connection.cursor()
+        try:
+            cur.execute(sql, params)
+        finally:
+            cur.close()
+
+
+def _text(sql):
+    from sqlalchemy import text
+    return text(_PYFORMAT.sub(r':\1', sql))
+
+
+class SqlAlchemyExecutor:
+    """Run queries on a SQLAlchemy session, inside its current transaction,
+    or on a short-lived connection from an engine (e.g. a replica bind)."""
+
+    def __init__(self, bind):
+        self.bind = bind
+
+    def rows(self, sql, params, name=None):
+        statement = _text(sql)
+        if hasattr(self.bind, 'connect'):
+            with self.bind.connect() as conn:
+                return [dict(row) for row in conn.execute(statement, params).mappings()]
+        return [dict(row) for row in self.bind.execute(statement, params).mappings()]
+
+    def execute(self, sql, params):
+        # Writes always join the caller's transaction
+        self.bind.execute(_text(sql), params)
+
+
+def django_repository(using=None, school_id=None):
+    """Repository over Django's connection for the ``dashboard`` tables,
+    scoped to ``school_id`` when given.
+
+    Without ``using`` the alias comes from the database routers, so reads
+    follow replica routing like ORM queries do.
+    """
+    from django.db import connections, router
+    return Repository(DbApiExecutor(connections[using or router.db_for_read(None)]), DJANGO_SCHEMA,
+                      school_id=school_id)
+
+
+class Repository:
+    def __init__(self, executor, schema, school_id=None):
+        self.executor = executor
+        self.schema = schema
+        # Only schemas with a tenant column can be scoped to a school
+        self.school_id = school_id if schema.tenant else None
+
+    def _sql(self, template):
+        scoped = self.schema if self.school_id is not None else None
+        return template.format(**self.schema._asdict(), in_school=_SchoolFilter(scoped))
+
+    def _rows(self, name, template, **params):
+        if self.school_id is not None:
+            params['school_id'] = self.school_id
+        # ``name`` labels the statement for executors that prepare queries
+        return self.executor.rows(self._sql(template), params, name=name)
+
+    def _one(self, name, template, **params):
+        rows = self._rows(name, template, **params)
+        return rows[0] if rows else None
+
+    def index_statements(self):
+        """``CREATE INDEX`` statements for the lookups these queries make.
+
+        Django creates equivalent indexes for its foreign keys on its own;
+        the other two schemas only had primary keys and unique constraints.
+        """
+        s = self.schema
+        indexes = [
+            ('classes_teacher', s.classes, 'teacher_id'),
+            ('enrollments_student', s.enrollments, s.enrolled_student),
+            ('assignments_class_due', s.assignments, f'{s.assignment_class}, due_date'),
+            ('assignments_updated', s.assignments, 'updated_at'),
+            ('submissions_student', s.submissions, s.submission_student),
+            ('submissions_assignment', s.submissions, 'assignment_id'),
+        ]
+        if s.schedules:
+            indexes.append(('schedules_class', s.schedules, 'class_id'))
+        if s.attendance:
+            indexes.append(('attendance_student', s.attendance, 'student_id'))
+        statements = [f'CREATE INDEX IF NOT EXISTS idx_{s.name}_{name} ON {table} ({columns})'
+                      for name, table, columns in indexes]
+        if s.inbox:
+            # Deadline buckets only read pending rows
+            statements.append(f"CREATE INDEX IF NOT EXISTS idx_{s.name}_inbox_pending_due"
+                              f" ON {s.inbox} (student_id, due_date) WHERE status = 'pending'")
+        return statements
+
+    def risk_table_statements(self):
+        """Tables written by the nightly ``at_risk`` job; empty when the
+        schema has no risk scores."""
+        if not self.schema.student_risk:
+            return []
+        return [
+            f"""CREATE TABLE IF NOT EXISTS {self.schema.student_risk} (
+                student_id INTEGER PRIMARY KEY,
+                score REAL NOT NULL,
+                level VARCHAR(10) NOT NULL,
+                assignments_due INTEGER NOT NULL,
+                missing INTEGER NOT NULL,
+                late INTEGER NOT NULL,
+                grade_trend REAL,
+                absence_rate REAL,
+                scored_at TIMESTAMP NOT NULL
+            )""",
+            f"CREATE INDEX IF NOT EXISTS idx_{self.schema.name}_risk_score"
+            f" ON {self.schema.student_risk} (score)",
+            """CREATE TABLE IF NOT EXISTS risk_job_runs (
+                started_at TIMESTAMP NOT NULL,
+                finished_at TIMESTAMP NOT NULL,
+                mode VARCHAR(12) NOT NULL,
+                students INTEGER NOT NULL
+            )""",
+        ]
+
+    def _data_version_sql(self):
+        s = self.schema
+        columns = [
+            "(SELECT MAX(updated_at) FROM {classes} WHERE id IN (SELECT id FROM my_classes))",
+            "(SELECT COUNT(*) FROM my_classes)",
+            "(SELECT MAX(a.updated_at) FROM {assignments} a"
+            " WHERE a.{assignment_class} IN (SELECT id FROM my_classes){in_school[a]})",
+            "(SELECT COUNT(*) FROM {assignments} a"
+            " WHERE a.{assignment_class} IN (SELECT id FROM my_classes){in_school[a]})",
+            "(SELECT COUNT(*) FROM {enrollments} e WHERE e.class_id IN (SELECT id FROM my_classes){in_school[e]})",
+            """(SELECT MAX(s.{submission_updated}) FROM {submissions} s
+                WHERE (s.{submission_student} = %(user_id)s OR s.assignment_id IN (
+                    SELECT a.id FROM {assignments} a
+                    WHERE a.{assignment_class} IN (SELECT id FROM my_classes){in_school[a]})){in_school[s]})""",
+            """(SELECT COUNT({grade}) FROM {submissions} s
+                WHERE (s.{submission_student} = %(user_id)s OR s.assignment_id IN (
+                    SELECT a.id FROM {assignments} a
+                    WHERE a.{assignment_class} IN (SELECT id FROM my_classes){in_school[a]})){in_school[s]})""",
+        ]
+        if s.enrolled_at:
+            columns.append("(SELECT MAX(e.{enrolled_at}) FROM {enrollments} e"
+                           " WHERE e.class_id IN (SELECT id FROM my_classes){in_school[e]})")
+        if s.schedules:
+            columns.append("(SELECT MAX(updated_at) FROM {schedules} WHERE class_id IN (SELECT id FROM my_classes))")
+            columns.append("(SELECT COUNT(*) FROM {schedules} WHERE class_id IN (SELECT id FROM my_classes))")
+        if s.student_risk:
+            columns.append("(SELECT MAX(finished_at) FROM risk_job_runs)")
+        return _MY_CLASSES + 'SELECT ' + ',\n'.join(
+            f'{column} AS v{index}' for index, column in enumerate(columns))
+
+    @staticmethod
+    def _data_version_result(row):
+        parts = tuple(_as_datetime(value) for value in row.values())
+        last_modified = max((part for part in parts if isinstance(part, datetime)), default=None)
+        return parts, last_modified
+
+    def data_version(self, user_id):
+        """Return ``(parts, last_modified)`` covering every page a user sees.
+
+        One round trip of scalar aggregates (latest change plus a row count
+        per table, so deletions are noticed); used as the conditional GET
+        validator by all three front ends.
+        """
+        row = self._one('data_version', self._data_version_sql(), user_id=user_id)
+        return self._data_version_result(row)
+
+    def classes_for_user(self, user_id, role):
+        """Classes taught (teachers) or attended (students), newest first,
+        with ``student_count`` and ``teacher_name``."""
+        if role == 'teacher':
+            name, where = 'classes_for_teacher', "c.teacher_id = %(user_id)s"
+        else:
+            name = 'classes_for_student'
+            where = ("c.id IN (SELECT e.class_id FROM {enrollments} e"
+                     " WHERE e.{enrolled_student} = %(user_id)s{in_school[e]})")
+        return self._rows(name, """
+            SELECT c.*, u.username AS teacher_name,
+                   (SELECT COUNT(*) FROM {enrollments} e WHERE e.class_id = c.id{in_school[e]}) AS student_count
+            FROM {classes} c
+            JOIN {users} u ON u.id = c.teacher_id
+            WHERE """ + where + """
+            ORDER BY c.created_at DESC
+        """, user_id=user_id)
+
+    def assignments_for_user(self, user_id, role, limit=None):
+        """Assignments in the user's classes by due date, with ``class_name``."""
+        if role == 'teacher':
+            name, where = 'assignments_for_teacher', "c.teacher_id = %(user_id)s"
+        elif self.schema.inbox:
+            name = 'assignments_for_student'
+            where = "a.id IN (SELECT assignment_id FROM {inbox} WHERE student_id = %(user_id)s)"
+        else:
+            name = 'assignments_for_student'
+            where = ("a.{assignment_class} IN (SELECT e.class_id FROM {enrollments} e"
+                     " WHERE e.{enrolled_student} = %(user_id)s{in_school[e]})")
+        sql = """
+            SELECT a.*, c.name AS class_name
+            FROM {assignments} a
+            JOIN {classes} c ON c.id = a.{assignment_class}
+            WHERE """ + where + """{in_school[a]}
+            ORDER BY a.due_date ASC
+        """
+        if limit is not None:
+            sql += " LIMIT %(limit)s"
+        return self._rows(name, sql, user_id=user_id, limit=limit)
+
+    def schedules_for_user(self, user_id):
+        """Weekly sessions of all the user's classes, with ``class_name``."""
+        if not self.schema.schedules:
+            return []
+        return self._rows('schedules_for_user', _MY_CLASSES + """
+            SELECT sc.*, c.name AS class_name
+            FROM {schedules} sc
+            JOIN {classes} c ON c.id = sc.class_id
+            WHERE sc.class_id IN (SELECT id FROM my_classes)
+            ORDER BY sc.day_of_week, sc.start_time
+        """, user_id=user_id)
+
+    def grade_versions(self, class_id):
+        """``{assignment_id: version}`` for a class's assignments.
+
+        The version (graded count, score total, latest submission change)
+        moves whenever a grade is added, changed or removed.
+        """
+        rows = self._rows('grade_versions', """
+            SELECT a.id AS assignment_id, COUNT({grade}) AS graded, SUM({grade}) AS total,
+                   MAX(s.{submission_updated}) AS changed
+            FROM {assignments} a
+            LEFT JOIN {submissions} s ON s.assignment_id = a.id{in_school[s]}
+            WHERE a.{assignment_class} = %(class_id)s{in_school[a]}
+            GROUP BY a.id
+        """, class_id=class_id)
+        return {row['assignment_id']: (row['graded'], row['total'], _as_datetime(row['changed']))
+                for row in rows}
+
+    def grade_columns(self, class_id):
+        """Graded submissions of a class as parallel lists:
+        ``(assignment_ids, scores, submitted_at)``."""
+        rows = self._rows('grade_columns', """
+            SELECT s.assignment_id, {grade} AS score, s.submitted_at
+            FROM {submissions} s
+            JOIN {assignments} a ON a.id = s.assignment_id
+            WHERE a.{assignment_class} = %(class_id)s AND {grade} IS NOT NULL{in_school[s]}{in_school[a]}
+        """, class_id=class_id)
+        return ([row['assignment_id'] for row in rows],
+                [float(row['score']) for row in rows],
+                [_as_datetime(row['submitted_at']) for row in rows])
+
+    def at_risk_students(self, teacher_id, limit=10):
+        """Highest-scoring students from the last ``at_risk`` run across a
+        teacher's classes, skipping those at low risk."""
+        if not self.schema.student_risk:
+            return []
+        return self._rows('at_risk_students', """
+            SELECT r.student_id, u.username, r.score, r.level, r.assignments_due,
+                   r.missing, r.late, r.grade_trend, r.absence_rate, r.scored_at
+            FROM {student_risk} r
+            JOIN {users} u ON u.id = r.student_id
+            WHERE r.level <> 'low' AND r.student_id IN (
+                SELECT e.{enrolled_student} FROM {enrollments} e
+                JOIN {classes} c ON c.id = e.class_id
+                WHERE c.teacher_id = %(teacher_id)s{in_school[e]})
+            ORDER BY r.score DESC
+            LIMIT %(limit)s
+        """, teacher_id=teacher_id, limit=limit)
+
+    def refresh_inbox(self, assignment_id=None, class_id=None, student_id=None):
+        """Rewrite the assignment inbox rows in a scope from the assignments,
+        enrollments and submissions tables; with no scope, the whole inbox.
+
+        A row's status is ``graded``, ``late`` (submitted after the due date),
+        ``submitted`` or ``pending``. Runs in the caller's transaction.
+
+        Rows are upserted on ``(student_id, assignment_id)`` and only rows the
+        scope no longer produces are deleted, so overlapping refreshes (a
+        teacher saving an assignment while a student submits it) wait on each
+        other's row locks instead of colliding on the unique constraint.
+        """
+        scope = {key: value for key, value in (('assignment_id', assignment_id), ('class_id', class_id),
+                                               ('student_id', student_id)) if value is not None}
+        source = {'assignment_id': 'a.id', 'class_id': 'a.{assignment_class}',
+                  'student_id': 'e.{enrolled_student}'}
+        conditions = [f'{source[key]} = %({key})s' for key in scope]
+        if self.schema.assignment_visible:
+            conditions.append(self.schema.assignment_visible)
+        # The latest submission counts if a student has several. The WHERE is
+        # always there: SQLite needs it to parse INSERT ... SELECT ... ON CONFLICT.
+        self.executor.execute(self._sql("""
+            INSERT INTO {inbox} (student_id, assignment_id, class_id, due_date, status)
+            SELECT e.{enrolled_student}, a.id, a.{assignment_class}, a.due_date,
+                   CASE WHEN s.id IS NULL THEN 'pending'
+                        WHEN {grade} IS NOT NULL THEN 'graded'
+                        WHEN s.submitted_at > a.due_date THEN 'late'
+                        ELSE 'submitted' END
+            FROM {assignments} a
+            JOIN {enrollments} e ON e.class_id = a.{assignment_class}
+            LEFT JOIN {submissions} s ON s.id = (
+                SELECT MAX(s2.id) FROM {submissions} s2
+                WHERE s2.assignment_id = a.id AND s2.{submission_student} = e.{enrolled_student})
+            WHERE """ + (' AND '.join(conditions) or '1 = 1') + """
+            ON CONFLICT (student_id, assignment_id) DO UPDATE
+            SET class_id = excluded.class_id, due_date = excluded.due_date, status = excluded.status
+        """), scope)
+        visible = f' AND {self.schema.assignment_visible}' if self.schema.assignment_visible else ''
+        self.executor.execute(self._sql("""
+            DELETE FROM {inbox} WHERE """ + ''.join(f'{key} = %({key})s AND ' for key in scope) + """
+            NOT EXISTS (
+                SELECT 1 FROM {assignments} a
+                JOIN {enrollments} e ON e.class_id = a.{assignment_class}
+                WHERE a.id = {inbox}.assignment_id AND a.{assignment_class} = {inbox}.class_id
+                  AND e.{enrolled_student} = {inbox}.student_id""" + visible + """)
+        """), scope)
+
+    def deadlines(self, student_id, now, end_of_day, end_of_week):
+        """A student's pending assignments due before ``end_of_week``, each
+        with its ``bucket``: ``overdue``, ``today`` or ``this_week``.
+
+        The edges come from :func:`due_dates.bucket_bounds`; all three
+        buckets are one range of the inbox's pending ``(student_id,
+        due_date)`` index.
+        """
+        if not self.schema.inbox:
+            return []
+        rows = self._rows('deadlines', """
+            SELECT i.assignment_id, i.due_date, a.title, c.name AS class_name,
+                   CASE WHEN i.due_date < %(now)s THEN 'overdue'
+                        WHEN i.due_date < %(end_of_day)s THEN 'today'
+                        ELSE 'this_week' END AS bucket
+            FROM {inbox} i
+            JOIN {assignments} a ON a.id = i.assignment_id
+            JOIN {classes} c ON c.id = i.class_id
+            WHERE i.student_id = %(user_id)s AND i.status = 'pending' AND i.due_date < %(end_of_week)s{in_school[a]}
+            ORDER BY i.due_date
+        """, user_id=student_id, now=now, end_of_day=end_of_day, end_of_week=end_of_week)
+        for row in rows:
+            row['due_date'] = _as_datetime(row['due_date'])
+        return rows
+
+    def overdue_count(self, student_id, now):
+        """Pending inbox rows due before ``now``. Assignments fall overdue
+        without a write, so page validators add this to the data version."""
+        if not self.schema.inbox:
+            return 0
+        return self._one('overdue_count', """
+            SELECT COUNT(*) AS overdue FROM {inbox} i JOIN {assignments} a ON a.id = i.assignment_id
+            WHERE i.student_id = %(user_id)s AND i.status = 'pending' AND i.due_date < %(now)s{in_school[a]}
+        """, user_id=student_id, now=now)['overdue']
+
+    def student_directory(self):
+        """Every student's id, username and email, for student_search.py."""
+        return self._rows('student_directory', """
+            SELECT u.id, u.username, u.email FROM {users} u WHERE {student_filter}{in_school[u]}
+        """)
+
+    def student_directory_version(self):
+        """``(count, highest id)`` of the students; moves when one registers
+        or is removed."""
+        row = self._one('student_directory_version', """
+            SELECT COUNT(*) AS students, MAX(u.id) AS last_id FROM {users} u WHERE {student_filter}{in_school[u]}
+        """)
+        return row['students'], row['last_id']
+
+    def enrolled_student_ids(self, class_id):
+        return [row['student_id'] for row in self._rows('enrolled_student_ids', """
+            SELECT e.{enrolled_student} AS student_id FROM {enrollments} e
+            WHERE e.class_id = %(class_id)s{in_school[e]}
+        """, class_id=class_id)]
+
+    def teacher_stats(self, teacher_id):
+        return self._one('teacher_stats', """
+            SELECT
+                (SELECT COUNT(*) FROM {classes} WHERE teacher_id = %(user_id)s) AS total_classes,
+                (SELECT COUNT(DISTINCT e.{enrolled_student}) FROM {enrollments} e
+                 JOIN {classes} c ON c.id = e.class_id
+                 WHERE c.teacher_id = %(user_id)s{in_school[e]}) AS total_students,
+                (SELECT COUNT(*) FROM {assignments} a
+                 JOIN {classes} c ON c.id = a.{assignment_class}
+                 WHERE c.teacher_id = %(user_id)s{in_school[a]}) AS total_assignments
+        """, user_id=teacher_id)
+
+    def student_stats(self, student_id):
+        """Assignment totals, average grade and (where recorded) attendance rate."""
+        attendance = "NULL"
+        if self.schema.attendance:
+            attendance = """(SELECT 100.0 * SUM(CASE WHEN status = 'present' THEN 1 ELSE 0 END)
+                             / NULLIF(COUNT(*), 0)
+                             FROM {attendance} WHERE student_id = %(user_id)s)"""
+        if self.schema.inbox:
+            return self._one('student_stats', """
+                SELECT
+                    (SELECT COUNT(*) FROM {inbox} i JOIN {assignments} a ON a.id = i.assignment_id
+                     WHERE i.student_id = %(user_id)s{in_school[a]}) AS total_assignments,
+                    (SELECT COUNT(*) FROM {inbox} i JOIN {assignments} a ON a.id = i.assignment_id
+                     WHERE i.student_id = %(user_id)s AND i.status <> 'pending'{in_school[a]}) AS completed_assignments,
+                    (SELECT AVG({grade}) FROM {submissions} s
+                     WHERE s.{submission_student} = %(user_id)s{in_school[s]}) AS average_grade,
+                    """ + attendance + """ AS attendance_rate
+            """, user_id=student_id)
+        return self._one('student_stats', """
+            SELECT
+                (SELECT COUNT(*) FROM {assignments} a
+                 WHERE a.{assignment_class} IN (SELECT e.class_id FROM {enrollments} e
+                                                WHERE e.{enrolled_student} = %(user_id)s{in_school[e]})
+                 {in_school[a]}) AS total_assignments,
+                (SELECT COUNT(*) FROM {submissions} s
+                 WHERE s.{submission_student} = %(user_id)s{in_school[s]}) AS completed_assignments,
+                (SELECT AVG({grade}) FROM {submissions} s
+                 WHERE s.{submission_student} = %(user_id)s{in_school[s]}) AS average_grade,
+                """ + attendance + """ AS attendance_rate
+        """, user_id=student_id)
+
+
+class AsyncpgExecutor:
+    """Async executor over an asyncpg pool.
+
+    Each query acquires its own connection, so independent queries can be
+    awaited concurrently with ``asyncio.gather``. asyncpg prepares and caches
+    statements per connection by itself.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def rows(self, sql, params, name=None):
+        sql, names = to_positional(sql)
+        async with self.pool.acquire() as conn:
+            records = await conn.fetch(sql, *(params[key] for key in names))
+        return [dict(record) for record in records]
+
+
+class AsyncRepository(Repository):
+    """:class:`Repository` whose query methods are awaitable."""
+
+    async def _one(self, name, template, **params):
+        rows = await self._rows(name, template, **params)
+        return rows[0] if rows else None
+
+    async def data_version(self, user_id):
+        row = await self._one('data_version', self._data_version_sql(), user_id=user_id)
+        return self._data_version_result(row)
+
+    async def schedules_for_user(self, user_id):
+        if not self.schema.schedules:
+            return []
+        return await super().schedules_for_user(user_id)
+
+    async def at_risk_students(self, teacher_id, limit=10):
+        if not self.schema.student_risk:
+            return []
+        return await super().at_risk_students(teacher_id, limit)
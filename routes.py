@@ -1,30 +1,70 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
-from flask_login import login_user, logout_user, login_required, current_user
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify
+from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 import logging
 from database import db
-from datetime import datetime
-from models import (User, UserProfile, Class, ClassStudents, Assignment, 
+from models import (User, UserProfile, Class, ClassStudents, Assignment, AssignmentInbox,
                    Submission, Grade, Attendance, Notification)
-from forms import (LoginForm, RegistrationForm, ProfileForm, ClassForm,
-                  AssignmentForm, SubmissionForm, GradeForm, AttendanceForm)
 from werkzeug.utils import secure_filename
+from due_dates import bucket_bounds, group_deadlines, to_utc, utcnow
+from http_cache import conditional
+from replicas import REPLICA_ALIAS, reads_from_replica
+from repository import ORM_SCHEMA, Repository, SqlAlchemyExecutor
+from sessions import cached_user_loader, forget_principal
 import os
 import logging
 
 logger = logging.getLogger(__name__)
 
+login_manager = LoginManager()
+login_manager.login_view = 'auth.login'
+login_manager.user_loader(cached_user_loader(db, User, fields=('id', 'username', 'email', 'role', 'school_id')))
+
 # Blueprint definitions
 auth_bp = Blueprint('auth', __name__)
 dashboard_bp = Blueprint('dashboard', __name__)
 assignment_bp = Blueprint('assignment', __name__)
 class_bp = Blueprint('class', __name__)
 
+def repository(read_only=False):
+    """Shared queries, scoped to the signed-in user's school, on the primary
+    or on the replica bind for read-only callers when the request allows it
+    (see replicas.py)."""
+    bind = db.session
+    if read_only and reads_from_replica() and REPLICA_ALIAS in db.engines:
+        bind = db.engines[REPLICA_ALIAS]
+    school_id = current_user.school_id if current_user.is_authenticated else None
+    return Repository(SqlAlchemyExecutor(bind), ORM_SCHEMA, school_id=school_id)
+
+def student_assignments(student_id):
+    """A student's assignments, latest due first, from their inbox rows."""
+    return Assignment.query.join(AssignmentInbox).filter(
+        AssignmentInbox.student_id == student_id
+    ).order_by(AssignmentInbox.due_date.desc()).all()
+
+def user_timezone():
+    profile = current_user.profile
+    return profile.timezone if profile else 'UTC'
+
+def user_data_version():
+    """Cheap validator for pages built from the current user's classes.
+
+    Deadline buckets move without a write, so the version also covers the
+    overdue count and the user's local date.
+    """
+    if not current_user.is_authenticated:
+        return None
+    repo = repository(read_only=True)
+    parts, last_modified = repo.data_version(current_user.id)
+    bounds = bucket_bounds(utcnow(), user_timezone())
+    return parts + (repo.overdue_count(current_user.id, bounds['now']), bounds['end_of_day']), last_modified
+
 # Authentication routes
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('dashboard.index'))
     
+    from forms import LoginForm
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
@@ -40,6 +80,7 @@ def login():
 
 @auth_bp.route('/register', methods=['GET', 'POST'])
 def register():
+    from forms import RegistrationForm
     form = RegistrationForm()
     if form.validate_on_submit():
         try:
@@ -56,19 +97,15 @@ def register():
                        email=form.email.data,
                        role=form.role.data)
             user.set_password(form.password.data)
-            db.session.add(user)
-            db.session.commit()
-            
-            # Create user profile
-            profile = UserProfile(user=user)
-            db.session.add(profile)
+            # User and profile in one transaction
+            db.session.add_all([user, UserProfile(user=user)])
             db.session.commit()
             
             flash('Registration successful! Please login.', 'success')
             return redirect(url_for('auth.login'))
         except Exception as e:
             db.session.rollback()
-            logger.error(f"Error during registration: {str(e)}")
+            logger.exception("Error during registration: %s", e)
             flash('An error occurred during registration. Please try again.', 'error')
     
     return render_template('auth/register.html', form=form)
@@ -76,12 +113,14 @@ def register():
 @auth_bp.route('/logout')
 @login_required
 def logout():
+    forget_principal()
     logout_user()
     return redirect(url_for('auth.login'))
 
 # Dashboard routes
 @dashboard_bp.route('/')
 @login_required
+@conditional(user_data_version)
 def index():
     try:
         if current_user.role == 'teacher':
@@ -89,38 +128,45 @@ def index():
             assignments = Assignment.query.join(Class).filter(
                 Class.teacher_id == current_user.id
             ).order_by(Assignment.due_date.desc()).all()
-            logger.info(f"Teacher dashboard loaded for user {current_user.id}")
+            at_risk_students = repository(read_only=True).at_risk_students(current_user.id)
+            logger.debug("Teacher dashboard loaded for user %s", current_user.id)
         else:
-            assignments = Assignment.query.join(Class).join(ClassStudents).filter(
-                ClassStudents.student_id == current_user.id
-            ).order_by(Assignment.due_date.desc()).all()
+            assignments = student_assignments(current_user.id)
             classes = Class.query.join(ClassStudents).filter(
                 ClassStudents.student_id == current_user.id
             ).all()
-            logger.info(f"Student dashboard loaded for user {current_user.id}")
+            deadlines = group_deadlines(repository(read_only=True).deadlines(
+                current_user.id, **bucket_bounds(utcnow(), user_timezone())))
+            logger.debug("Student dashboard loaded for user %s", current_user.id)
         
         return render_template('dashboard/index.html',
                              classes=classes if 'classes' in locals() else [],
                              assignments=assignments,
-                             now=datetime.utcnow())
+                             at_risk_students=at_risk_students if 'at_risk_students' in locals() else [],
+                             deadlines=deadlines if 'deadlines' in locals() else [],
+                             now=utcnow())
     except Exception as e:
-        logger.error(f"Error loading dashboard: {str(e)}")
+        logger.exception("Error loading dashboard: %s", e)
         flash('Error loading dashboard. Please try again.', 'error')
         return render_template('dashboard/index.html', 
                              classes=[],
                              assignments=[],
-                             now=datetime.utcnow())
+                             now=utcnow())
 
 @dashboard_bp.route('/profile', methods=['GET', 'POST'])
 @login_required
 def profile():
+    from forms import ProfileForm
     form = ProfileForm()
+    if request.method == 'GET':
+        form.timezone.data = user_timezone()
     if form.validate_on_submit():
         if not current_user.profile:
-            profile = UserProfile(user=current_user, bio=form.bio.data)
+            profile = UserProfile(user=current_user, bio=form.bio.data, timezone=form.timezone.data)
             db.session.add(profile)
         else:
             current_user.profile.bio = form.bio.data
+            current_user.profile.timezone = form.timezone.data
         db.session.commit()
         flash('Profile updated successfully')
 
@@ -129,41 +175,22 @@ def profile():
     if current_user.role == 'teacher':
         # Get teacher statistics
         classes = Class.query.filter_by(teacher_id=current_user.id).all()
-        total_students = db.session.query(ClassStudents.student_id).distinct().join(
-            Class, Class.id == ClassStudents.class_id
-        ).filter(Class.teacher_id == current_user.id).count()
-        total_assignments = Assignment.query.join(Class).filter(
-            Class.teacher_id == current_user.id
-        ).count()
+        stats = repository(read_only=True).teacher_stats(current_user.id)
         
         context.update({
             'classes': classes,
-            'total_students': total_students,
-            'total_assignments': total_assignments
+            'total_students': stats['total_students'],
+            'total_assignments': stats['total_assignments']
         })
     else:
         # Get student statistics
-        total_assignments = Assignment.query.join(Class).join(ClassStudents).filter(
-            ClassStudents.student_id == current_user.id
-        ).count()
-        completed_assignments = Submission.query.filter_by(
-            student_id=current_user.id
-        ).count()
-        grades = Grade.query.join(Submission).filter(
-            Submission.student_id == current_user.id
-        ).all()
-        average_grade = sum(grade.score for grade in grades) / len(grades) if grades else None
-        attendance_records = Attendance.query.filter_by(
-            student_id=current_user.id
-        ).all()
-        attendance_rate = (
-            sum(1 for a in attendance_records if a.status == 'present') / len(attendance_records) * 100
-            if attendance_records else None
-        )
+        stats = repository(read_only=True).student_stats(current_user.id)
+        average_grade = stats['average_grade']
+        attendance_rate = stats['attendance_rate']
         
         context.update({
-            'total_assignments': total_assignments,
-            'completed_assignments': completed_assignments,
+            'total_assignments': stats['total_assignments'],
+            'completed_assignments': stats['completed_assignments'],
             'average_grade': f"{average_grade:.1f}" if average_grade is not None else 'N/A',
             'attendance_rate': f"{attendance_rate:.1f}" if attendance_rate is not None else 'N/A'
         })
@@ -173,19 +200,18 @@ def profile():
 # Assignment routes
 @assignment_bp.route('/assignments')
 @login_required
+@conditional(user_data_version)
 def list():
     try:
         if current_user.role == 'teacher':
             assignments = Assignment.query.join(Class).filter(Class.teacher_id == current_user.id).all()
-            logger.info(f"Retrieved {len(assignments)} assignments for teacher {current_user.id}")
+            logger.debug("Retrieved %d assignments for teacher %s", len(assignments), current_user.id)
         else:
-            assignments = Assignment.query.join(Class).join(ClassStudents).filter(
-                ClassStudents.student_id == current_user.id
-            ).order_by(Assignment.due_date.desc()).all()
-            logger.info(f"Retrieved {len(assignments)} assignments for student {current_user.id}")
-        return render_template('assignments/list.html', assignments=assignments, now=datetime.utcnow())
+            assignments = student_assignments(current_user.id)
+            logger.debug("Retrieved %d assignments for student %s", len(assignments), current_user.id)
+        return render_template('assignments/list.html', assignments=assignments, now=utcnow())
     except Exception as e:
-        logger.error(f"Error retrieving assignments: {str(e)}")
+        logger.exception("Error retrieving assignments: %s", e)
         flash('An error occurred while loading assignments', 'error')
         return render_template('assignments/list.html', assignments=[])
 
@@ -196,16 +222,19 @@ def create():
         flash('Only teachers can create assignments')
         return redirect(url_for('assignment.list'))
         
+    from forms import AssignmentForm
     form = AssignmentForm()
     if form.validate_on_submit():
         assignment = Assignment(
             title=form.title.data,
             description=form.description.data,
-            due_date=form.due_date.data,
+            due_date=to_utc(form.due_date.data, user_timezone()),
             teacher_id=current_user.id
         )
         db.session.add(assignment)
         db.session.commit()
+        from notifications import notify_new_assignment
+        notify_new_assignment.delay(assignment.id)
         flash('Assignment created')
         return redirect(url_for('assignment.list'))
     return render_template('assignments/create.html', form=form)
@@ -213,6 +242,7 @@ def create():
 # Class routes
 @class_bp.route('/classes')
 @login_required
+@conditional(user_data_version)
 def list():
     if current_user.role == 'teacher':
         classes = Class.query.filter_by(teacher_id=current_user.id).all()
@@ -221,6 +251,37 @@ def list():
             student_id=current_user.id).all()
     return render_template('classes/list.html', classes=classes)
 
+@class_bp.route('/classes/<int:class_id>/grade-stats')
+@login_required
+def grade_stats(class_id):
+    from analytics import class_grade_stats
+    Class.query.filter_by(id=class_id, teacher_id=current_user.id).first_or_404()
+    return jsonify(class_grade_stats(repository(read_only=True), class_id))
+
+@class_bp.route('/classes/<int:class_id>/gradebook')
+@login_required
+def gradebook(class_id):
+    from streaming import CHUNK_SIZE, gradebook_rows, stream_page
+    class_obj = Class.query.filter_by(id=class_id, teacher_id=current_user.id).first_or_404()
+    assignments = Assignment.query.filter_by(class_id=class_id).order_by(
+        Assignment.due_date, Assignment.id).all()
+    # Plain rows: User eager-loads its profile, which yield_per does not allow
+    students = db.session.query(User.id, User.username).join(
+        ClassStudents, ClassStudents.student_id == User.id
+    ).filter(
+        ClassStudents.class_id == class_id
+    ).order_by(User.id).execution_options(yield_per=CHUNK_SIZE)
+    # Latest submission last, so it wins the cell
+    grades = db.session.query(Submission.student_id, Submission.assignment_id, Grade.score).outerjoin(
+        Grade
+    ).join(Assignment).filter(Assignment.class_id == class_id).order_by(
+        Submission.student_id, Submission.submitted_at
+    ).execution_options(yield_per=CHUNK_SIZE)
+    rows = gradebook_rows(students, grades, [assignment.id for assignment in assignments],
+                          key=lambda student: student.id)
+    return stream_page('classes/gradebook.html', {'gradebook_rows': ('classes/_gradebook_rows.html', rows)},
+                       class_obj=class_obj, assignments=assignments)
+
 @class_bp.route('/classes/create', methods=['GET', 'POST'])
 @login_required
 def create():
@@ -228,12 +289,14 @@ def create():
         flash('Only teachers can create classes')
         return redirect(url_for('class.list'))
         
+    from forms import ClassForm
     form = ClassForm()
     if form.validate_on_submit():
         class_obj = Class(
             name=form.name.data,
             description=form.description.data,
-            teacher_id=current_user.id
+            teacher_id=current_user.id,
+            school_id=current_user.school_id
         )
         db.session.add(class_obj)
         db.session.commit()
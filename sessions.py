@@ -0,0 +1,222 @@
+"""Server-side sessions for the Flask apps.
+
+The cookie only carries a signed session id; the data lives in a
+:class:`RedisSessionStore` (any Redis-compatible server, shared between
+workers) or, when asked for with ``memory://``, a :class:`MemorySessionStore`
+(single process only). Without a store URL the app keeps Flask's signed
+cookie sessions, which work with any number of workers. Sessions are only
+written back when they change, and their expiry is refreshed at most once
+per ``refresh_interval`` instead of on every request.
+
+:func:`cached_user_loader` keeps a small principal for the logged-in user in
+the session so ``flask_login`` does not query ``User`` on every request.
+"""
+from datetime import timedelta
+import json
+import logging
+import secrets
+import threading
+import time
+
+from flask import session as current_session
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+try:
+    import redis
+except ImportError:  # only needed when REDIS_URL is configured
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+PRINCIPAL_KEY = '_principal'
+MEMORY_URL = 'memory://'
+# Keys naming the signed-in user: app.py's own and flask_login's
+AUTH_KEYS = ('user_id', '_user_id')
+
+
+class MemorySessionStore:
+    """Process-local store; suitable for a single worker or development."""
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._data.get(sid)
+            if entry is None:
+                return None
+            payload, expires = entry
+            if expires < time.time():
+                del self._data[sid]
+                return None
+            return payload
+
+    def set(self, sid, payload, ttl):
+        with self._lock:
+            if len(self._data) >= self.max_entries:
+                self._purge()
+            self._data[sid] = (payload, time.time() + ttl)
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def _purge(self):
+        now = time.time()
+        for sid in [sid for sid, (_, expires) in self._data.items() if expires < now]:
+            del self._data[sid]
+        while len(self._data) >= self.max_entries:
+            self._data.pop(next(iter(self._data)))
+
+
+class RedisSessionStore:
+    """Store backed by any server speaking the Redis protocol."""
+
+    def __init__(self, client, prefix='session:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, sid):
+        payload = self.client.get(self.prefix + sid)
+        return payload.decode() if payload is not None else None
+
+    def set(self, sid, payload, ttl):
+        self.client.set(self.prefix + sid, payload, ex=int(ttl))
+
+    def delete(self, sid):
+        self.client.delete(self.prefix + sid)
+
+
+def make_session_store(url):
+    """Return an in-process store for :data:`MEMORY_URL`, else a Redis store for ``url``."""
+    if url == MEMORY_URL:
+        return MemorySessionStore()
+    if redis is None:
+        raise RuntimeError('REDIS_URL is set but the redis package is not installed')
+    return RedisSessionStore(redis.Redis.from_url(url))
+
+
+def _signed_in_as(data):
+    return tuple(data.get(key) for key in AUTH_KEYS)
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False, loaded_at=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.loaded_at = loaded_at
+        self.signed_in_as = _signed_in_as(self)
+
+
+class ServerSideSessionInterface(SessionInterface):
+    serializer = json
+
+    def __init__(self, store, refresh_interval=timedelta(minutes=5)):
+        self.store = store
+        self.refresh_interval = refresh_interval.total_seconds()
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='server-side-session')
+
+    def _ttl(self, app):
+        return app.permanent_session_lifetime.total_seconds()
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            if sid:
+                payload = self.store.get(sid)
+                if payload is not None:
+                    data = self.serializer.loads(payload)
+                    loaded_at = data.pop('_t', None)
+                    return ServerSideSession(data, sid=sid, loaded_at=loaded_at)
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        ttl = self._ttl(app)
+        now = time.time()
+        # A new id whenever the signed-in user changes, so an id planted
+        # before login (session fixation) is worthless after it
+        if _signed_in_as(session) != session.signed_in_as:
+            if not session.new:
+                self.store.delete(session.sid)
+            session.sid = secrets.token_urlsafe(32)
+            session.signed_in_as = _signed_in_as(session)
+            session.new = True
+        stale = session.loaded_at is None or now - session.loaded_at > self.refresh_interval
+        # Unchanged sessions are only re-written periodically to extend expiry
+        if not (session.modified or session.new or stale):
+            return
+        payload = dict(session, _t=now)
+        self.store.set(session.sid, self.serializer.dumps(payload, separators=(',', ':')), ttl)
+
+        response.set_cookie(
+            name, self._signer(app).sign(session.sid).decode(),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app),
+        )
+        response.vary.add('Cookie')
+
+
+def init_sessions(app, url=None):
+    """Install server-side sessions on ``app`` kept in the store at ``url``.
+
+    Without ``url`` the app keeps Flask's cookie sessions: a per-process
+    store would sign users out whenever another worker takes their request.
+    """
+    if not url:
+        logger.info("No session store configured, using signed cookie sessions")
+        return app.session_interface
+    app.session_interface = ServerSideSessionInterface(make_session_store(url))
+    return app.session_interface
+
+
+def cached_user_loader(db, model, fields=('id', 'username', 'email', 'role')):
+    """Build a ``flask_login`` user loader that serves the user from the session.
+
+    The first request after login loads the row and stores ``fields`` in the
+    session; later requests rebuild a detached instance and attach it with
+    ``merge(load=False)``, which issues no SQL. Relationships still lazy-load
+    on access.
+    """
+    from sqlalchemy.orm import make_transient_to_detached
+
+    def load_user(user_id):
+        principal = current_session.get(PRINCIPAL_KEY)
+        if principal and str(principal.get('id')) == str(user_id):
+            user = model(**principal)
+            make_transient_to_detached(user)
+            return db.session.merge(user, load=False)
+        user = db.session.get(model, int(user_id))
+        if user is not None:
+            current_session[PRINCIPAL_KEY] = {field: getattr(user, field) for field in fields}
+        return user
+
+    return load_user
+
+
+def forget_principal():
+    """Drop the cached principal, e.g. on logout or after editing the user."""
+    current_session.pop(PRINCIPAL_KEY, None)
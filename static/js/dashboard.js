@@ -64,3 +64,21 @@ function saveCardChanges() {
         }
     });
 }
+
+// Grade summaries for the teacher's classes (filled in after page load)
+function loadGradeStats() {
+    document.querySelectorAll('[data-grade-stats-url]').forEach(element => {
+        fetch(element.dataset.gradeStatsUrl, {credentials: 'same-origin'})
+        .then(response => response.ok ? response.json() : null)
+        .then(data => {
+            if (!data || !data.overall.count) {
+                return;
+            }
+            const overall = data.overall;
+            element.textContent = `Average ${overall.mean} · median ${overall.percentiles.p50}` +
+                ` · std ${overall.std} (${overall.count} graded)`;
+        });
+    });
+}
+
+document.addEventListener('DOMContentLoaded', loadGradeStats);
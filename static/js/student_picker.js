@@ -0,0 +1,45 @@
+// Add-student autocomplete: queries the picker's search URL as the teacher types
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('.student-picker').forEach(function(picker) {
+        const input = picker.querySelector('input[type="search"]');
+        const selected = picker.querySelector('input[type="hidden"]');
+        const results = picker.querySelector('.student-picker-results');
+        let timer = null;
+        let latest = 0;
+
+        function choose(student) {
+            selected.value = student.id;
+            input.value = `${student.username} (${student.email})`;
+            results.replaceChildren();
+        }
+
+        input.addEventListener('input', function() {
+            selected.value = '';
+            clearTimeout(timer);
+            const query = input.value.trim();
+            if (!query) {
+                results.replaceChildren();
+                return;
+            }
+            timer = setTimeout(function() {
+                const request = ++latest;
+                fetch(`${picker.dataset.searchUrl}?q=${encodeURIComponent(query)}`)
+                    .then(response => response.json())
+                    .then(data => {
+                        // Answers to earlier keystrokes can arrive late
+                        if (request !== latest) {
+                            return;
+                        }
+                        results.replaceChildren(...data.results.map(function(student) {
+                            const item = document.createElement('button');
+                            item.type = 'button';
+                            item.className = 'list-group-item list-group-item-action';
+                            item.textContent = `${student.username} (${student.email})`;
+                            item.addEventListener('click', () => choose(student));
+                            return item;
+                        }));
+                    });
+            }, 150);
+        });
+    });
+});
@@ -0,0 +1,83 @@
+"""Streamed rendering of pages with long listings.
+
+A page such as a class roster or gradebook is rendered once with a marker
+in place of each long listing. The response then sends the page text up
+to a marker, then that listing in chunks rendered with a row template, and
+so on. Rows come from server-side cursors (``QuerySet.iterator`` in
+Django, ``yield_per`` in SQLAlchemy). The first byte goes out as soon as
+the page head is rendered, and memory holds only one chunk of rows,
+whatever the class size.
+
+:func:`stream_page` does this for Flask. ``dashboard/streaming.py`` is the
+Django counterpart.
+"""
+from itertools import groupby, islice
+
+CHUNK_SIZE = 500
+
+
+def marker(name):
+    return f'<!--stream:{name}-->'
+
+
+def page_parts(page, names):
+    """Split ``page`` at the markers of ``names``; yields ``(text, name)``
+    pairs in page order, ending with ``(tail, None)``."""
+    names = sorted(names, key=lambda name: page.index(marker(name)))
+    for name in names:
+        head, page = page.split(marker(name), 1)
+        yield head, name
+    yield page, None
+
+
+def chunked(iterable, size=CHUNK_SIZE):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def gradebook_rows(students, grades, assignment_ids, key):
+    """Merge two cursors into gradebook rows, one student at a time.
+
+    ``students`` and ``grades`` -- ``(student_key, assignment_id, grade)``
+    tuples -- must both be sorted by ``key(student)`` / ``student_key``.
+    Yields ``{'student', 'cells'}`` where each cell is the grade,
+    ``'submitted'`` for an ungraded submission or ``None``.
+    """
+    column = {assignment_id: index for index, assignment_id in enumerate(assignment_ids)}
+    groups = groupby(grades, key=lambda grade: grade[0])
+    pending = next(groups, None)
+    for student in students:
+        student_key = key(student)
+        cells = [None] * len(column)
+        # Skip submissions of students no longer enrolled
+        while pending is not None and pending[0] < student_key:
+            pending = next(groups, None)
+        if pending is not None and pending[0] == student_key:
+            for _, assignment_id, grade in pending[1]:
+                if assignment_id in column:
+                    cells[column[assignment_id]] = 'submitted' if grade is None else grade
+            pending = next(groups, None)
+        yield {'student': student, 'cells': cells}
+
+
+def stream_page(template_name, streams, **context):
+    """Flask response streaming ``template_name``.
+
+    ``streams`` maps a context name, which the page template outputs where
+    the listing goes, to ``(row_template, rows)``. Each row template gets
+    the page context plus ``rows``, which it loops over, and is streamed
+    with ``flask.stream_template``.
+    """
+    from flask import current_app, render_template, stream_template, stream_with_context
+    from markupsafe import Markup
+    page = render_template(template_name, **context, **{name: Markup(marker(name)) for name in streams})
+
+    def generate():
+        for text, name in page_parts(page, streams):
+            yield text
+            if name is not None:
+                row_template, rows = streams[name]
+                yield from stream_template(row_template, **context, rows=rows)
+
+    return current_app.response_class(stream_with_context(generate()), mimetype='text/html')
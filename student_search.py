@@ -0,0 +1,123 @@
+"""Prefix search over students for the "add student" pickers.
+
+Listing every student in a ``<select>`` stops working at district size, so
+the pickers ask :func:`search_students` for the first few students whose
+username or email starts with what the teacher has typed so far.
+
+Each process keeps a :class:`StudentDirectory` in memory per schema, and
+per school for repositories scoped to one (see tenants.py): every
+student's lower-cased username and email, with their id, in one sorted
+list. A prefix is found by bisection and its matches are the run of keys
+that follows, already in order, so a lookup takes microseconds whatever the
+number of students. 100k students take a few tens of megabytes.
+
+The directory is loaded with one query (:meth:`repository.Repository.student_directory`).
+After that, at most every ``check_interval`` seconds, a count query
+(:meth:`~repository.Repository.student_directory_version`) notices new or
+removed students and triggers a reload. Renamed students are picked up
+within ``ttl`` seconds.
+"""
+from array import array
+from bisect import bisect_left
+import threading
+import time
+
+from instrumentation import record_cache
+
+LIMIT = 10
+MAX_LIMIT = 50
+
+
+class StudentDirectory:
+    """Immutable snapshot of the students of one schema or school."""
+
+    def __init__(self, rows, version):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.students = {}
+        entries = []
+        for row in rows:
+            self.students[row['id']] = (row['username'], row['email'])
+            entries.append((row['username'].lower(), row['id']))
+            if row['email']:
+                entries.append((row['email'].lower(), row['id']))
+        entries.sort()
+        self.keys = [key for key, _ in entries]
+        self.ids = array('q', (student_id for _, student_id in entries))
+
+    def __len__(self):
+        return len(self.students)
+
+    def search(self, prefix, limit=LIMIT, exclude=frozenset()):
+        """Up to ``limit`` students with a username or email starting with
+        ``prefix`` (case-insensitive), in order of the matching key."""
+        prefix = prefix.lower()
+        found, seen = [], set()
+        for index in range(bisect_left(self.keys, prefix), len(self.keys)):
+            if not self.keys[index].startswith(prefix):
+                break
+            student_id = self.ids[index]
+            if student_id in seen or student_id in exclude:
+                continue
+            seen.add(student_id)
+            username, email = self.students[student_id]
+            found.append({'id': student_id, 'username': username, 'email': email})
+            if len(found) == limit:
+                break
+        return found
+
+
+class StudentSearch:
+    """Directories per schema and school, reloaded when the student count
+    moves or after ``ttl`` seconds."""
+
+    def __init__(self, ttl=600, check_interval=5):
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._directories = {}
+        self._checked = {}
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def directory(self, repo):
+        name = (repo.schema.name, repo.school_id)
+        now = time.monotonic()
+        with self._lock:
+            directory = self._directories.get(name)
+            checked = self._checked.get(name, 0)
+        if directory is not None and now - directory.loaded_at < self.ttl:
+            if now - checked < self.check_interval:
+                record_cache('student_search', True)
+                return directory
+            if repo.student_directory_version() == directory.version:
+                with self._lock:
+                    self._checked[name] = now
+                record_cache('student_search', True)
+                return directory
+        record_cache('student_search', False)
+        # One load at a time; requests queued behind it reuse its result
+        with self._load_lock:
+            with self._lock:
+                current = self._directories.get(name)
+            if current is not None and current is not directory:
+                return current
+            # Version first: a student added during the load triggers another
+            version = repo.student_directory_version()
+            directory = StudentDirectory(repo.student_directory(), version)
+            with self._lock:
+                self._directories[name] = directory
+                self._checked[name] = time.monotonic()
+        return directory
+
+
+students = StudentSearch()
+
+
+def search_students(repo, query, class_id=None, limit=LIMIT, index=students):
+    """JSON-ready matches for ``query``, leaving out students already in
+    ``class_id``."""
+    query = query.strip()
+    if not query:
+        return []
+    exclude = frozenset(repo.enrolled_student_ids(class_id)) if class_id else frozenset()
+    return index.directory(repo).search(query, max(1, min(limit, MAX_LIMIT)), exclude)
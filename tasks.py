@@ -0,0 +1,465 @@
+"""Background tasks, run by a local worker pool out of the request path.
+
+Functions decorated with :func:`task` can be queued from any of the front
+ends with ``func.delay(*args, **kwargs)`` (or ``func.schedule(...)`` for a
+later time) and are run by ``python -m tasks``, a supervisor that keeps
+``--processes`` worker processes busy.
+
+The queue is a SQLite file in WAL mode (``TASK_QUEUE_PATH``), so enqueuing
+is a local insert of well under a millisecond and needs no extra service;
+the web processes and the workers only have to share a disk. Each task
+has:
+
+* ``retries`` with exponential backoff (``backoff ** attempt`` seconds);
+* an optional ``concurrency`` cap across all workers, applied when a job is
+  claimed;
+* an optional ``every`` interval for periodic tasks, kept scheduled by the
+  supervisor;
+* a ``timeout`` after which a job whose worker died is queued again.
+
+A periodic task that resumes where its last run stopped keeps that point
+in the queue file too (:meth:`TaskQueue.set_mark`), so it survives worker
+restarts and is shared by every worker process.
+
+Throughput and queue latency are kept per task in the queue file and show up
+on the web apps' ``/metrics`` as ``tasks_processed_total``,
+``task_queue_wait_seconds_total``, ``task_run_seconds_total`` and
+``tasks_pending``. With ``TASKS_EAGER=1`` tasks run inline, for development.
+
+Task arguments must be JSON serializable; pass ids, not model instances.
+"""
+import argparse
+from contextlib import ExitStack, contextmanager
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+
+from instrumentation import metrics
+from logconfig import configure_logging
+
+logger = logging.getLogger(__name__)
+
+QUEUE_PATH = os.environ.get(
+    'TASK_QUEUE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'tasks.sqlite3'))
+EAGER = os.environ.get('TASKS_EAGER', '').lower() in ('1', 'true', 'yes')
+RETENTION_SECONDS = 7 * 24 * 3600
+MAX_BACKOFF = 3600
+
+metrics.describe('tasks_enqueued_total', 'Background tasks queued by this process')
+metrics.describe('tasks_processed_total', 'Background task attempts by task and result')
+metrics.describe('task_queue_wait_seconds_total', 'Time tasks spent queued past their run time')
+metrics.describe('task_run_seconds_total', 'Time spent running tasks')
+metrics.describe('tasks_pending', 'Tasks queued or running, by task and state')
+
+_registry = {}
+
+_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS tasks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        state TEXT NOT NULL DEFAULT 'queued',
+        run_at REAL NOT NULL,
+        enqueued_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL,
+        worker TEXT,
+        last_error TEXT,
+        batch TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_tasks_ready ON tasks (state, run_at)",
+    "CREATE INDEX IF NOT EXISTS idx_tasks_name ON tasks (name, state)",
+    "CREATE INDEX IF NOT EXISTS idx_tasks_batch ON tasks (batch)",
+    """CREATE TABLE IF NOT EXISTS task_stats (
+        name TEXT NOT NULL,
+        result TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        wait_seconds REAL NOT NULL DEFAULT 0,
+        run_seconds REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (name, result)
+    )""",
+    # Progress of periodic tasks between runs, e.g. how far a sweep got
+    """CREATE TABLE IF NOT EXISTS task_marks (
+        name TEXT PRIMARY KEY,
+        value REAL NOT NULL
+    )""",
+)
+# Columns added to ``tasks`` since queue files were first created, with their
+# DDL; older files get them on open
+_ADDED_COLUMNS = (
+    ('batch', 'TEXT'),
+)
+
+
+class TaskQueue:
+    """The queue file; one connection per thread, opened lazily."""
+
+    def __init__(self, path=QUEUE_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(_SCHEMA[0])
+            self._add_missing_columns(conn)
+            for statement in _SCHEMA[1:]:
+                conn.execute(statement)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @staticmethod
+    def _add_missing_columns(conn):
+        # Under the write lock, so two processes opening an old file do not
+        # both add a column
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(tasks)")}
+            for column, ddl in _ADDED_COLUMNS:
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE tasks ADD COLUMN {column} {ddl}")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def enqueue(self, name, args=(), kwargs=None, run_at=None, max_attempts=1, batch=None):
+        now = time.time()
+        payload = json.dumps({'args': list(args), 'kwargs': kwargs or {}})
+        cur = self._connection().execute(
+            "INSERT INTO tasks (name, payload, run_at, enqueued_at, max_attempts, batch)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (name, payload, run_at or now, now, max_attempts, batch))
+        metrics.inc('tasks_enqueued_total', task=name)
+        return cur.lastrowid
+
+    def claim(self, worker, limits=None):
+        """Mark the next due job running and return it, or ``None``.
+
+        Tasks already running ``limits[name]`` times are skipped.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            busy = []
+            if limits:
+                running = dict(conn.execute(
+                    "SELECT name, COUNT(*) FROM tasks WHERE state = 'running' GROUP BY name").fetchall())
+                busy = [name for name, limit in limits.items() if running.get(name, 0) >= limit]
+            row = conn.execute(
+                "SELECT * FROM tasks WHERE state = 'queued' AND run_at <= ?"
+                f" AND name NOT IN ({', '.join('?' * len(busy))})"
+                " ORDER BY run_at, id LIMIT 1", (now, *busy)).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE tasks SET state = 'running', started_at = ?, attempts = attempts + 1, worker = ?"
+                " WHERE id = ?", (now, worker, row['id']))
+        job = dict(row)
+        job.update(started_at=now, attempts=row['attempts'] + 1, worker=worker)
+        return job
+
+    def _record(self, conn, job, result, finished):
+        conn.execute(
+            "INSERT INTO task_stats (name, result, count, wait_seconds, run_seconds) VALUES (?, ?, 1, ?, ?)"
+            " ON CONFLICT (name, result) DO UPDATE SET count = count + 1,"
+            " wait_seconds = wait_seconds + excluded.wait_seconds,"
+            " run_seconds = run_seconds + excluded.run_seconds",
+            (job['name'], result, max(job['started_at'] - job['run_at'], 0.0),
+             finished - job['started_at']))
+
+    def complete(self, job):
+        finished = time.time()
+        with self._transaction() as conn:
+            conn.execute("UPDATE tasks SET state = 'done', finished_at = ?, last_error = NULL WHERE id = ?",
+                         (finished, job['id']))
+            self._record(conn, job, 'success', finished)
+
+    def fail(self, job, error, backoff=2.0):
+        """Queue the job again after a backoff, or mark it failed when out of attempts."""
+        finished = time.time()
+        with self._transaction() as conn:
+            if job['attempts'] < job['max_attempts']:
+                delay = min(backoff ** job['attempts'], MAX_BACKOFF)
+                conn.execute("UPDATE tasks SET state = 'queued', run_at = ?, worker = NULL, last_error = ?"
+                             " WHERE id = ?", (finished + delay, error, job['id']))
+                self._record(conn, job, 'retry', finished)
+            else:
+                conn.execute("UPDATE tasks SET state = 'failed', finished_at = ?, last_error = ? WHERE id = ?",
+                             (finished, error, job['id']))
+                self._record(conn, job, 'failure', finished)
+
+    def requeue_stale(self, timeouts, default_timeout):
+        """Queue again jobs whose worker stopped without finishing them."""
+        now = time.time()
+        requeued = 0
+        with self._transaction() as conn:
+            for row in conn.execute("SELECT id, name, started_at FROM tasks WHERE state = 'running'").fetchall():
+                if now - row['started_at'] > timeouts.get(row['name'], default_timeout):
+                    conn.execute("UPDATE tasks SET state = 'queued', run_at = ?, worker = NULL,"
+                                 " last_error = 'worker lost' WHERE id = ?", (now, row['id']))
+                    requeued += 1
+        return requeued
+
+    def ensure_periodic(self, name, every):
+        """Keep one run of a periodic task queued, ``every`` seconds after the last."""
+        with self._transaction() as conn:
+            pending = conn.execute("SELECT 1 FROM tasks WHERE name = ? AND state IN ('queued', 'running')",
+                                   (name,)).fetchone()
+            if pending is not None:
+                return
+            last = conn.execute("SELECT MAX(started_at) FROM tasks WHERE name = ?", (name,)).fetchone()[0]
+            now = time.time()
+            conn.execute(
+                "INSERT INTO tasks (name, payload, run_at, enqueued_at, max_attempts) VALUES (?, ?, ?, ?, ?)",
+                (name, json.dumps({'args': [], 'kwargs': {}}),
+                 max(now, last + every) if last else now, now, _registry[name].retries + 1))
+
+    def progress(self, batch):
+        """Job counts by state for a ``batch``, plus ``total``."""
+        counts = dict(self._connection().execute(
+            "SELECT state, COUNT(*) FROM tasks WHERE batch = ? GROUP BY state", (batch,)).fetchall())
+        return {'total': sum(counts.values()),
+                **{state: counts.get(state, 0) for state in ('queued', 'running', 'done', 'failed')}}
+
+    def get_mark(self, name, default=None):
+        """The number last stored under ``name`` by :meth:`set_mark`, else ``default``."""
+        row = self._connection().execute("SELECT value FROM task_marks WHERE name = ?", (name,)).fetchone()
+        return row['value'] if row is not None else default
+
+    def set_mark(self, name, value):
+        self._connection().execute(
+            "INSERT INTO task_marks (name, value) VALUES (?, ?)"
+            " ON CONFLICT (name) DO UPDATE SET value = excluded.value", (name, value))
+
+    def prune(self, older_than=RETENTION_SECONDS):
+        self._connection().execute("DELETE FROM tasks WHERE state IN ('done', 'failed') AND finished_at < ?",
+                                   (time.time() - older_than,))
+
+    def samples(self):
+        """Metric samples for :meth:`instrumentation.Metrics.collector`."""
+        conn = self._connection()
+        samples = []
+        for row in conn.execute("SELECT * FROM task_stats"):
+            samples.append(('tasks_processed_total', 'counter',
+                            {'task': row['name'], 'result': row['result']}, row['count']))
+            labels = {'task': row['name'], 'result': row['result']}
+            samples.append(('task_queue_wait_seconds_total', 'counter', labels, row['wait_seconds']))
+            samples.append(('task_run_seconds_total', 'counter', labels, row['run_seconds']))
+        for row in conn.execute("SELECT name, state, COUNT(*) AS n FROM tasks"
+                                " WHERE state IN ('queued', 'running') GROUP BY name, state"):
+            samples.append(('tasks_pending', 'gauge', {'task': row['name'], 'state': row['state']}, row['n']))
+        return samples
+
+
+_queue = None
+
+
+def get_queue():
+    global _queue
+    if _queue is None:
+        _queue = TaskQueue()
+    return _queue
+
+
+@metrics.collector
+def _queue_samples():
+    if not os.path.exists(QUEUE_PATH):
+        return []
+    return get_queue().samples()
+
+
+class Task:
+    def __init__(self, func, name, retries, backoff, concurrency, every, timeout):
+        self.func = func
+        self.name = name
+        self.retries = retries
+        self.backoff = backoff
+        self.concurrency = concurrency
+        self.every = every
+        self.timeout = timeout
+        self.__doc__ = func.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        """Queue a run as soon as a worker is free; returns the job id."""
+        return self.schedule(args, kwargs)
+
+    def schedule(self, args=(), kwargs=None, countdown=None, eta=None, batch=None):
+        """Queue a run at ``eta`` (a Unix time) or ``countdown`` seconds from now.
+
+        Jobs sharing a ``batch`` id (see :func:`new_batch`) can be followed
+        together with :meth:`TaskQueue.progress`.
+        """
+        if EAGER:
+            self.func(*args, **(kwargs or {}))
+            return None
+        run_at = eta if eta is not None else time.time() + countdown if countdown else None
+        return get_queue().enqueue(self.name, args, kwargs, run_at=run_at, max_attempts=self.retries + 1,
+                                   batch=batch)
+
+
+def new_batch():
+    return uuid.uuid4().hex
+
+
+def task(name=None, retries=3, backoff=2.0, concurrency=None, every=None, timeout=900):
+    """Register a function as a background task (see the module docstring)."""
+    def register(func):
+        task_name = name or f'{func.__module__}.{func.__qualname__}'
+        registered = _registry[task_name] = Task(func, task_name, retries, backoff, concurrency, every, timeout)
+        return registered
+    return register
+
+
+# -- Workers -----------------------------------------------------------------
+
+def _bootstrap(modules, flask_app):
+    """Import the task modules; returns a per-job context factory that
+    enters the Django and Flask contexts configured (either, both or none)."""
+    contexts = []
+    if os.environ.get('DJANGO_SETTINGS_MODULE'):
+        import django
+        from django.db import close_old_connections
+        django.setup()
+
+        @contextmanager
+        def django_connections():
+            close_old_connections()
+            try:
+                yield
+            finally:
+                close_old_connections()
+        contexts.append(django_connections)
+    if flask_app:
+        module, _, attr = flask_app.partition(':')
+        app = getattr(importlib.import_module(module), attr or 'app')
+        contexts.append(app.app_context)
+    for module in modules:
+        importlib.import_module(module)
+
+    @contextmanager
+    def context():
+        with ExitStack() as stack:
+            for factory in contexts:
+                stack.enter_context(factory())
+            yield
+    return context
+
+
+def _run(queue, job, context):
+    registered = _registry.get(job['name'])
+    if registered is None:
+        job['max_attempts'] = job['attempts']
+        queue.fail(job, f"unknown task {job['name']!r}")
+        return
+    payload = json.loads(job['payload'])
+    try:
+        with context():
+            registered.func(*payload['args'], **payload['kwargs'])
+    except Exception:
+        logger.exception("Task %s (job %s, attempt %s) failed", job['name'], job['id'], job['attempts'])
+        queue.fail(job, traceback.format_exc(limit=5), backoff=registered.backoff)
+    else:
+        queue.complete(job)
+
+
+def _work(path, modules, flask_app, stop, poll_interval):
+    # The supervisor owns shutdown: the current job finishes, then ``stop`` ends the loop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    configure_logging()
+    context = _bootstrap(modules, flask_app)
+    queue = TaskQueue(path)
+    worker = f'{socket.gethostname()}:{os.getpid()}'
+    limits = {name: t.concurrency for name, t in _registry.items() if t.concurrency}
+    while not stop.is_set():
+        job = queue.claim(worker, limits)
+        if job is None:
+            stop.wait(poll_interval)
+            continue
+        _run(queue, job, context)
+
+
+def run_workers(processes, modules=(), flask_app=None, path=QUEUE_PATH, poll_interval=0.5,
+                maintenance_interval=30):
+    """Run ``processes`` workers until SIGTERM/SIGINT, restarting any that die."""
+    _bootstrap(modules, flask_app)
+    queue = TaskQueue(path)
+    stop = multiprocessing.Event()
+    args = (path, modules, flask_app, stop, poll_interval)
+
+    def spawn():
+        # Not daemonic, so tasks may start process pools of their own
+        process = multiprocessing.Process(target=_work, args=args, name='task-worker')
+        process.start()
+        return process
+
+    # Setting ``stop`` inside the handler could deadlock against ``stop.wait``
+    shutdown = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: shutdown.set())
+    workers = [spawn() for _ in range(processes)]
+    logger.info("Started %d task workers on %s (%d tasks)", processes, path, len(_registry))
+    timeouts = {name: t.timeout for name, t in _registry.items()}
+    while not shutdown.is_set():
+        requeued = queue.requeue_stale(timeouts, default_timeout=900)
+        if requeued:
+            logger.warning("Requeued %d tasks from lost workers", requeued)
+        for name, registered in _registry.items():
+            if registered.every:
+                queue.ensure_periodic(name, registered.every)
+        queue.prune()
+        for index, process in enumerate(workers):
+            if not process.is_alive():
+                logger.warning("Task worker %s exited with %s, restarting", process.pid, process.exitcode)
+                workers[index] = spawn()
+        shutdown.wait(maintenance_interval)
+    stop.set()
+    for process in workers:
+        process.join(timeout=30)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run background task workers')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--import', dest='modules', action='append',
+                        default=[m for m in os.environ.get('TASK_MODULES', '').split(',') if m],
+                        help='module defining tasks (repeatable; default: TASK_MODULES)')
+    parser.add_argument('--flask-app', default=os.environ.get('TASK_FLASK_APP'),
+                        help='module:app whose app context Flask-SQLAlchemy tasks run in')
+    args = parser.parse_args(argv)
+    configure_logging()
+    run_workers(args.processes, args.modules, args.flask_app)
+
+
+if __name__ == '__main__':
+    main()
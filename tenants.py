@@ -0,0 +1,131 @@
+"""Schools (tenants) and per-school partitions for the psycopg2 app.
+
+A district runs many schools in one database. Every user and class of
+``app.py`` belongs to a school (``school_id``). The big per-class tables,
+listed in :data:`PARTITIONED`, are Postgres list partitions by
+``school_id``. Each school has its own partition of each table, with its
+own indexes, and queries name the school (see ``{in_school[...]}`` in
+repository.py) so Postgres only reads that school's partitions. A school's
+query time depends on its own size, not on how many schools share the
+database.
+
+A school and its partitions are created together by :func:`create_school`
+(``python -m tenants create <slug> <name>``). ``app.init_db`` creates the
+partitioned tables. It also converts plain tables left by older versions,
+moving each row into the partition of its class's school.
+
+The Flask-SQLAlchemy models and the Django ``dashboard`` app, whose tables
+are created by ``create_all`` and syncdb, carry an indexed ``school_id``
+instead of partitions. Their repositories filter on it the same way, and
+their existing rows are moved into :data:`DEFAULT_SCHOOL` when the column
+is added (``database.ADDED_COLUMNS``, ``dashboard.signals.ADDED_FIELDS``).
+"""
+import argparse
+import logging
+
+from logconfig import configure_logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCHOOL = 1
+
+# Parents before the tables referencing them
+PARTITIONED = ('class_students', 'assignments', 'student_assignments')
+
+
+def partition_name(table, school_id):
+    return f'{table}_s{int(school_id)}'
+
+
+def school_ids(cur):
+    cur.execute("SELECT id FROM schools ORDER BY id")
+    return [row[0] for row in cur.fetchall()]
+
+
+def create_partitions(cur, schools, tables=PARTITIONED):
+    for table in tables:
+        for school_id in schools:
+            cur.execute(f"CREATE TABLE IF NOT EXISTS {partition_name(table, school_id)}"
+                        f" PARTITION OF {table} FOR VALUES IN ({int(school_id)})")
+
+
+def partition_table(cur, table, create_sql, columns, school_sql):
+    """Create ``table`` from ``create_sql`` (``PARTITION BY LIST (school_id)``)
+    with a partition per school.
+
+    An existing plain table of that name is renamed out of the way and its
+    rows are copied over, with ``school_sql`` (over the old table aliased
+    ``l``) giving each row's school. Ids keep coming from the old sequence.
+    All of it is one transaction, also on an autocommit connection.
+    """
+    own_transaction = cur.connection.autocommit
+    if own_transaction:
+        cur.execute("BEGIN")
+    try:
+        _partition_table(cur, table, create_sql, columns, school_sql)
+    except Exception:
+        if own_transaction:
+            cur.execute("ROLLBACK")
+        raise
+    if own_transaction:
+        cur.execute("COMMIT")
+
+
+def _partition_table(cur, table, create_sql, columns, school_sql):
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cur.fetchone()
+    legacy = None
+    if row is not None and row[0] != 'p':
+        legacy = f'{table}_unpartitioned'
+        cur.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+        cur.execute(f"ALTER SEQUENCE IF EXISTS {table}_id_seq OWNED BY NONE")
+    cur.execute(f"CREATE SEQUENCE IF NOT EXISTS {table}_id_seq")
+    cur.execute(create_sql)
+    cur.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+    create_partitions(cur, school_ids(cur), tables=(table,))
+    if legacy is not None:
+        column_list = ', '.join(columns)
+        cur.execute(f"INSERT INTO {table} (school_id, {column_list})"
+                    f" SELECT {school_sql}, {column_list} FROM {legacy} l")
+        logger.info("Moved %d rows of %s into per-school partitions", cur.rowcount, table)
+        cur.execute(f"DROP TABLE {legacy} CASCADE")
+
+
+def create_school(cur, slug, name, timezone='UTC'):
+    """Add a school and its partitions; returns its id. ``timezone`` is the
+    zone its weekly schedules are written in."""
+    cur.execute("INSERT INTO schools (slug, name, timezone) VALUES (%s, %s, %s) RETURNING id",
+                (slug, name, timezone))
+    school_id = cur.fetchone()[0]
+    create_partitions(cur, [school_id])
+    return school_id
+
+
+def main(argv=None):
+    import psycopg2
+    parser = argparse.ArgumentParser(description="Manage the schools of app.py's database (PG* settings)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    create = commands.add_parser('create', help='add a school and its partitions')
+    create.add_argument('slug')
+    create.add_argument('name')
+    create.add_argument('--timezone', default='UTC', help='IANA zone of its timetable (default UTC)')
+    commands.add_parser('list', help='list schools')
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    conn = psycopg2.connect('')
+    try:
+        with conn, conn.cursor() as cur:
+            if args.command == 'create':
+                school_id = create_school(cur, args.slug, args.name, args.timezone)
+                logger.info("Created school %s (%s)", school_id, args.slug)
+            else:
+                cur.execute("SELECT id, slug, name, timezone FROM schools ORDER BY id")
+                for school_id, slug, name, timezone in cur.fetchall():
+                    print(f'{school_id}\t{slug}\t{name}\t{timezone}')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
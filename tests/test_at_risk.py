@@ -0,0 +1,153 @@
+"""At-risk scoring: the NumPy scoring of a chunk, and incremental runs.
+
+Incremental runs go through :func:`at_risk.run` on ``models.py``'s tables
+in a SQLite file, so the ``_changed_students`` subquery is exercised as the
+nightly job runs it.
+"""
+from datetime import date, datetime, timedelta
+import math
+
+import pytest
+from sqlalchemy import create_engine, text
+
+import at_risk
+from at_risk import score_chunk
+from repository import ORM_SCHEMA
+
+nan = math.nan
+
+
+def test_score_chunk_features_and_levels():
+    work = [
+        # Four due: graded 90, 80, 70 (the last late), then one never handed in
+        (1, 1, 0, 90), (1, 1, 0, 80), (1, 1, 1, 70), (1, 0, 0, None),
+        # Both on time, grades rising
+        (2, 1, 0, 70), (2, 1, 0, 90),
+        # The only assignment missing
+        (5, 0, 0, None),
+    ]
+    # Student 3 has attendance but nothing due yet
+    attendance = [(1, 10, 2), (3, 4, 4)]
+    scored = score_chunk(work, attendance)
+
+    assert scored['student_id'].tolist() == [1, 2, 3, 5]
+    assert scored['assignments_due'].tolist() == [4, 2, 0, 1]
+    assert scored['missing'].tolist() == [1, 0, 0, 1]
+    assert scored['late'].tolist() == [1, 0, 0, 0]
+    assert scored['grade_trend'].tolist() == pytest.approx([-10, 20, nan, nan], nan_ok=True)
+    assert scored['absence_rate'].tolist() == pytest.approx([0.2, nan, 1.0, nan], nan_ok=True)
+    # Student 1: missing 1/4, late 1/3, trend -10/5 clipped to 1 and absence
+    # 0.2, all weighted; the others only average the signals they have
+    assert scored['score'].tolist() == pytest.approx(
+        [0.25 * 0.4 + 1 / 3 * 0.15 + 1.0 * 0.2 + 0.2 * 0.25, 0.0, 1.0, 1.0])
+    assert scored['level'].tolist() == ['medium', 'low', 'high', 'high']
+
+
+@pytest.mark.parametrize('absences, level', [(24, 'low'), (25, 'medium'), (49, 'medium'), (50, 'high')])
+def test_score_chunk_level_thresholds(absences, level):
+    # Absence is the only signal with data, so it is the score
+    scored = score_chunk([], [(1, 100, absences)])
+    assert scored['score'].tolist() == [absences / 100]
+    assert scored['level'].tolist() == [level]
+
+
+def test_score_chunk_empty():
+    scored = score_chunk([])
+    assert scored['student_id'].size == 0
+    assert scored['score'].size == 0
+
+
+START = datetime(2026, 1, 1)
+
+
+def day(days):
+    return START + timedelta(days=days)
+
+
+@pytest.fixture
+def url(tmp_path):
+    from database import db
+    import models  # noqa: F401  (registers the tables)
+
+    url = f'sqlite:///{tmp_path / "risk.db"}'
+    engine = create_engine(url)
+    db.metadata.create_all(engine)
+    tables = db.metadata.tables
+    with engine.begin() as conn:
+        conn.execute(tables['school'].insert(), [{'id': 1, 'slug': 'default', 'name': 'Default school'}])
+        conn.execute(tables['user'].insert(), [
+            {'id': user_id, 'username': f'u{user_id}', 'email': f'u{user_id}@example.com',
+             'role': 'teacher' if user_id == 1 else 'student', 'school_id': 1}
+            for user_id in range(1, 7)])
+        conn.execute(tables['class'].insert(), [{'id': 1, 'name': 'Algebra', 'teacher_id': 1, 'school_id': 1}])
+        conn.execute(tables['class_students'].insert(), [
+            {'class_id': 1, 'student_id': student_id, 'school_id': 1, 'created_at': START}
+            for student_id in (2, 3, 4, 5)])
+        conn.execute(tables['assignment'].insert(), [
+            {'id': 1, 'title': 'Quiz 1', 'class_id': 1, 'school_id': 1, 'due_date': day(1),
+             'created_at': START, 'updated_at': START},
+            {'id': 2, 'title': 'Quiz 2', 'class_id': 1, 'school_id': 1, 'due_date': day(10),
+             'created_at': START, 'updated_at': START},
+        ])
+        conn.execute(tables['submission'].insert(), [
+            {'id': 1, 'assignment_id': 1, 'student_id': 3, 'school_id': 1, 'submitted_at': day(0.5)},
+        ])
+    engine.dispose()
+    return url
+
+
+def scored_at(url):
+    """When each student in ``student_risk`` was last scored."""
+    engine = create_engine(url)
+    try:
+        with engine.connect() as conn:
+            rows = conn.execute(text("SELECT student_id, scored_at FROM student_risk")).all()
+    finally:
+        engine.dispose()
+    return {student_id: datetime.fromisoformat(str(value)) for student_id, value in rows}
+
+
+def execute(url, sql, params=None):
+    engine = create_engine(url)
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(sql), params or {})
+    finally:
+        engine.dispose()
+
+
+def test_incremental_run_rescores_only_changed_students(url):
+    assert at_risk.run(url, ORM_SCHEMA, workers=1, now=day(2)) == 4
+    assert scored_at(url) == {2: day(2), 3: day(2), 4: day(2), 5: day(2)}
+
+    # Nothing changed since the last run
+    assert at_risk.run(url, ORM_SCHEMA, workers=1, now=day(3)) == 0
+
+    # Student 2 hands in late, student 3's submission is graded, student 5 is
+    # marked absent and student 6 joins the class; student 4 is untouched
+    execute(url, """INSERT INTO submission (id, assignment_id, student_id, school_id, submitted_at)
+                    VALUES (2, 1, 2, 1, :at)""", {'at': day(3.5)})
+    execute(url, "INSERT INTO grade (submission_id, score, created_at) VALUES (1, 75, :at)", {'at': day(3.5)})
+    execute(url, """INSERT INTO attendance (class_id, student_id, date, status)
+                    VALUES (1, 5, :date, 'absent')""", {'date': date(2026, 1, 4)})
+    execute(url, """INSERT INTO class_students (class_id, student_id, school_id, created_at)
+                    VALUES (1, 6, 1, :at)""", {'at': day(3.5)})
+
+    assert at_risk.run(url, ORM_SCHEMA, workers=1, now=day(4)) == 4
+    assert scored_at(url) == {2: day(4), 3: day(4), 4: day(2), 5: day(4), 6: day(4)}
+
+
+def test_assignment_falling_due_rescores_its_class(url):
+    at_risk.run(url, ORM_SCHEMA, workers=1, now=day(2))
+    at_risk.run(url, ORM_SCHEMA, workers=1, now=day(9))
+    assert set(scored_at(url).values()) == {day(2)}
+
+    # Quiz 2 fell due between the runs
+    assert at_risk.run(url, ORM_SCHEMA, workers=1, now=day(11)) == 4
+    assert set(scored_at(url).values()) == {day(11)}
+
+
+def test_full_run_rescores_everyone(url):
+    at_risk.run(url, ORM_SCHEMA, workers=1, now=day(2))
+    assert at_risk.run(url, ORM_SCHEMA, workers=1, full=True, now=day(3)) == 4
+    assert set(scored_at(url).values()) == {day(3)}
@@ -0,0 +1,224 @@
+"""Deadline reminders: the timing wheel, and the scheduler against SQLite.
+
+The scheduler runs against ``models.py``'s tables in an in-memory SQLite
+database, with its clock (``utcnow`` and ``time.time``) under the test's
+control.
+"""
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+import reminders
+from reminders import ReminderScheduler, TimerWheel, _epoch
+
+TICK = 60
+START = datetime(2026, 3, 2, 9, 0)
+
+
+def fire_ticks(wheel, until):
+    """Advance ``wheel`` one tick at a time; returns the tick each timer fired at."""
+    fired = {}
+    for tick in range(wheel.current + 1, until + 1):
+        for timer in wheel.advance(tick * TICK):
+            assert timer not in fired
+            fired[timer] = tick
+    return fired
+
+
+@pytest.mark.parametrize('start', [0, 3, 15])
+def test_timers_fire_on_their_tick_across_levels_and_overflow(start):
+    # Level 0 spans 4 ticks and level 1 16, so most of these cross a level
+    # boundary or wait in the overflow heap first
+    wheel = TimerWheel(start * TICK, tick=TICK, bits=2, levels=2)
+    expiries = {timer: start + delay for timer, delay in enumerate([1, 3, 4, 5, 12, 15, 16, 17, 40, 100])}
+    for timer, tick in expiries.items():
+        wheel.add(tick * TICK, timer)
+    assert len(wheel) == len(expiries)
+
+    assert fire_ticks(wheel, start + 120) == expiries
+    assert len(wheel) == 0
+
+
+def test_timers_round_up_to_the_next_tick():
+    wheel = TimerWheel(0, tick=TICK, bits=2, levels=2)
+    wheel.add(TICK + 1, 1)
+    wheel.add(2 * TICK, 2)
+    assert list(wheel.advance(2 * TICK - 1)) == []
+    assert sorted(wheel.advance(2 * TICK)) == [1, 2]
+
+
+def test_advance_jumps_ahead():
+    wheel = TimerWheel(0, tick=TICK, bits=2, levels=2)
+    for timer, tick in enumerate([2, 9, 30, 70]):
+        wheel.add(tick * TICK, timer)
+    # One call across several wheel turns fires everything on the way
+    assert sorted(wheel.advance(50 * TICK)) == [0, 1, 2]
+    assert wheel.current == 50
+    assert list(wheel.advance(70 * TICK)) == [3]
+
+    # An empty wheel jumps straight to the target, and later timers are
+    # placed relative to it
+    wheel.advance(10 ** 6 * TICK)
+    assert wheel.current == 10 ** 6
+    wheel.add((10 ** 6 + 5) * TICK, 9)
+    assert fire_ticks(wheel, 10 ** 6 + 10) == {9: 10 ** 6 + 5}
+
+
+def test_timers_already_due_fire_on_the_next_advance():
+    wheel = TimerWheel(10 * TICK, tick=TICK, bits=2, levels=2)
+    wheel.add(3 * TICK, 1)
+    assert len(wheel) == 1
+    assert list(wheel.advance(10 * TICK)) == [1]
+    assert len(wheel) == 0
+
+
+@pytest.fixture
+def engine():
+    from database import db
+    import models  # noqa: F401  (registers the tables)
+
+    engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO school (id, slug, name) VALUES (1, 'default', 'Default school')"))
+        for user_id, role in [(1, 'teacher'), (2, 'student'), (3, 'student'), (4, 'student')]:
+            conn.execute(text("""
+                INSERT INTO user (id, username, email, role, school_id)
+                VALUES (:id, 'u' || :id, 'u' || :id || '@example.com', :role, 1)
+            """), {'id': user_id, 'role': role})
+        conn.execute(text("INSERT INTO class (id, name, teacher_id, school_id) VALUES (1, 'Algebra', 1, 1)"))
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=START)
+    monkeypatch.setattr(reminders, 'utcnow', lambda: clock.now)
+    monkeypatch.setattr(reminders, 'time', SimpleNamespace(time=lambda: _epoch(clock.now)))
+    return clock
+
+
+def add_assignment(engine, assignment_id, due_date, updated_at):
+    """An assignment students 2 and 3 still owe and student 4 has handed in."""
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO assignment (id, title, class_id, school_id, due_date, created_at, updated_at)
+            VALUES (:id, 'Quiz ' || :id, 1, 1, :due_date, :updated_at, :updated_at)
+        """), {'id': assignment_id, 'due_date': due_date, 'updated_at': updated_at})
+        for student_id, status in [(2, 'pending'), (3, 'pending'), (4, 'submitted')]:
+            conn.execute(text("""
+                INSERT INTO assignment_inbox (student_id, assignment_id, class_id, due_date, status)
+                VALUES (:student_id, :assignment_id, 1, :due_date, :status)
+            """), {'student_id': student_id, 'assignment_id': assignment_id, 'due_date': due_date,
+                   'status': status})
+
+
+def move_due_date(engine, assignment_id, due_date, updated_at):
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE assignment SET due_date = :due_date, updated_at = :updated_at WHERE id = :id"),
+                     {'id': assignment_id, 'due_date': due_date, 'updated_at': updated_at})
+        conn.execute(text("UPDATE assignment_inbox SET due_date = :due_date WHERE assignment_id = :id"),
+                     {'id': assignment_id, 'due_date': due_date})
+
+
+def run_until(scheduler, clock, until, step=timedelta(minutes=10)):
+    """What ``ReminderScheduler.run`` does, with the clock moving ``step`` a loop."""
+    sent = 0
+    while clock.now < until:
+        clock.now = min(clock.now + step, until)
+        scheduler.poll()
+        sent += scheduler.fire(scheduler.wheel.advance(_epoch(clock.now)))
+    return sent
+
+
+def notifications(engine):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT user_id, message FROM notification ORDER BY id")).all()
+
+
+def logged(engine):
+    with engine.connect() as conn:
+        return conn.execute(text(
+            "SELECT assignment_id, offset_minutes, recipients FROM reminder_log ORDER BY sent_at, offset_minutes"
+        )).all()
+
+
+def test_sends_each_reminder_once_to_pending_students(engine, clock):
+    add_assignment(engine, 1, START + timedelta(hours=30), START - timedelta(days=1))
+    scheduler = ReminderScheduler(engine, tick=TICK)
+    scheduler.load()
+    assert len(scheduler.wheel) == 2
+
+    assert run_until(scheduler, clock, START + timedelta(hours=31)) == 4
+    assert logged(engine) == [(1, 24 * 60, 2), (1, 60, 2)]
+    assert {user_id for user_id, _ in notifications(engine)} == {2, 3}
+    assert len(scheduler.wheel) == 0
+
+
+def test_repeated_polls_add_no_duplicate_timers(engine, clock):
+    scheduler = ReminderScheduler(engine, tick=TICK)
+    scheduler.load()
+    add_assignment(engine, 1, START + timedelta(hours=30), START)
+
+    assert scheduler.poll() == 1
+    assert len(scheduler.wheel) == 2
+    # The row stays inside the poll overlap for a while and is read again
+    for minutes in (0, 1, 2):
+        clock.now = START + timedelta(minutes=minutes)
+        assert scheduler.poll() == 0
+    assert len(scheduler.wheel) == 2
+
+    assert run_until(scheduler, clock, START + timedelta(hours=31)) == 4
+    assert len(logged(engine)) == 2
+
+
+def test_moved_due_date_reminds_for_the_new_date_only(engine, clock):
+    add_assignment(engine, 1, START + timedelta(hours=30), START - timedelta(days=1))
+    scheduler = ReminderScheduler(engine, tick=TICK)
+    scheduler.load()
+
+    clock.now = START + timedelta(hours=1)
+    new_due = START + timedelta(hours=50)
+    move_due_date(engine, 1, new_due, clock.now)
+    assert scheduler.poll() == 1
+    assert len(scheduler.wheel) == 4
+
+    # The old timers come round first and send nothing
+    assert run_until(scheduler, clock, START + timedelta(hours=30)) == 2
+    assert run_until(scheduler, clock, new_due) == 2
+    assert len(scheduler.wheel) == 0
+    assert logged(engine) == [(1, 24 * 60, 2), (1, 60, 2)]
+    with engine.connect() as conn:
+        assert set(conn.execute(text("SELECT due_date FROM reminder_log")).scalars()) == {str(new_due)}
+    assert all(f'{new_due:%Y-%m-%d %H:%M}' in message for _, message in notifications(engine))
+
+
+def test_restart_skips_logged_reminders(engine, clock):
+    due = START + timedelta(hours=30)
+    add_assignment(engine, 1, due, START - timedelta(days=1))
+    scheduler = ReminderScheduler(engine, tick=TICK)
+    scheduler.load()
+    assert run_until(scheduler, clock, START + timedelta(hours=7)) == 2
+
+    restarted = ReminderScheduler(engine, tick=TICK)
+    restarted.load()
+    # Only the 1-hour reminder is still to come
+    assert len(restarted.wheel) == 1
+    assert run_until(restarted, clock, due) == 2
+    assert logged(engine) == [(1, 24 * 60, 2), (1, 60, 2)]
+    assert len(notifications(engine)) == 4
+
+
+def test_restart_after_downtime_sends_only_the_latest_missed_reminder(engine, clock):
+    due = START + timedelta(hours=30)
+    add_assignment(engine, 1, due, START - timedelta(days=1))
+
+    clock.now = due - timedelta(minutes=30)
+    scheduler = ReminderScheduler(engine, tick=TICK)
+    scheduler.load()
+    assert run_until(scheduler, clock, due) == 2
+    assert logged(engine) == [(1, 60, 2)]
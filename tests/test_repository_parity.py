@@ -0,0 +1,419 @@
+"""The shared repository queries give the same answers on all three schemas.
+
+The same schools, users, classes, enrollments, assignments and submissions
+are loaded into one in-memory SQLite database per schema: ``app.py``'s
+tables (a SQLite copy of its DDL, without the school partitions),
+``models.py``'s through SQLAlchemy and the dashboard's through Django.
+Every read use case then runs against each of them, unscoped and scoped to
+each school, and the results must match.
+"""
+from datetime import datetime, timezone
+from decimal import Decimal
+import re
+
+import django
+from django.conf import settings
+import pytest
+from sqlalchemy import create_engine, text
+
+from repository import (APP_SCHEMA, DJANGO_SCHEMA, ORM_SCHEMA, DbApiExecutor, Repository,
+                        SqlAlchemyExecutor)
+
+
+def at(day, hour=9, minute=0):
+    return datetime(2026, 1, day, hour, minute)
+
+
+SCHOOLS = [(1, 'default', 'Default school'), (2, 'north', 'North school')]
+# id, username, role, school
+USERS = [
+    (1, 'tina', 'teacher', 1),
+    (2, 'tom', 'teacher', 1),
+    (3, 'sam', 'student', 1),
+    (4, 'sue', 'student', 1),
+    (5, 'sid', 'student', 1),
+    (6, 'tess', 'teacher', 2),
+    (7, 'sol', 'student', 2),
+]
+# id, name, teacher, school, created_at
+CLASSES = [
+    (1, 'Algebra', 1, 1, at(1, 8)),
+    (2, 'Biology', 1, 1, at(1, 9)),
+    (3, 'Chemistry', 2, 1, at(1, 10)),
+    (4, 'Drama', 6, 2, at(1, 11)),
+]
+ENROLLMENTS = [(1, 3), (1, 4), (2, 3), (3, 4), (3, 5), (4, 7)]
+# id, class, title, due_date
+ASSIGNMENTS = [
+    (1, 1, 'Quiz 1', at(10)),
+    (2, 1, 'Quiz 2', at(20)),
+    (3, 2, 'Lab report', at(15)),
+    (4, 3, 'Titration', at(12)),
+    (5, 4, 'Monologue', at(14)),
+    (6, 3, 'Equilibrium', at(13)),
+]
+# id, assignment, student, submitted_at, grade
+SUBMISSIONS = [
+    (1, 1, 3, at(9), 80),
+    (2, 1, 4, at(11), None),
+    (3, 3, 3, at(14), 95),
+    (4, 4, 5, at(11), 70),
+    (5, 5, 7, at(13), 88),
+    (6, 4, 4, at(12, 8), None),
+]
+# student, score, level
+RISK = [(3, 0.9, 'high'), (4, 0.6, 'medium'), (5, 0.2, 'low'), (7, 0.8, 'high')]
+
+SCHOOL_OF_CLASS = {class_id: school for class_id, _, _, school, _ in CLASSES}
+CLASS_OF_ASSIGNMENT = {assignment_id: class_id for assignment_id, class_id, _, _ in ASSIGNMENTS}
+ENROLLED_AT = at(3)
+SCORED_AT = at(5)
+
+
+def updated_at(assignment_id):
+    return at(2, 8, assignment_id)
+
+
+# app.py's init_db for SQLite: plain tables instead of partitioned ones
+APP_DDL = [
+    """CREATE TABLE schools (
+        id INTEGER PRIMARY KEY,
+        slug VARCHAR(50) UNIQUE NOT NULL,
+        name VARCHAR(100) NOT NULL
+    )""",
+    """CREATE TABLE users (
+        id INTEGER PRIMARY KEY,
+        username VARCHAR(64) UNIQUE NOT NULL,
+        email VARCHAR(120) UNIQUE NOT NULL,
+        password_hash VARCHAR(256) NOT NULL,
+        role VARCHAR(20) NOT NULL,
+        school_id INTEGER NOT NULL DEFAULT 1 REFERENCES schools(id)
+    )""",
+    """CREATE TABLE classes (
+        id INTEGER PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        description TEXT,
+        teacher_id INTEGER REFERENCES users(id),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        school_id INTEGER NOT NULL DEFAULT 1 REFERENCES schools(id)
+    )""",
+    """CREATE TABLE class_students (
+        id INTEGER PRIMARY KEY,
+        school_id INTEGER NOT NULL REFERENCES schools(id),
+        class_id INTEGER REFERENCES classes(id),
+        student_id INTEGER REFERENCES users(id),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (school_id, class_id, student_id)
+    )""",
+    """CREATE TABLE schedules (
+        id INTEGER PRIMARY KEY,
+        class_id INTEGER REFERENCES classes(id),
+        day_of_week VARCHAR(10) NOT NULL,
+        start_time TIME NOT NULL,
+        end_time TIME NOT NULL,
+        room VARCHAR(50),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE assignments (
+        id INTEGER PRIMARY KEY,
+        school_id INTEGER NOT NULL REFERENCES schools(id),
+        class_id INTEGER REFERENCES classes(id),
+        title VARCHAR(200) NOT NULL,
+        description TEXT,
+        due_date TIMESTAMP NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE student_assignments (
+        id INTEGER PRIMARY KEY,
+        school_id INTEGER NOT NULL REFERENCES schools(id),
+        assignment_id INTEGER,
+        student_id INTEGER REFERENCES users(id),
+        submission_text TEXT,
+        submitted_at TIMESTAMP,
+        grade NUMERIC,
+        feedback TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (school_id, assignment_id, student_id)
+    )""",
+]
+
+
+def insert_risk(conn, repo):
+    for statement in repo.risk_table_statements():
+        conn.execute(text(statement))
+    for student_id, score, level in RISK:
+        conn.execute(text("""
+            INSERT INTO student_risk (student_id, score, level, assignments_due, missing, late, scored_at)
+            VALUES (:student_id, :score, :level, 2, 1, 0, :scored_at)
+        """), {'student_id': student_id, 'score': score, 'level': level, 'scored_at': SCORED_AT})
+    conn.execute(text("INSERT INTO risk_job_runs VALUES (:at, :at, 'full', 4)"), {'at': SCORED_AT})
+
+
+def load_app(conn):
+    repo = Repository(SqlAlchemyExecutor(conn), APP_SCHEMA)
+    for statement in APP_DDL + repo.index_statements():
+        conn.execute(text(statement))
+    for school in SCHOOLS:
+        conn.execute(text("INSERT INTO schools VALUES (:0, :1, :2)"), dict(zip('012', school)))
+    for user_id, username, role, school_id in USERS:
+        conn.execute(text("""
+            INSERT INTO users (id, username, email, password_hash, role, school_id)
+            VALUES (:id, :username, :username || '@example.com', '', :role, :school_id)
+        """), {'id': user_id, 'username': username, 'role': role, 'school_id': school_id})
+    for class_id, name, teacher_id, school_id, created_at in CLASSES:
+        conn.execute(text("""
+            INSERT INTO classes (id, name, teacher_id, school_id, created_at, updated_at)
+            VALUES (:id, :name, :teacher_id, :school_id, :created_at, :created_at)
+        """), {'id': class_id, 'name': name, 'teacher_id': teacher_id, 'school_id': school_id,
+               'created_at': created_at})
+    for class_id, student_id in ENROLLMENTS:
+        conn.execute(text("""
+            INSERT INTO class_students (school_id, class_id, student_id, created_at)
+            VALUES (:school_id, :class_id, :student_id, :created_at)
+        """), {'school_id': SCHOOL_OF_CLASS[class_id], 'class_id': class_id, 'student_id': student_id,
+               'created_at': ENROLLED_AT})
+    for assignment_id, class_id, title, due_date in ASSIGNMENTS:
+        conn.execute(text("""
+            INSERT INTO assignments (id, school_id, class_id, title, due_date, created_at, updated_at)
+            VALUES (:id, :school_id, :class_id, :title, :due_date, :updated_at, :updated_at)
+        """), {'id': assignment_id, 'school_id': SCHOOL_OF_CLASS[class_id], 'class_id': class_id,
+               'title': title, 'due_date': due_date, 'updated_at': updated_at(assignment_id)})
+    for submission_id, assignment_id, student_id, submitted_at, grade in SUBMISSIONS:
+        conn.execute(text("""
+            INSERT INTO student_assignments (id, school_id, assignment_id, student_id, submission_text,
+                                             submitted_at, grade)
+            VALUES (:id, :school_id, :assignment_id, :student_id, 'done', :submitted_at, :grade)
+        """), {'id': submission_id, 'school_id': SCHOOL_OF_CLASS[CLASS_OF_ASSIGNMENT[assignment_id]],
+               'assignment_id': assignment_id, 'student_id': student_id, 'submitted_at': submitted_at,
+               'grade': grade})
+    insert_risk(conn, repo)
+    return repo
+
+
+def load_orm(conn):
+    from database import db
+    import models  # noqa: F401  (registers the tables)
+
+    db.metadata.create_all(conn)
+    tables = db.metadata.tables
+    repo = Repository(SqlAlchemyExecutor(conn), ORM_SCHEMA)
+    for statement in repo.index_statements():
+        conn.execute(text(statement))
+    conn.execute(tables['school'].insert(), [{'id': id, 'slug': slug, 'name': name}
+                                             for id, slug, name in SCHOOLS])
+    conn.execute(tables['user'].insert(), [
+        {'id': user_id, 'username': username, 'email': f'{username}@example.com', 'password_hash': '',
+         'role': role, 'school_id': school_id}
+        for user_id, username, role, school_id in USERS])
+    conn.execute(tables['class'].insert(), [
+        {'id': class_id, 'name': name, 'teacher_id': teacher_id, 'school_id': school_id,
+         'created_at': created_at, 'updated_at': created_at}
+        for class_id, name, teacher_id, school_id, created_at in CLASSES])
+    conn.execute(tables['class_students'].insert(), [
+        {'class_id': class_id, 'student_id': student_id, 'school_id': SCHOOL_OF_CLASS[class_id],
+         'created_at': ENROLLED_AT}
+        for class_id, student_id in ENROLLMENTS])
+    conn.execute(tables['assignment'].insert(), [
+        {'id': assignment_id, 'class_id': class_id, 'school_id': SCHOOL_OF_CLASS[class_id], 'title': title,
+         'due_date': due_date, 'created_at': updated_at(assignment_id), 'updated_at': updated_at(assignment_id)}
+        for assignment_id, class_id, title, due_date in ASSIGNMENTS])
+    conn.execute(tables['submission'].insert(), [
+        {'id': submission_id, 'assignment_id': assignment_id, 'student_id': student_id,
+         'school_id': SCHOOL_OF_CLASS[CLASS_OF_ASSIGNMENT[assignment_id]], 'submitted_at': submitted_at}
+        for submission_id, assignment_id, student_id, submitted_at, _ in SUBMISSIONS])
+    conn.execute(tables['grade'].insert(), [
+        {'submission_id': submission_id, 'score': grade, 'created_at': submitted_at}
+        for submission_id, _, _, submitted_at, grade in SUBMISSIONS if grade is not None])
+    insert_risk(conn, repo)
+    repo.refresh_inbox()
+    return repo
+
+
+def load_django():
+    if not settings.configured:
+        settings.configure(
+            INSTALLED_APPS=['django.contrib.auth', 'django.contrib.contenttypes', 'dashboard'],
+            DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+            DEFAULT_AUTO_FIELD='django.db.models.BigAutoField',
+            USE_TZ=True,
+            PRODUCTION=False,
+        )
+        django.setup()
+    from django.contrib.auth.models import Group, User
+    from django.core.management import call_command
+    from django.db import connection
+    from dashboard.models import Assignment, Class, Membership, School, Submission
+
+    def aware(value):
+        return value.replace(tzinfo=timezone.utc)
+
+    call_command('migrate', run_syncdb=True, verbosity=0)
+    for school_id, slug, name in SCHOOLS:
+        School.objects.update_or_create(pk=school_id, defaults={'slug': slug, 'name': name})
+    students = Group.objects.create(name='Student')
+    for user_id, username, role, school_id in USERS:
+        user = User.objects.create(id=user_id, username=username, email=f'{username}@example.com')
+        if role == 'student':
+            user.groups.add(students)
+        # Users without a membership belong to the default school
+        if school_id != 1:
+            Membership.objects.create(user=user, school_id=school_id)
+    for class_id, name, teacher_id, school_id, _ in CLASSES:
+        Class.objects.create(id=class_id, name=name, teacher_id=teacher_id, school_id=school_id)
+    for class_id, student_id in ENROLLMENTS:
+        Class.objects.get(pk=class_id).students.add(student_id)
+    for assignment_id, class_id, title, due_date in ASSIGNMENTS:
+        Assignment.objects.create(id=assignment_id, class_obj_id=class_id, title=title,
+                                  due_date=aware(due_date), status='published')
+    for submission_id, assignment_id, student_id, _, grade in SUBMISSIONS:
+        Submission.objects.create(id=submission_id, assignment_id=assignment_id, student_id=student_id,
+                                  content='done', grade=grade)
+    # auto_now fields: update() writes the fixture's times as they are
+    for class_id, _, _, _, created_at in CLASSES:
+        Class.objects.filter(pk=class_id).update(created_at=aware(created_at), updated_at=aware(created_at))
+    for assignment_id, *_ in ASSIGNMENTS:
+        stamp = aware(updated_at(assignment_id))
+        Assignment.objects.filter(pk=assignment_id).update(created_at=stamp, updated_at=stamp)
+    for submission_id, _, _, submitted_at, _ in SUBMISSIONS:
+        Submission.objects.filter(pk=submission_id).update(submitted_at=aware(submitted_at),
+                                                           updated_at=aware(submitted_at))
+    repo = Repository(DbApiExecutor(connection), DJANGO_SCHEMA)
+    repo.refresh_inbox()
+    return repo
+
+
+@pytest.fixture(scope='module')
+def repositories():
+    engines = [create_engine('sqlite://'), create_engine('sqlite://')]
+    connections = [engine.connect() for engine in engines]
+    try:
+        yield {
+            'app': load_app(connections[0]),
+            'orm': load_orm(connections[1]),
+            'django': load_django(),
+        }
+    finally:
+        for conn, engine in zip(connections, engines):
+            conn.close()
+            engine.dispose()
+
+
+def scoped(repo, school_id):
+    return Repository(repo.executor, repo.schema, school_id=school_id)
+
+
+_TIMESTAMP = re.compile(r'\d{4}-\d\d-\d\d[ T]\d\d:\d\d')
+
+
+def normalize(value):
+    """Drop what differs by driver alone: text vs datetime timestamps,
+    integer vs float vs decimal numbers, lists vs tuples."""
+    if isinstance(value, dict):
+        return {key: normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize(item) for item in value]
+    if isinstance(value, str) and _TIMESTAMP.match(value):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None, microsecond=0)
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return round(float(value), 6)
+    return value
+
+
+def project(rows, *keys):
+    return [{key: row[key] for key in keys} for row in rows]
+
+
+def assert_same(results):
+    """``results`` maps schema name to the result of the same call."""
+    normalized = {name: normalize(result) for name, result in results.items()}
+    first = next(iter(normalized))
+    for name, result in normalized.items():
+        assert result == normalized[first], f'{name} differs from {first}'
+
+
+def each(repositories, call, names=('app', 'orm', 'django')):
+    """``call(repo)`` on the named schemas: unscoped, then per school."""
+    for school_id in (None, *(school[0] for school in SCHOOLS)):
+        assert_same({name: call(scoped(repositories[name], school_id)) for name in names})
+
+
+USER_ROLES = [(user_id, role) for user_id, _, role, _ in USERS]
+CLASS_IDS = [class_id for class_id, *_ in CLASSES]
+
+
+@pytest.mark.parametrize('user_id,role', USER_ROLES)
+def test_data_version(repositories, user_id, role):
+    # The first seven parts are common; the rest depend on the schema's tables
+    each(repositories, lambda repo: repo.data_version(user_id)[0][:7])
+
+
+@pytest.mark.parametrize('user_id,role', USER_ROLES)
+def test_classes_for_user(repositories, user_id, role):
+    each(repositories, lambda repo: project(repo.classes_for_user(user_id, role),
+                                            'id', 'name', 'teacher_id', 'teacher_name', 'student_count'))
+
+
+@pytest.mark.parametrize('limit', [None, 2])
+@pytest.mark.parametrize('user_id,role', USER_ROLES)
+def test_assignments_for_user(repositories, user_id, role, limit):
+    each(repositories, lambda repo: project(repo.assignments_for_user(user_id, role, limit=limit),
+                                            'id', 'title', 'class_name', 'due_date'))
+
+
+@pytest.mark.parametrize('class_id', CLASS_IDS)
+def test_grade_versions(repositories, class_id):
+    each(repositories, lambda repo: sorted(repo.grade_versions(class_id).items()))
+
+
+@pytest.mark.parametrize('class_id', CLASS_IDS)
+def test_grade_columns(repositories, class_id):
+    each(repositories, lambda repo: sorted(zip(*repo.grade_columns(class_id))))
+
+
+@pytest.mark.parametrize('class_id', CLASS_IDS)
+def test_enrolled_student_ids(repositories, class_id):
+    each(repositories, lambda repo: sorted(repo.enrolled_student_ids(class_id)))
+
+
+@pytest.mark.parametrize('user_id', [user_id for user_id, role in USER_ROLES if role == 'teacher'])
+def test_teacher_stats(repositories, user_id):
+    each(repositories, lambda repo: repo.teacher_stats(user_id))
+
+
+@pytest.mark.parametrize('user_id', [user_id for user_id, role in USER_ROLES if role == 'student'])
+def test_student_stats(repositories, user_id):
+    each(repositories, lambda repo: repo.student_stats(user_id))
+
+
+def test_student_directory(repositories):
+    each(repositories, lambda repo: sorted(repo.student_directory(), key=lambda row: row['id']))
+    each(repositories, lambda repo: repo.student_directory_version())
+
+
+@pytest.mark.parametrize('user_id', [user_id for user_id, role in USER_ROLES if role == 'teacher'])
+def test_at_risk_students(repositories, user_id):
+    # The dashboard schema has no risk scores
+    each(repositories, lambda repo: repo.at_risk_students(user_id), names=('app', 'orm'))
+
+
+@pytest.mark.parametrize('now', [at(11, 12), at(13, 12)])
+@pytest.mark.parametrize('user_id', [user_id for user_id, role in USER_ROLES if role == 'student'])
+def test_deadlines(repositories, user_id, now):
+    # Only the two schemas with an assignment inbox have deadline buckets
+    end_of_day, end_of_week = now.replace(hour=23, minute=59), at(now.day + 7)
+    each(repositories, lambda repo: repo.deadlines(user_id, now, end_of_day, end_of_week),
+         names=('orm', 'django'))
+    each(repositories, lambda repo: repo.overdue_count(user_id, now), names=('orm', 'django'))
+
+
+@pytest.mark.parametrize('user_id', [user_id for user_id, role in USER_ROLES if role == 'student'])
+def test_inbox_statuses(repositories, user_id):
+    each(repositories, lambda repo: repo.executor.rows(repo._sql(
+        "SELECT assignment_id, class_id, due_date, status FROM {inbox}"
+        " WHERE student_id = %(user_id)s ORDER BY assignment_id"), {'user_id': user_id}),
+        names=('orm', 'django'))
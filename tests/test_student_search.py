@@ -0,0 +1,143 @@
+"""Prefix search over the in-memory student directory.
+
+``StudentSearch`` is driven by a stand-in repository that counts its
+queries, with ``time.monotonic`` under the test's control.
+"""
+from types import SimpleNamespace
+
+import pytest
+
+import student_search
+from student_search import MAX_LIMIT, StudentDirectory, StudentSearch, search_students
+
+ROWS = [
+    {'id': 1, 'username': 'alice', 'email': 'alice@example.com'},
+    {'id': 2, 'username': 'Albert', 'email': 'bert@example.com'},
+    {'id': 3, 'username': 'bob', 'email': 'al.bob@example.com'},
+    {'id': 4, 'username': 'carol', 'email': ''},
+]
+
+
+def ids(found):
+    return [student['id'] for student in found]
+
+
+def test_search_by_username_or_email_prefix():
+    directory = StudentDirectory(ROWS, version=4)
+    assert len(directory) == 4
+    # Matches come in key order: "al.bob@...", "albert", "alice"
+    assert ids(directory.search('al')) == [3, 2, 1]
+    assert ids(directory.search('BERT')) == [2]
+    assert ids(directory.search('carol')) == [4]
+    assert directory.search('z') == []
+    assert directory.search('alice') == [{'id': 1, 'username': 'alice', 'email': 'alice@example.com'}]
+
+
+def test_search_lists_a_student_once():
+    # Both alice's username and email start with "alice"
+    assert ids(StudentDirectory(ROWS, version=4).search('alice')) == [1]
+
+
+def test_search_exclude_and_limit():
+    directory = StudentDirectory(ROWS, version=4)
+    assert ids(directory.search('al', exclude={3})) == [2, 1]
+    assert ids(directory.search('al', limit=2)) == [3, 2]
+    # Excluded and repeated students don't count towards the limit
+    assert ids(directory.search('al', limit=1, exclude={3, 2})) == [1]
+
+
+class Repo:
+    """The repository calls the directory makes, counted."""
+
+    def __init__(self, rows, school_id=None):
+        self.schema = SimpleNamespace(name='orm')
+        self.school_id = school_id
+        self.rows = list(rows)
+        self.enrolled = {}
+        self.loads = self.version_checks = 0
+
+    def student_directory(self):
+        self.loads += 1
+        return list(self.rows)
+
+    def student_directory_version(self):
+        self.version_checks += 1
+        return len(self.rows)
+
+    def enrolled_student_ids(self, class_id):
+        return self.enrolled.get(class_id, [])
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(student_search, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_directory_reuses_then_checks_the_version(clock):
+    index = StudentSearch(ttl=600, check_interval=5)
+    repo = Repo(ROWS)
+    directory = index.directory(repo)
+    assert (repo.loads, len(directory)) == (1, 4)
+
+    # Within the check interval nothing is queried
+    clock.now += 4
+    assert index.directory(repo) is directory
+    assert repo.version_checks == 1
+
+    # After it, a count query confirms the snapshot
+    clock.now += 2
+    assert index.directory(repo) is directory
+    assert (repo.loads, repo.version_checks) == (1, 2)
+
+
+def test_directory_reloads_when_the_version_changes(clock):
+    index = StudentSearch(ttl=600, check_interval=5)
+    repo = Repo(ROWS)
+    index.directory(repo)
+    repo.rows.append({'id': 5, 'username': 'alfred', 'email': 'fred@example.com'})
+
+    # Not noticed until the next check
+    assert ids(index.directory(repo).search('alf')) == []
+    clock.now += 6
+    directory = index.directory(repo)
+    assert repo.loads == 2
+    assert directory.version == 5
+    assert ids(directory.search('alf')) == [5]
+
+
+def test_directory_reloads_after_ttl(clock):
+    index = StudentSearch(ttl=600, check_interval=5)
+    repo = Repo(ROWS)
+    index.directory(repo)
+    # A rename leaves the count alone
+    repo.rows[0] = {'id': 1, 'username': 'alicia', 'email': 'alice@example.com'}
+    clock.now += 300
+    assert ids(index.directory(repo).search('alicia')) == []
+    clock.now += 300
+    assert ids(index.directory(repo).search('alicia')) == [1]
+    assert repo.loads == 2
+
+
+def test_directories_per_school(clock):
+    index = StudentSearch()
+    first, second = Repo(ROWS, school_id=1), Repo(ROWS[:1], school_id=2)
+    assert len(index.directory(first)) == 4
+    assert len(index.directory(second)) == 1
+    assert (first.loads, second.loads) == (1, 1)
+
+
+@pytest.mark.parametrize('limit, expected', [(0, 1), (-5, 1), (3, 3), (MAX_LIMIT + 100, MAX_LIMIT)])
+def test_search_students_clamps_limit(clock, limit, expected):
+    repo = Repo([{'id': n, 'username': f'student{n:03d}', 'email': ''} for n in range(MAX_LIMIT + 20)])
+    assert len(search_students(repo, 'student', limit=limit, index=StudentSearch())) == expected
+
+
+def test_search_students_leaves_out_the_class(clock):
+    repo = Repo(ROWS)
+    repo.enrolled[7] = [1, 3]
+    index = StudentSearch()
+    assert ids(search_students(repo, ' al ', class_id=7, index=index)) == [2]
+    assert ids(search_students(repo, 'al', index=index)) == [3, 2, 1]
+    assert search_students(repo, '   ', index=index) == []
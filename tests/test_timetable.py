@@ -0,0 +1,94 @@
+"""Upcoming sessions from the weekly timetable.
+
+Times are in the week of Monday 2026-10-19; New York is on EDT (UTC-4)
+that week.
+"""
+from datetime import datetime, time
+
+import pytest
+
+from app_queries import get_upcoming_sessions
+from timetable import Timetable, make_session
+
+
+def at(day, hour, minute=0):
+    """``day`` days after Monday 2026-10-19."""
+    return datetime(2026, 10, 19 + day, hour, minute)
+
+
+SESSIONS = [
+    make_session(1, 1, 'Monday', '09:00', '10:00', class_name='Algebra'),
+    make_session(2, 2, 'Monday', '09:30', '11:00', class_name='Biology'),
+    make_session(3, 1, 'Wednesday', '14:00', '15:00', class_name='Algebra'),
+    make_session(4, 3, 'Friday', '08:00', '09:00', class_name='Chemistry'),
+]
+
+
+def upcoming(now, **kwargs):
+    return [(starts_at, session.schedule_id)
+            for starts_at, session in Timetable(SESSIONS).next_sessions(now, **kwargs)]
+
+
+def test_sessions_in_start_order():
+    assert upcoming(at(0, 8)) == [
+        (at(0, 9), 1), (at(0, 9, 30), 2), (at(2, 14), 3), (at(4, 8), 4),
+        (at(7, 9), 1),
+    ]
+
+
+def test_wraps_into_next_week():
+    assert upcoming(at(4, 12)) == [(at(7, 9), 1), (at(7, 9, 30), 2), (at(9, 14), 3), (at(11, 8), 4)]
+    # Late on Sunday the next session is on Monday morning
+    assert upcoming(at(6, 23, 30), limit=1) == [(at(7, 9), 1)]
+
+
+def test_overlapping_sessions_both_in_progress():
+    assert upcoming(at(0, 9, 45), limit=3) == [(at(0, 9), 1), (at(0, 9, 30), 2), (at(2, 14), 3)]
+
+
+def test_running_session_until_its_end():
+    assert upcoming(at(0, 9), limit=1) == [(at(0, 9), 1)]
+    # Sessions are half-open: at 10:00 the first one is over
+    assert upcoming(at(0, 10), limit=1) == [(at(0, 9, 30), 2)]
+    assert upcoming(at(0, 11), limit=1) == [(at(2, 14), 3)]
+
+
+def test_filters_by_class():
+    assert upcoming(at(0, 8), class_ids=[1]) == [(at(0, 9), 1), (at(2, 14), 3), (at(7, 9), 1), (at(9, 14), 3)]
+    assert upcoming(at(4, 12), class_ids={3}) == [(at(11, 8), 4)]
+    assert upcoming(at(0, 8), class_ids=[]) == []
+
+
+def test_empty_timetable():
+    assert Timetable([]).next_sessions(at(0, 8)) == []
+
+
+def rows():
+    return [{'id': 1, 'class_id': 1, 'class_name': 'Algebra', 'day_of_week': 'Monday',
+             'start_time': time(9), 'end_time': time(10), 'room': 'B12'}]
+
+
+@pytest.mark.parametrize('zone, now, starts_at', [
+    # 13:30 UTC is 09:30 in New York: the class is running
+    ('America/New_York', at(0, 13, 30), at(0, 9)),
+    # ... but in UTC it finished at 10:00, so the next one is a week away
+    ('UTC', at(0, 13, 30), at(7, 9)),
+    # 07:30 UTC is 09:30 in Berlin (CEST)
+    ('Europe/Berlin', at(0, 7, 30), at(0, 9)),
+    # Unknown zones fall back to UTC
+    ('Nowhere/Special', at(0, 8, 50), at(0, 9)),
+])
+def test_upcoming_sessions_use_school_local_time(zone, now, starts_at):
+    [entry] = get_upcoming_sessions(rows(), now, zone, limit=1)
+    assert entry['start_time'] == starts_at
+    assert entry['end_time'] == starts_at.replace(hour=10)
+    assert entry['label'] == 'Monday 09:00-10:00'
+
+
+def test_upcoming_sessions_soon_is_local():
+    # 12:50 UTC is 08:50 in New York: starting within 15 minutes
+    [entry] = get_upcoming_sessions(rows(), at(0, 12, 50), 'America/New_York', limit=1)
+    assert (entry['start_time'], entry['status_color']) == (at(0, 9), 'success')
+    # 08:50 UTC is 04:50 there: later today
+    [entry] = get_upcoming_sessions(rows(), at(0, 8, 50), 'America/New_York', limit=1)
+    assert (entry['start_time'], entry['status_color']) == (at(0, 9), 'secondary')
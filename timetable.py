@@ -0,0 +1,198 @@
+"""Weekly timetable engine.
+
+Schedules are stored as ``(day_of_week, start_time, end_time)`` rows. Here they
+are mapped onto a single minutes-of-week axis so that a clash between two
+sessions is just an intersection of half-open intervals, which an interval
+tree answers in O(log n + k) per query.
+"""
+from collections import defaultdict, namedtuple
+from datetime import datetime, time, timedelta
+import bisect
+import logging
+
+logger = logging.getLogger(__name__)
+
+DAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+Session = namedtuple('Session', [
+    'schedule_id', 'class_id', 'class_name', 'teacher_id', 'room', 'start', 'end'
+])
+Conflict = namedtuple('Conflict', ['kind', 'resource', 'first', 'second'])
+
+
+def to_minutes(value):
+    """Return minutes since midnight for a ``time`` or an ``HH:MM`` string."""
+    if isinstance(value, str):
+        value = datetime.strptime(value.strip()[:5], '%H:%M').time()
+    return value.hour * 60 + value.minute
+
+
+def week_offset(day, value):
+    """Return the minute-of-week for ``value`` on the named ``day``."""
+    return DAYS.index(day) * MINUTES_PER_DAY + to_minutes(value)
+
+
+def make_session(schedule_id, class_id, day, start_time, end_time,
+                 class_name=None, teacher_id=None, room=None):
+    start = week_offset(day, start_time)
+    end = start + to_minutes(end_time) - to_minutes(start_time)
+    if end <= start:
+        raise ValueError('End time must be after start time')
+    return Session(schedule_id, class_id, class_name, teacher_id, room or None, start, end)
+
+
+def session_from_row(row):
+    """Build a ``Session`` from a ``schedules`` row joined with ``classes``."""
+    return make_session(row['id'], row['class_id'], row['day_of_week'],
+                        row['start_time'], row['end_time'],
+                        class_name=row.get('class_name'),
+                        teacher_id=row.get('teacher_id'),
+                        room=row.get('room'))
+
+
+def describe(session):
+    """Human readable ``Monday 09:00-10:00`` label for a session."""
+    day, start = divmod(session.start, MINUTES_PER_DAY)
+    end = start + session.end - session.start
+    return f"{DAYS[day]} {start // 60:02d}:{start % 60:02d}-{end // 60:02d}:{end % 60:02d}"
+
+
+class IntervalTree:
+    """Static interval tree over half-open ``[start, end)`` intervals.
+
+    The intervals are kept sorted by start and treated as an implicit balanced
+    binary search tree (the middle element of every slice is its root); each
+    root also records the largest end in its slice so whole subtrees that
+    finish before the query window can be skipped.
+    """
+
+    def __init__(self, sessions):
+        self._items = sorted(sessions, key=lambda s: (s.start, s.end))
+        self._max_end = [0] * len(self._items)
+        self._build(0, len(self._items))
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def _build(self, lo, hi):
+        if lo >= hi:
+            return 0
+        mid = (lo + hi) // 2
+        self._max_end[mid] = max(self._items[mid].end,
+                                 self._build(lo, mid),
+                                 self._build(mid + 1, hi))
+        return self._max_end[mid]
+
+    def overlapping(self, start, end):
+        """Return every session intersecting ``[start, end)``."""
+        found = []
+        stack = [(0, len(self._items))]
+        while stack:
+            lo, hi = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            if self._max_end[mid] <= start:
+                continue
+            stack.append((lo, mid))
+            item = self._items[mid]
+            if item.start < end:
+                if item.end > start:
+                    found.append(item)
+                stack.append((mid + 1, hi))
+        return found
+
+
+class Timetable:
+    """A school's weekly sessions indexed per teacher, room and student."""
+
+    def __init__(self, sessions, enrollments=None):
+        self.sessions = list(sessions)
+        self.enrollments = enrollments or {}
+        self._by_start = sorted(self.sessions, key=lambda s: s.start)
+        self._starts = [s.start for s in self._by_start]
+        self._trees = None
+
+    @classmethod
+    def from_rows(cls, schedule_rows, enrollment_rows=()):
+        enrollments = defaultdict(set)
+        for row in enrollment_rows:
+            enrollments[row['class_id']].add(row['student_id'])
+        return cls((session_from_row(row) for row in schedule_rows), enrollments)
+
+    def _resources(self, session):
+        if session.teacher_id is not None:
+            yield ('teacher', session.teacher_id)
+        if session.room:
+            yield ('room', session.room)
+        for student_id in self.enrollments.get(session.class_id, ()):
+            yield ('student', student_id)
+
+    @property
+    def trees(self):
+        if self._trees is None:
+            grouped = defaultdict(list)
+            for session in self.sessions:
+                for resource in self._resources(session):
+                    grouped[resource].append(session)
+            self._trees = {key: IntervalTree(items) for key, items in grouped.items()}
+        return self._trees
+
+    def conflicts(self, candidate):
+        """Return conflicts ``candidate`` would introduce into the timetable."""
+        found = []
+        for kind, resource in self._resources(candidate):
+            tree = self.trees.get((kind, resource))
+            if tree is None:
+                continue
+            for other in tree.overlapping(candidate.start, candidate.end):
+                if other.schedule_id != candidate.schedule_id:
+                    found.append(Conflict(kind, resource, candidate, other))
+        return found
+
+    def all_conflicts(self):
+        """Return every clashing pair of sessions, once per shared resource."""
+        found = []
+        for (kind, resource), tree in self.trees.items():
+            if len(tree) < 2:
+                continue
+            for session in tree:
+                for other in tree.overlapping(session.start, session.end):
+                    if (other.schedule_id, other.class_id) > (session.schedule_id, session.class_id):
+                        found.append(Conflict(kind, resource, session, other))
+        return found
+
+    def next_sessions(self, now=None, class_ids=None, limit=5):
+        """Return ``(starts_at, session)`` pairs for the next sessions after ``now``.
+
+        Sessions already running at ``now`` are included so the dashboard can
+        show them as in progress.
+        """
+        if not self._by_start:
+            return []
+        now = now or datetime.now()
+        week_start = datetime.combine(now.date() - timedelta(days=now.weekday()), time())
+        current = int((now - week_start).total_seconds() // 60)
+        wanted = set(class_ids) if class_ids is not None else None
+
+        upcoming = []
+        index = bisect.bisect_left(self._starts, current - MINUTES_PER_DAY)
+        total = len(self._by_start)
+        for step in range(2 * total):
+            session = self._by_start[(index + step) % total]
+            week = (index + step) // total
+            if week > 1:
+                break
+            if wanted is not None and session.class_id not in wanted:
+                continue
+            if week == 0 and session.end <= current:
+                continue
+            upcoming.append((week_start + timedelta(weeks=week, minutes=session.start), session))
+            if len(upcoming) >= limit:
+                break
+        return upcoming